@@ -3,53 +3,52 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.db.database import get_db
-from app.db.models import Cuisine, DietaryPreference, User
+from app.db.models import User
+from app.db.queries import add_user_preferences
 from app.schemas.auth import Token, UserLogin, UserRegistration
-from app.utils.security import create_access_token, get_password_hash, verify_password
+from app.utils.reference_data import reference_data
+from app.utils.security import (
+    create_access_token,
+    get_password_hash,
+    verify_and_update_password,
+)
 
 router = APIRouter(tags=["authentication"], prefix="/auth")
 
 
 @router.post("/register", response_model=Token)
-async def register(user_data: UserRegistration, db: Session = Depends(get_db)):
+async def register(user_data: UserRegistration, db: AsyncSession = Depends(get_db)):
     """
     Register a new user and return JWT token
     """
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
         )
 
+    data = await reference_data.get(db)
+
     # Check if dietary preference exists
-    dietary_pref = (
-        db.query(DietaryPreference)
-        .filter(DietaryPreference.preference_id == user_data.dietary_preference_id)
-        .first()
-    )
-    if not dietary_pref:
+    if user_data.dietary_preference_id not in data.dietary_preferences:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid dietary preference"
         )
 
     # Check if cuisine preference exists
-    cuisine_pref = (
-        db.query(Cuisine)
-        .filter(Cuisine.cuisine_id == user_data.cuisine_preference_id)
-        .first()
-    )
-    if not cuisine_pref:
+    if user_data.cuisine_preference_id not in data.cuisines:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cuisine preference"
         )
 
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     new_user = User(
         email=user_data.email,
         password_hash=hashed_password,
@@ -57,19 +56,22 @@ async def register(user_data: UserRegistration, db: Session = Depends(get_db)):
         last_name=user_data.last_name,
     )
 
-    # Add preferences
-    new_user.dietary_preferences.append(dietary_pref)
-    new_user.preferred_cuisines.append(cuisine_pref)
-
-    # Save to database
+    # Save to database along with the preferences
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.flush()
+    await add_user_preferences(
+        db,
+        new_user.user_id,
+        user_data.dietary_preference_id,
+        user_data.cuisine_preference_id,
+    )
+    await db.commit()
 
     # Create access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": new_user.email}, expires_delta=access_token_expires
+        data={"sub": new_user.email, "user_id": str(new_user.user_id)},
+        expires_delta=access_token_expires,
     )
 
     return {"access_token": access_token, "token_type": "bearer"}
@@ -78,51 +80,61 @@ async def register(user_data: UserRegistration, db: Session = Depends(get_db)):
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     OAuth2 compatible token login endpoint
     """
-    # Find the user
-    user = db.query(User).filter(User.email == form_data.username).first()
-
-    # Verify user exists and password is correct
-    if not user or not verify_password(form_data.password, user.password_hash):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    user = await _authenticate_user(db, form_data.username, form_data.password)
 
     # Create access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "user_id": str(user.user_id)},
+        expires_delta=access_token_expires,
     )
 
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/login", response_model=Token)
-async def login(user_login: UserLogin, db: Session = Depends(get_db)):
+async def login(user_login: UserLogin, db: AsyncSession = Depends(get_db)):
     """
     Login endpoint for regular API clients
     """
+    user = await _authenticate_user(db, user_login.email, user_login.password)
+
+    # Create access token
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.email, "user_id": str(user.user_id)},
+        expires_delta=access_token_expires,
+    )
+
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+async def _authenticate_user(db: AsyncSession, email: str, password: str) -> User:
+    """Check a user's credentials, upgrading the stored hash if the bcrypt cost changed"""
     # Find the user
-    user = db.query(User).filter(User.email == user_login.email).first()
+    user = await db.scalar(select(User).where(User.email == email))
 
     # Verify user exists and password is correct
-    if not user or not verify_password(user_login.password, user.password_hash):
+    if user:
+        valid, new_hash = await verify_and_update_password(password, user.password_hash)
+    else:
+        valid, new_hash = False, None
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    # Rehash transparently with the configured cost
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
 
-    return {"access_token": access_token, "token_type": "bearer"}
+    return user
@@ -1,20 +1,26 @@
-import os
 from typing import List
+from uuid import UUID
 import logging
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import settings, limiter
+from app.config import settings
 from app.db.database import get_db
-from app.db.models import InventoryItem, User
+from app.db.models import ImageJob, InventoryItem, normalize_item_name
+from app.db.queries import insert_inventory_items
 from app.schemas.inventory import (
+    ImageJobSchema,
     InventoryItemSchema,
     InventoryItemCreate,
     InventoryUpdate,
 )
-from app.utils.gemini import extract_items_from_image
+from app.schemas.user import UserProfile
+from app.utils.jobs import PENDING, RUNNING, image_jobs
+from app.utils.rate_limit import limit_gemini_requests
 from app.utils.security import get_current_user
+from app.utils.storage import UploadError, UploadTooLarge, receive_upload
 
 router = APIRouter(tags=["inventory"], prefix="/inventory")
 
@@ -24,61 +30,55 @@ logger = logging.getLogger(__name__)
 
 @router.get("/", response_model=List[InventoryItemSchema])
 async def get_inventory(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Get current user's inventory"""
-    return (
-        db.query(InventoryItem)
-        .filter(InventoryItem.user_id == current_user.user_id)
-        .all()
+    inventory_items = await db.scalars(
+        select(InventoryItem).where(InventoryItem.user_id == current_user.user_id)
     )
+    return inventory_items.all()
 
 
 @router.post("/item", response_model=InventoryItemSchema)
 async def add_inventory_item(
     item: InventoryItemCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Add a single item to the inventory"""
-    # Check if item already exists
-    existing_item = (
-        db.query(InventoryItem)
-        .filter(
+    """Add a single item to the inventory, or get the one already stocked"""
+    # ON CONFLICT DO NOTHING, so a concurrent add of the same name can't fail
+    await insert_inventory_items(db, current_user.user_id, [item.name])
+    await db.commit()
+
+    stored_item = await db.scalar(
+        select(InventoryItem).where(
             InventoryItem.user_id == current_user.user_id,
-            InventoryItem.name.ilike(item.name),  # Case-insensitive comparison
+            InventoryItem.normalized_name == normalize_item_name(item.name),
         )
-        .first()
     )
 
-    if existing_item:
-        return existing_item
-
-    # Create new item
-    new_item = InventoryItem(user_id=current_user.user_id, name=item.name)
-
-    db.add(new_item)
-    db.commit()
-    db.refresh(new_item)
+    if stored_item is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Item name is required"
+        )
 
-    return new_item
+    return stored_item
 
 
 @router.delete("/item/{item_id}", response_model=dict)
 async def remove_inventory_item(
     item_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Remove an item from the inventory"""
     # Find the item
-    item = (
-        db.query(InventoryItem)
-        .filter(
+    item = await db.scalar(
+        select(InventoryItem).where(
             InventoryItem.item_id == item_id,
             InventoryItem.user_id == current_user.user_id,
         )
-        .first()
     )
 
     if not item:
@@ -87,118 +87,112 @@ async def remove_inventory_item(
         )
 
     # Remove the item
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
 
     return {"message": "Item removed successfully"}
 
 
-@router.post("/upload-image", response_model=dict)
-@limiter.limit(settings.GEMINI_API_RATE_LIMIT)
+@router.post(
+    "/upload-image",
+    response_model=ImageJobSchema,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(limit_gemini_requests)],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
 async def upload_inventory_image(
     request: Request,
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    response: Response,
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Update inventory from image using Gemini API (rate limited to 5/min and 500/day)"""
-    # Log API call
-    logger.info(
-        f"Gemini API call: extract_items_from_image by user {current_user.user_id}"
-    )
+    """
+    Queue an inventory update from an image (rate limited per user, 5/min and 500/day by default)
 
-    # Check file type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="File must be an image"
-        )
-
-    # Check file size
-    file_size = 0
-    contents = await file.read()
-    file_size = len(contents)
+    Returns 202 with a job as soon as the file is stored. Poll
+    GET /inventory/jobs/{job_id} for the result.
+    """
 
-    if file_size > settings.MAX_UPLOAD_SIZE:
+    # Stream the file to storage, stopping early at the size limit
+    try:
+        upload = await receive_upload(request, "file", content_type_prefix="image/")
+    except UploadTooLarge:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File size exceeds maximum allowed size ({settings.MAX_UPLOAD_SIZE // (1024 * 1024)}MB)",
         )
-
-    # Create upload directory if it doesn't exist
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-
-    # Create a unique filename
-    file_extension = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-    file_path = f"{settings.UPLOAD_DIR}/{current_user.user_id}_{file.filename}"
-
-    # Save the file
-    with open(file_path, "wb") as f:
-        f.write(contents)
-
-    # Extract items from image
-    result = extract_items_from_image(contents)
-
-    if result["status"] == "404":
-        return {"message": "No food items detected in the image", "items_added": 0}
-
-    # Add items to inventory
-    items_added = 0
-    for item_name in result["items"]:
-        # Check if item already exists
-        existing_item = (
-            db.query(InventoryItem)
-            .filter(
-                InventoryItem.user_id == current_user.user_id,
-                InventoryItem.name.ilike(item_name),  # Case-insensitive comparison
-            )
-            .first()
+    except UploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # A retried upload of the same image joins the job already in progress
+    job = await db.scalar(
+        select(ImageJob).where(
+            ImageJob.user_id == current_user.user_id,
+            ImageJob.image_path == upload.path,
+            ImageJob.status.in_([PENDING, RUNNING]),
         )
+    )
+    if job is None:
+        logger.info(f"Queueing image extraction for user {current_user.user_id}")
+        job = ImageJob(
+            user_id=current_user.user_id, image_path=upload.path, status=PENDING
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        image_jobs.enqueue(job.job_id)
 
-        if not existing_item:
-            # Create new item
-            new_item = InventoryItem(user_id=current_user.user_id, name=item_name)
+    response.headers["Location"] = (
+        f"{request.url.path.rsplit('/', 1)[0]}/jobs/{job.job_id}"
+    )
+    return job
 
-            db.add(new_item)
-            items_added += 1
 
-    db.commit()
+@router.get("/jobs/{job_id}", response_model=ImageJobSchema)
+async def get_image_job(
+    job_id: UUID,
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get the status, and once done the result, of an image extraction job"""
+    job = await db.scalar(
+        select(ImageJob).where(
+            ImageJob.job_id == job_id, ImageJob.user_id == current_user.user_id
+        )
+    )
 
-    return {
-        "message": f"Inventory updated with {items_added} new items",
-        "items_added": items_added,
-        "total_items_detected": len(result["items"]),
-        "detected_items": result["items"],
-    }
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+
+    return job
 
 
 @router.post("/update-multiple", response_model=dict)
 async def update_inventory_items(
     inventory_update: InventoryUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Update inventory with multiple items at once"""
-    items_added = 0
-
-    for item_name in inventory_update.items:
-        # Check if item already exists
-        existing_item = (
-            db.query(InventoryItem)
-            .filter(
-                InventoryItem.user_id == current_user.user_id,
-                InventoryItem.name.ilike(item_name),  # Case-insensitive comparison
-            )
-            .first()
-        )
-
-        if not existing_item:
-            # Create new item
-            new_item = InventoryItem(user_id=current_user.user_id, name=item_name)
-
-            db.add(new_item)
-            items_added += 1
-
-    db.commit()
+    items_added = len(
+        await insert_inventory_items(db, current_user.user_id, inventory_update.items)
+    )
+    await db.commit()
 
     return {
         "message": f"Inventory updated with {items_added} new items",
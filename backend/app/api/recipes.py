@@ -1,26 +1,41 @@
-from typing import List
+import json
+from typing import AsyncIterator, Dict, List
 import logging
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import settings, limiter
+from app.config import settings
 from app.db.database import get_db
+from app.db.loading import RECIPE_DETAIL_OPTIONS, RECIPE_SCHEMA_OPTIONS
 from app.db.models import (
     InventoryItem,
     Recipe,
-    RecipeIngredient,
-    User,
     UserRecipeHistory,
+    recipe_content_hash,
+)
+from app.db.queries import (
+    consume_recipe_ingredients,
+    get_or_create_recipe,
+    mark_recipe_cooked,
+    save_to_recipe_history,
 )
 from app.schemas.recipe import (
+    GeneratedRecipe,
     RecipeCreate,
     RecipeDetail,
     RecipeSchema,
     RecipeSuggestion,
     RecipeSuggestionRequest,
 )
-from app.utils.gemini import generate_recipes
+from app.schemas.user import UserProfile
+from app.utils.gemini import generate_recipes, stream_recipes
+from app.utils.metrics import metrics
+from app.utils.rate_limit import limit_gemini_requests
+from app.utils.recipe_index import cuisine_tag, dietary_tag, recipe_index
 from app.utils.security import get_current_user
 
 # Maximum number of recipes per user
@@ -34,29 +49,23 @@ router = APIRouter(tags=["recipes"], prefix="/recipes")
 
 @router.get("/history", response_model=List[RecipeSchema])
 async def get_recipe_history(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Get current user's recipe history, limited to the most recent MAX_RECIPES_PER_USER"""
-    history = (
-        db.query(Recipe)
-        .join(UserRecipeHistory)
-        .filter(UserRecipeHistory.user_id == current_user.user_id)
-        .order_by(UserRecipeHistory.created_at.desc())
-        .limit(MAX_RECIPES_PER_USER)
-        .all()
-    )
+    history = await db.scalars(_recipe_history_query(current_user.user_id))
 
-    return history
+    return history.all()
 
 
 @router.get("/{recipe_id}", response_model=RecipeDetail)
 async def get_recipe_detail(
     recipe_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Get details of a specific recipe"""
-    recipe = db.query(Recipe).filter(Recipe.recipe_id == recipe_id).first()
+    recipe = await db.scalar(_recipe_detail_query(recipe_id))
 
     if not recipe:
         raise HTTPException(
@@ -66,225 +75,169 @@ async def get_recipe_detail(
     return recipe
 
 
-@router.post("/suggest", response_model=List[RecipeSuggestion])
-@limiter.limit(settings.GEMINI_API_RATE_LIMIT)
+@router.post(
+    "/suggest",
+    response_model=List[RecipeSuggestion],
+    dependencies=[Depends(limit_gemini_requests)],
+)
 async def suggest_recipes(
-    request: Request,
     recipe_request: RecipeSuggestionRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Suggest recipes based on user's inventory and preferences (rate limited to 5/min and 500/day)"""
+    """Suggest recipes based on user's inventory and preferences (rate limited per user, 5/min and 500/day by default)"""
+    suggestion_inputs = await _get_suggestion_inputs(recipe_request, current_user, db)
+
+    # Serve stored recipes the pantry already covers before asking Gemini
+    if recipe_request.mode != "gemini":
+        local_suggestions = await _find_stored_recipes(suggestion_inputs, db)
+        if local_suggestions:
+            metrics.increment("recipe_index.served")
+            return local_suggestions
+        if recipe_request.mode == "local":
+            return []
+
     # Log API call
     logger.info(f"Gemini API call: generate_recipes by user {current_user.user_id}")
 
-    # Get user's inventory
-    if not recipe_request.custom_ingredients:
-        inventory_items = (
-            db.query(InventoryItem)
-            .filter(InventoryItem.user_id == current_user.user_id)
-            .all()
-        )
-
-        ingredients = [item.name for item in inventory_items]
-    else:
-        ingredients = recipe_request.custom_ingredients
-
-    # Get user's preferences
-    if len(current_user.dietary_preferences) == 0:
-        dietary_preference = "Non-vegetarian"  # Default
-    else:
-        dietary_preference = current_user.dietary_preferences[0].name
-
-    if len(current_user.preferred_cuisines) == 0:
-        cuisine_preference = "American"  # Default
-    else:
-        cuisine_preference = current_user.preferred_cuisines[0].name
-
-    # Get previously made recipes
-    previous_recipes = []
-    if not recipe_request.ignore_history:
-        history = (
-            db.query(Recipe.title)
-            .join(UserRecipeHistory)
-            .filter(
-                UserRecipeHistory.user_id == current_user.user_id,
-                UserRecipeHistory.cooked == True,
-            )
-            .order_by(UserRecipeHistory.created_at.desc())
-            .limit(2)
-            .all()
-        )
-
-        previous_recipes = [recipe.title for recipe in history]
-
     # Generate recipe suggestions
-    recipe_suggestions = generate_recipes(
-        ingredients=ingredients,
-        dietary_preference=dietary_preference,
-        cuisine_preference=cuisine_preference,
-        previous_recipes=previous_recipes,
-    )
+    recipe_suggestions = await generate_recipes(**suggestion_inputs)
 
     # Check if suggestions were generated
-    if recipe_suggestions["status"] == 400:
+    if recipe_suggestions.status == 400:
         return []
 
     # Format suggestions
-    suggestions = []
-    for recipe_data in recipe_suggestions["recipes"]:
-        if recipe_data["status"] == 200:
-            suggestions.append(
-                RecipeSuggestion(
-                    recipe_name=recipe_data["recipe_name"],
-                    description=recipe_data["description"],
-                    ingredients=recipe_data["ingredients"],
-                    approx_time=recipe_data["approx_time"],
-                    steps=recipe_data["steps"],
-                )
-            )
+    return [
+        _to_suggestion(recipe)
+        for recipe in recipe_suggestions.recipes
+        if recipe.status == 200
+    ]
 
-    return suggestions
+
+@router.post("/suggest/stream", dependencies=[Depends(limit_gemini_requests)])
+async def stream_recipe_suggestions(
+    recipe_request: RecipeSuggestionRequest,
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream recipe suggestions as Server-Sent Events, one "recipe" event per recipe followed by a "done" event"""
+    # Log API call
+    logger.info(f"Gemini API call: stream_recipes by user {current_user.user_id}")
+
+    # Read everything needed from the database before the response starts
+    suggestion_inputs = await _get_suggestion_inputs(recipe_request, current_user, db)
+
+    # Start the upstream call before responding, so an exhausted upstream
+    # quota or an open circuit can still be answered with a 429 or 503
+    recipes = stream_recipes(**suggestion_inputs)
+    first_recipe = await anext(recipes, None)
+
+    async def event_stream():
+        count = 0
+        if first_recipe is not None:
+            async for recipe in _prepend(first_recipe, recipes):
+                if recipe.status != 200:
+                    continue
+                suggestion = _to_suggestion(recipe)
+                count += 1
+                yield f"event: recipe\ndata: {suggestion.model_dump_json()}\n\n"
+
+        yield f"event: done\ndata: {json.dumps({'count': count})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/create", response_model=RecipeDetail)
 async def create_recipe(
     recipe_data: RecipeCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Create a new recipe and add it to user's history. If user already has MAX_RECIPES_PER_USER recipes, delete the oldest one"""
-
-    # Check current recipe count for the user
-    user_recipe_count = (
-        db.query(UserRecipeHistory)
-        .filter(UserRecipeHistory.user_id == current_user.user_id)
-        .count()
-    )
-
-    # If user already has MAX_RECIPES_PER_USER recipes, delete the oldest one
-    if user_recipe_count >= MAX_RECIPES_PER_USER:
-        # Find the oldest recipe history entry
-        oldest_history = (
-            db.query(UserRecipeHistory)
-            .filter(UserRecipeHistory.user_id == current_user.user_id)
-            .order_by(UserRecipeHistory.created_at.asc())
-            .first()
-        )
-
-        if oldest_history:
-            # Check if this recipe is used only by this user
-            recipe_usage_count = (
-                db.query(UserRecipeHistory)
-                .filter(UserRecipeHistory.recipe_id == oldest_history.recipe_id)
-                .count()
-            )
-
-            # Delete the history entry
-            db.delete(oldest_history)
-
-            # If this is the only user using this recipe, delete the recipe and its ingredients
-            if recipe_usage_count == 1:
-                # Delete recipe ingredients
-                db.query(RecipeIngredient).filter(
-                    RecipeIngredient.recipe_id == oldest_history.recipe_id
-                ).delete(synchronize_session=False)
-
-                # Delete the recipe
-                db.query(Recipe).filter(
-                    Recipe.recipe_id == oldest_history.recipe_id
-                ).delete(synchronize_session=False)
-
-    # Create new recipe
-    new_recipe = Recipe(
-        title=recipe_data.recipe_name,
-        short_description=recipe_data.description,
-        instructions="\n".join(recipe_data.steps),
-        total_time_minutes=_parse_time_to_minutes(recipe_data.approx_time),
+    """Save a recipe to the user's history, reusing an identical stored recipe. If user already has MAX_RECIPES_PER_USER recipes, drop the oldest one"""
+    # Identical recipes are stored once, so a popular recipe only gains a history link
+    recipe_id = await get_or_create_recipe(
+        db,
+        {
+            "title": recipe_data.recipe_name,
+            "short_description": recipe_data.description,
+            "instructions": "\n".join(recipe_data.steps),
+            "total_time_minutes": _parse_time_to_minutes(recipe_data.approx_time),
+            "content_hash": recipe_content_hash(
+                recipe_data.recipe_name, recipe_data.ingredients, recipe_data.steps
+            ),
+        },
+        recipe_data.ingredients,
     )
 
-    db.add(new_recipe)
-    db.flush()  # Get the recipe_id without committing transaction
-
-    # Add ingredients
-    for ingredient_name in recipe_data.ingredients:
-        ingredient = RecipeIngredient(
-            recipe_id=new_recipe.recipe_id, ingredient_name=ingredient_name
-        )
-        db.add(ingredient)
-
-    # Add to user history
-    history_entry = UserRecipeHistory(
-        user_id=current_user.user_id, recipe_id=new_recipe.recipe_id, cooked=False
+    # Link it at the front of the history, trimming the oldest entries
+    await save_to_recipe_history(
+        db, current_user.user_id, recipe_id, MAX_RECIPES_PER_USER
     )
+    await db.commit()
 
-    db.add(history_entry)
-    db.commit()
-    db.refresh(new_recipe)
+    # Make the recipe available to local suggestions right away
+    recipe_index.add(recipe_id, recipe_data.ingredients, _preference_tags(current_user))
 
-    return new_recipe
+    return await db.scalar(_recipe_detail_query(recipe_id))
 
 
 @router.post("/{recipe_id}/cook", response_model=dict)
 async def cook_recipe(
     recipe_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Mark a recipe as cooked and remove ingredients from inventory"""
-    # Get the recipe
-    recipe = db.query(Recipe).filter(Recipe.recipe_id == recipe_id).first()
+    """Mark a recipe as cooked and remove its ingredients from inventory"""
+    # Check the recipe exists without loading it
+    recipe_exists = await db.scalar(
+        select(Recipe.recipe_id).where(Recipe.recipe_id == recipe_id)
+    )
 
-    if not recipe:
+    if not recipe_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Recipe not found"
         )
 
-    # Get recipe history entry or create one
-    history_entry = (
-        db.query(UserRecipeHistory)
-        .filter(
-            UserRecipeHistory.user_id == current_user.user_id,
-            UserRecipeHistory.recipe_id == recipe_id,
-        )
-        .first()
+    # Update history and consume ingredients in the same transaction
+    await mark_recipe_cooked(db, current_user.user_id, recipe_id)
+    consumed_items = await consume_recipe_ingredients(
+        db, current_user.user_id, recipe_id
     )
+    await db.commit()
 
-    if not history_entry:
-        history_entry = UserRecipeHistory(
-            user_id=current_user.user_id, recipe_id=recipe_id, cooked=True
-        )
-        db.add(history_entry)
-    else:
-        history_entry.cooked = True
+    return {
+        "message": "Recipe cooked successfully",
+        "ingredients_used": len(consumed_items),
+        "consumed_items": consumed_items,
+    }
 
-    # Remove ingredients from inventory
-    ingredients_used = 0
-    ingredient_names = [
-        ingredient.ingredient_name.lower() for ingredient in recipe.ingredients
-    ]
 
-    for ingredient_name in ingredient_names:
-        # Find matching inventory item
-        inventory_item = (
-            db.query(InventoryItem)
-            .filter(
-                InventoryItem.user_id == current_user.user_id,
-                InventoryItem.name.ilike(ingredient_name),
-            )
-            .first()
+def _recipe_history_query(user_id: UUID) -> Select:
+    """Build the query for a user's most recent recipes serialized as RecipeSchema"""
+    return (
+        select(Recipe)
+        .options(*RECIPE_SCHEMA_OPTIONS)
+        .join(UserRecipeHistory)
+        .where(UserRecipeHistory.user_id == user_id)
+        .order_by(
+            UserRecipeHistory.created_at.desc(), UserRecipeHistory.history_id.desc()
         )
+        .limit(MAX_RECIPES_PER_USER)
+    )
 
-        if inventory_item:
-            db.delete(inventory_item)
-            ingredients_used += 1
-
-    db.commit()
 
-    return {
-        "message": "Recipe cooked successfully",
-        "ingredients_used": ingredients_used,
-    }
+def _recipe_detail_query(recipe_id: int) -> Select:
+    """Build the query for a recipe serialized as RecipeDetail"""
+    return (
+        select(Recipe)
+        .options(*RECIPE_DETAIL_OPTIONS)
+        .where(Recipe.recipe_id == recipe_id)
+    )
 
 
 def _parse_time_to_minutes(time_str: str) -> int:
@@ -295,3 +248,124 @@ def _parse_time_to_minutes(time_str: str) -> int:
     except (ValueError, TypeError):
         # Default to 30 minutes if parsing fails
         return 30
+
+
+async def _get_suggestion_inputs(
+    recipe_request: RecipeSuggestionRequest, current_user: UserProfile, db: AsyncSession
+) -> Dict:
+    """Collect the ingredients, preferences and history for a suggestion request"""
+    # Get user's inventory
+    if not recipe_request.custom_ingredients:
+        inventory_names = await db.scalars(
+            select(InventoryItem.name).where(
+                InventoryItem.user_id == current_user.user_id
+            )
+        )
+
+        ingredients = list(inventory_names)
+    else:
+        ingredients = recipe_request.custom_ingredients
+
+    # Get user's preferences
+    if len(current_user.dietary_preferences) == 0:
+        dietary_preference = "Non-vegetarian"  # Default
+    else:
+        dietary_preference = current_user.dietary_preferences[0].name
+
+    if len(current_user.preferred_cuisines) == 0:
+        cuisine_preference = "American"  # Default
+    else:
+        cuisine_preference = current_user.preferred_cuisines[0].name
+
+    # Get previously made recipes
+    previous_recipes = []
+    if not recipe_request.ignore_history:
+        history = await db.scalars(
+            select(Recipe.title)
+            .join(UserRecipeHistory)
+            .where(
+                UserRecipeHistory.user_id == current_user.user_id,
+                UserRecipeHistory.cooked == True,
+            )
+            .order_by(UserRecipeHistory.created_at.desc())
+            .limit(2)
+        )
+
+        previous_recipes = list(history)
+
+    return {
+        "ingredients": ingredients,
+        "dietary_preference": dietary_preference,
+        "cuisine_preference": cuisine_preference,
+        "previous_recipes": previous_recipes,
+    }
+
+
+async def _prepend(
+    first: GeneratedRecipe, rest: AsyncIterator[GeneratedRecipe]
+) -> AsyncIterator[GeneratedRecipe]:
+    """Yield an already received item followed by the rest of the stream"""
+    yield first
+    async for item in rest:
+        yield item
+
+
+def _preference_tags(current_user: UserProfile) -> List[str]:
+    """Get the recipe index tags for a user's dietary preferences and cuisines"""
+    return [dietary_tag(dp.name) for dp in current_user.dietary_preferences] + [
+        cuisine_tag(c.name) for c in current_user.preferred_cuisines
+    ]
+
+
+async def _find_stored_recipes(
+    suggestion_inputs: Dict, db: AsyncSession
+) -> List[RecipeSuggestion]:
+    """Find stored recipes that the ingredients cover and that match the preferences"""
+    previous_recipes = {
+        title.strip().lower() for title in suggestion_inputs["previous_recipes"]
+    }
+    matches = recipe_index.search(
+        suggestion_inputs["ingredients"],
+        tags=[
+            dietary_tag(suggestion_inputs["dietary_preference"]),
+            cuisine_tag(suggestion_inputs["cuisine_preference"]),
+        ],
+        limit=settings.RECIPE_INDEX_TOP_K + len(previous_recipes),
+        min_coverage=settings.RECIPE_INDEX_MIN_COVERAGE,
+    )
+    if not matches:
+        return []
+
+    recipe_ids = [recipe_id for recipe_id, _ in matches]
+    recipes = await db.scalars(
+        select(Recipe)
+        .options(*RECIPE_DETAIL_OPTIONS)
+        .where(Recipe.recipe_id.in_(recipe_ids))
+    )
+    recipes_by_id = {recipe.recipe_id: recipe for recipe in recipes}
+
+    suggestions = []
+    for recipe_id in recipe_ids:
+        recipe = recipes_by_id.get(recipe_id)
+        if recipe is None or recipe.title.strip().lower() in previous_recipes:
+            continue
+        suggestions.append(
+            RecipeSuggestion(
+                recipe_name=recipe.title,
+                description=recipe.short_description or "",
+                ingredients=[i.ingredient_name for i in recipe.ingredients],
+                approx_time=(
+                    f"{recipe.total_time_minutes} minutes"
+                    if recipe.total_time_minutes is not None
+                    else ""
+                ),
+                steps=recipe.instructions.split("\n"),
+            )
+        )
+
+    return suggestions[: settings.RECIPE_INDEX_TOP_K]
+
+
+def _to_suggestion(recipe: GeneratedRecipe) -> RecipeSuggestion:
+    """Convert a generated recipe to a RecipeSuggestion"""
+    return RecipeSuggestion(**recipe.model_dump(exclude={"status"}))
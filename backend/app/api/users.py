@@ -1,78 +1,91 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.db.database import get_db
-from app.db.models import Cuisine, DietaryPreference, User
-from app.schemas.user import (
-    DietaryPreferenceSchema,
-    CuisineSchema,
-    UserProfile,
-    UserPreferenceUpdate,
-)
-from app.utils.security import get_current_user
+from app.db.models import user_dietary_preferences, user_preferred_cuisines
+from app.db.queries import add_user_preferences
+from app.schemas.user import UserProfile, UserPreferenceUpdate
+from app.utils.metrics import metrics
+from app.utils.reference_data import etag_matches, reference_data
+from app.utils.security import get_current_user, invalidate_user
 
 router = APIRouter(tags=["users"], prefix="/users")
 
 
 @router.get("/me", response_model=UserProfile)
-async def get_current_user_profile(current_user: User = Depends(get_current_user)):
+async def get_current_user_profile(
+    current_user: UserProfile = Depends(get_current_user),
+):
     """Get current user profile"""
     return current_user
 
 
 @router.get("/preferences", response_model=dict)
-async def get_preferences(db: Session = Depends(get_db)):
+async def get_preferences(request: Request):
     """Get all available dietary preferences and cuisines"""
-    dietary_prefs = db.query(DietaryPreference).all()
-    cuisines = db.query(Cuisine).all()
-
-    return {
-        "dietary_preferences": [
-            DietaryPreferenceSchema.model_validate(dp) for dp in dietary_prefs
-        ],
-        "cuisines": [CuisineSchema.model_validate(c) for c in cuisines],
+    data = await reference_data.get()
+    headers = {
+        "ETag": data.etag,
+        "Cache-Control": f"public, max-age={settings.REFERENCE_DATA_MAX_AGE_SECONDS}",
     }
 
+    # The client already has this version
+    if etag_matches(request.headers.get("if-none-match"), data.etag):
+        metrics.increment("reference_data.not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=data.body, media_type="application/json", headers=headers)
+
 
 @router.put("/preferences", response_model=UserProfile)
 async def update_preferences(
     preferences: UserPreferenceUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """Update user preferences"""
+    data = await reference_data.get(db)
+
     # Check if dietary preference exists
-    dietary_pref = (
-        db.query(DietaryPreference)
-        .filter(DietaryPreference.preference_id == preferences.dietary_preference_id)
-        .first()
-    )
+    dietary_pref = data.dietary_preferences.get(preferences.dietary_preference_id)
     if not dietary_pref:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid dietary preference"
         )
 
     # Check if cuisine preference exists
-    cuisine_pref = (
-        db.query(Cuisine)
-        .filter(Cuisine.cuisine_id == preferences.cuisine_preference_id)
-        .first()
-    )
+    cuisine_pref = data.cuisines.get(preferences.cuisine_preference_id)
     if not cuisine_pref:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cuisine preference"
         )
 
-    # Clear existing preferences
-    current_user.dietary_preferences = []
-    current_user.preferred_cuisines = []
-
-    # Add new preferences
-    current_user.dietary_preferences.append(dietary_pref)
-    current_user.preferred_cuisines.append(cuisine_pref)
+    # Replace existing preferences
+    await db.execute(
+        delete(user_dietary_preferences).where(
+            user_dietary_preferences.c.user_id == current_user.user_id
+        )
+    )
+    await db.execute(
+        delete(user_preferred_cuisines).where(
+            user_preferred_cuisines.c.user_id == current_user.user_id
+        )
+    )
+    await add_user_preferences(
+        db, current_user.user_id, dietary_pref.preference_id, cuisine_pref.cuisine_id
+    )
 
     # Save to database
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
 
-    return current_user
+    # The cached profile still carries the old preferences
+    invalidate_user(current_user.email)
+
+    return current_user.model_copy(
+        update={
+            "dietary_preferences": [dietary_pref],
+            "preferred_cuisines": [cuisine_pref],
+        }
+    )
@@ -2,7 +2,6 @@ import os
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 from typing import Optional
-from slowapi import Limiter
 
 # Load the .env file if it exists (local development)
 if os.path.exists(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")):
@@ -11,15 +10,6 @@ if os.path.exists(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env
     )
 
 
-# Global key function for rate limiting across all requests
-def global_limit_key(*args, **kwargs):
-    return "global"
-
-
-# Create a rate limiter with global scope
-limiter = Limiter(key_func=global_limit_key)
-
-
 class Settings(BaseSettings):
     # Database settings - Heroku provides DATABASE_URL as an environment variable
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
@@ -40,20 +30,107 @@ class Settings(BaseSettings):
     if not DATABASE_URL and all([POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_SERVER, POSTGRES_PORT, POSTGRES_DB]):
         DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
+    # Connection pool settings (ignored for SQLite)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE_SECONDS: int = 30 * 60
+    DB_STATEMENT_TIMEOUT_MS: int = 30 * 1000
+
     # JWT settings
     SECRET_KEY: str = os.getenv("SECRET_KEY", "")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
 
+    # Operators allowed to read /api/metrics, as comma-separated emails
+    ADMIN_EMAILS: str = ""
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = os.cpu_count() or 1
+    PASSWORD_HASH_MAX_PENDING: int = 64  # Queued or running hash operations
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = 5.0
+
+    # Authenticated user cache
+    USER_CACHE_TTL_SECONDS: int = 300
+    USER_CACHE_MAX_ENTRIES: int = 10000
+
+    # Dietary preference and cuisine reference data
+    REFERENCE_DATA_REFRESH_SECONDS: int = 10 * 60
+    REFERENCE_DATA_MAX_AGE_SECONDS: int = 5 * 60  # Client Cache-Control max-age
+
     # Gemini API
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    GEMINI_MAX_CONCURRENCY: int = 8  # In-flight upstream calls per worker
+    GEMINI_TIMEOUT_SECONDS: float = 30.0  # Per-attempt upstream timeout
+    GEMINI_MODEL: str = "gemini-2.0-flash"
+    # Cache the few-shot prompt prefixes upstream. Off because the shipped
+    # prefixes are below Gemini's minimum cacheable size, so creation fails
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = False
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: int = 60 * 60
+    GEMINI_COMPACT_PROMPTS: bool = True  # Short prompts when context caching is unavailable
+
+    # LLM provider
+    LLM_PROVIDER: str = "gemini"  # gemini or replay
+    LLM_RECORD_PATH: str = ""  # Append request/response pairs to this JSONL file
+    LLM_REPLAY_PATH: str = "llm_recordings.jsonl"
+    LLM_REPLAY_LATENCY_SECONDS: Optional[float] = None  # None replays recorded latency
+    LLM_REPLAY_ERROR_RATE: float = 0.0  # Injected failure probability
+
+    # Upstream call resilience
+    LLM_DEADLINE_SECONDS: float = 60.0  # Per request, retries and hedges included
+    LLM_RETRY_ATTEMPTS: int = 3  # Attempts per request, the first one included
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5  # Doubled per retry, with full jitter
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    LLM_HEDGE_ENABLED: bool = False  # Duplicate attempts slower than the p95 latency
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Latencies observed before hedging starts
+    LLM_BREAKER_WINDOW_SECONDS: float = 60.0
+    LLM_BREAKER_MIN_CALLS: int = 10
+    LLM_BREAKER_ERROR_RATE: float = 0.5  # Share of failed calls that opens the circuit
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0  # Fail fast this long before a trial call
+
+    # Recipe suggestion cache
+    RECIPE_CACHE_ENABLED: bool = True
+    RECIPE_CACHE_BACKEND: str = "memory"  # memory, sqlite or redis
+    RECIPE_CACHE_URL: str = ""  # SQLite file path or redis:// URL
+    RECIPE_CACHE_TTL_SECONDS: int = 6 * 60 * 60  # 6 hours
+    RECIPE_CACHE_MAX_ENTRIES: int = 1024
+
+    # Local recipe retrieval before calling Gemini
+    RECIPE_INDEX_MIN_COVERAGE: float = 0.8  # Share of a recipe's ingredients in the pantry
+    RECIPE_INDEX_TOP_K: int = 3
 
     # Upload settings
     UPLOAD_DIR: str = "uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 256 * 1024  # Bytes buffered per disk write
+    UPLOAD_RETENTION_DAYS: int = 30  # Originals untouched for longer are deleted
+    UPLOAD_USER_QUOTA_BYTES: int = 100 * 1024 * 1024  # Newest originals kept per user
+    UPLOAD_GC_INTERVAL_SECONDS: int = 60 * 60
+    THUMBNAIL_SIZE: int = 256  # Longest edge in pixels
+    THUMBNAIL_QUALITY: int = 75
+
+    # Background image extraction jobs
+    IMAGE_JOB_WORKERS: int = 2
+    IMAGE_JOB_STALE_SECONDS: int = 5 * 60  # Running jobs older than this are retried at startup
+
+    # Image preprocessing before Gemini extraction
+    IMAGE_MAX_EDGE: int = 1024  # Longest edge in pixels
+    IMAGE_FORMAT: str = "JPEG"  # JPEG or WEBP
+    IMAGE_QUALITY: int = 80
+    IMAGE_WORKERS: int = 2
+
+    # Near-duplicate image detection for uploads
+    IMAGE_DEDUP_ENABLED: bool = True
+    IMAGE_DEDUP_MAX_DISTANCE: int = 6  # Max differing bits out of 64
+    IMAGE_DEDUP_MAX_USERS: int = 1000
+    IMAGE_DEDUP_MAX_ENTRIES_PER_USER: int = 20
 
-    # Rate limits
-    GEMINI_API_RATE_LIMIT: str = "5/minute;500/day"
+    # Rate limits, as token buckets of "count/period" separated by ";"
+    GEMINI_API_RATE_LIMIT: str = "5/minute;500/day"  # Per user
+    GEMINI_UPSTREAM_RATE_LIMIT: str = "15/minute;1500/day"  # Gemini quota, all users
+    RATE_LIMIT_BACKEND: str = "memory"  # memory (single worker), sqlite or redis
+    RATE_LIMIT_URL: str = ""  # SQLite file path or redis:// URL
 
     class Config:
         env_file = ".env"
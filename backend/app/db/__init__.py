@@ -1,2 +1,2 @@
 # This imports the database-related modules
-from app.db import database, models
+from app.db import database, loading, models, queries
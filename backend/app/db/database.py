@@ -1,27 +1,64 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 from app.config import settings
 
+# Async drivers for the URL schemes we support
+_ASYNC_DRIVERS = {
+    "postgresql://": "postgresql+asyncpg://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
+
+def _async_database_url(url: str) -> str:
+    """Switch a plain database URL to its async driver"""
+    for scheme, async_scheme in _ASYNC_DRIVERS.items():
+        if url.startswith(scheme):
+            return url.replace(scheme, async_scheme, 1)
+    return url
+
+
+def _engine_options(url: str) -> dict:
+    """Get pool and connection options for the engine"""
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+
+    # SQLite picks its own pool and has no server-side statement timeout
+    if url.startswith("sqlite"):
+        return options
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    )
+    if url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {
+            "server_settings": {
+                "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)
+            }
+        }
+    return options
+
+
 # Create SQLAlchemy engine and session
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+database_url = _async_database_url(settings.DATABASE_URL)
+engine = create_async_engine(database_url, **_engine_options(database_url))
+SessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """Get database session"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def create_tables():
+async def create_tables():
     """Create tables in the database if they don't exist"""
     # This will create tables that don't exist yet in the database
     # It won't update existing tables or create migrations
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,25 @@
+"""
+Loader options for each response model
+
+Relationships on the models are declared with lazy="raise", so every query
+whose result is serialized states up front which relationships it needs.
+Collections are fetched with selectinload, which costs one extra query per
+relationship no matter how many parent rows are returned.
+"""
+
+from sqlalchemy.orm import raiseload, selectinload
+
+from app.db.models import Recipe, User
+
+# RecipeSchema: recipe columns only
+RECIPE_SCHEMA_OPTIONS = (raiseload("*"),)
+
+# RecipeDetail: recipe columns and its ingredients
+RECIPE_DETAIL_OPTIONS = (selectinload(Recipe.ingredients), raiseload("*"))
+
+# UserProfile: user columns with dietary preferences and cuisines
+USER_PROFILE_OPTIONS = (
+    selectinload(User.dietary_preferences),
+    selectinload(User.preferred_cuisines),
+    raiseload("*"),
+)
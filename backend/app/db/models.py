@@ -1,4 +1,7 @@
+import hashlib
+import json
 from datetime import datetime
+from typing import List
 from uuid import uuid4
 
 from sqlalchemy import (
@@ -6,7 +9,9 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
+    JSON,
     String,
     Table,
     Text,
@@ -17,6 +22,39 @@ from sqlalchemy.sql import func
 
 from app.db.database import Base
 
+
+def normalize_item_name(name: str) -> str:
+    """Normalize an inventory item name for case-insensitive matching"""
+    return name.strip().lower()
+
+
+def recipe_content_hash(title: str, ingredients: List[str], steps: List[str]) -> str:
+    """
+    Hash a recipe's normalized content
+
+    Title, ingredients and steps are compared case- and whitespace-insensitively;
+    ingredient order and duplicates are ignored, step order is not.
+    """
+
+    def normalize(text: str) -> str:
+        return " ".join(text.split()).lower()
+
+    canonical = {
+        "title": normalize(title),
+        "ingredients": sorted({normalize(name) for name in ingredients}),
+        "steps": [normalize(step) for step in steps],
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _default_normalized_name(context) -> str:
+    return normalize_item_name(context.get_current_parameters()["name"])
+
+
+# Relationships never load implicitly: queries pick their loader options from
+# app.db.loading, and a missing option fails loudly instead of adding queries
+
 # Association tables for many-to-many relationships
 
 # User dietary preferences association table
@@ -66,11 +104,15 @@ class User(Base):
 
     # Relationships
     dietary_preferences = relationship(
-        "DietaryPreference", secondary=user_dietary_preferences
+        "DietaryPreference", secondary=user_dietary_preferences, lazy="raise"
+    )
+    preferred_cuisines = relationship(
+        "Cuisine", secondary=user_preferred_cuisines, lazy="raise"
+    )
+    inventory_items = relationship("InventoryItem", back_populates="user", lazy="raise")
+    recipe_history = relationship(
+        "UserRecipeHistory", back_populates="user", lazy="raise"
     )
-    preferred_cuisines = relationship("Cuisine", secondary=user_preferred_cuisines)
-    inventory_items = relationship("InventoryItem", back_populates="user")
-    recipe_history = relationship("UserRecipeHistory", back_populates="user")
 
 
 class DietaryPreference(Base):
@@ -91,36 +133,58 @@ class Cuisine(Base):
 
 class InventoryItem(Base):
     __tablename__ = "inventory_items"
+    __table_args__ = (
+        # One row per item name per user, regardless of case and whitespace
+        Index(
+            "uq_inventory_items_user_normalized_name",
+            "user_id",
+            "normalized_name",
+            unique=True,
+        ),
+    )
 
     item_id = Column(Integer, primary_key=True)
     user_id = Column(
         UUID(as_uuid=True), ForeignKey("users.user_id", ondelete="CASCADE")
     )
     name = Column(String(100), nullable=False)
+    normalized_name = Column(
+        String(100), nullable=False, default=_default_normalized_name
+    )
     added_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     # Relationships
-    user = relationship("User", back_populates="inventory_items")
+    user = relationship("User", back_populates="inventory_items", lazy="raise")
 
 
 class Recipe(Base):
     __tablename__ = "recipes"
+    __table_args__ = (
+        # Identical recipes are stored once and shared between users
+        Index("uq_recipes_content_hash", "content_hash", unique=True),
+    )
 
     recipe_id = Column(Integer, primary_key=True)
     title = Column(String(255), nullable=False)
     short_description = Column(Text)
     instructions = Column(Text, nullable=False)
     total_time_minutes = Column(Integer)
+    content_hash = Column(String(64))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
     ingredients = relationship(
-        "RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan"
+        "RecipeIngredient",
+        back_populates="recipe",
+        cascade="all, delete-orphan",
+        lazy="raise",
+    )
+    user_history = relationship(
+        "UserRecipeHistory", back_populates="recipe", lazy="raise"
     )
-    user_history = relationship("UserRecipeHistory", back_populates="recipe")
 
 
 class RecipeIngredient(Base):
@@ -132,11 +196,20 @@ class RecipeIngredient(Base):
     ingredient_name = Column(String(100), primary_key=True)
 
     # Relationships
-    recipe = relationship("Recipe", back_populates="ingredients")
+    recipe = relationship("Recipe", back_populates="ingredients", lazy="raise")
 
 
 class UserRecipeHistory(Base):
     __tablename__ = "user_recipe_history"
+    __table_args__ = (
+        # One history entry per recipe per user
+        Index(
+            "uq_user_recipe_history_user_recipe",
+            "user_id",
+            "recipe_id",
+            unique=True,
+        ),
+    )
 
     history_id = Column(Integer, primary_key=True)
     user_id = Column(
@@ -147,5 +220,29 @@ class UserRecipeHistory(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
-    user = relationship("User", back_populates="recipe_history")
-    recipe = relationship("Recipe", back_populates="user_history")
+    user = relationship("User", back_populates="recipe_history", lazy="raise")
+    recipe = relationship("Recipe", back_populates="user_history", lazy="raise")
+
+
+class ImageJob(Base):
+    """An uploaded image waiting for, or done with, item extraction"""
+
+    __tablename__ = "image_jobs"
+    __table_args__ = (
+        Index("ix_image_jobs_status", "status"),
+        Index("ix_image_jobs_user_id", "user_id"),
+    )
+
+    job_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    user_id = Column(
+        UUID(as_uuid=True), ForeignKey("users.user_id", ondelete="CASCADE")
+    )
+    image_path = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    result = Column(JSON)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
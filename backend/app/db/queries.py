@@ -0,0 +1,292 @@
+from typing import Dict, Iterable, List
+
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import (
+    InventoryItem,
+    Recipe,
+    RecipeIngredient,
+    UserRecipeHistory,
+    normalize_item_name,
+    user_dietary_preferences,
+    user_preferred_cuisines,
+)
+
+# Dialects whose INSERT supports ON CONFLICT DO NOTHING / DO UPDATE
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+async def insert_inventory_items(
+    db: AsyncSession, user_id, names: Iterable[str]
+) -> List[str]:
+    """
+    Add items the user doesn't already have
+
+    Names are de-duplicated on their normalized form. On PostgreSQL and
+    SQLite 3.35+ this is a single INSERT ... ON CONFLICT DO NOTHING RETURNING
+    statement; other databases use one SELECT for the existing names and one
+    multi-row INSERT. The caller commits.
+
+    Returns:
+        list: Names of the items that were inserted
+    """
+    rows = {}
+    for name in names:
+        normalized_name = normalize_item_name(name)
+        if normalized_name and normalized_name not in rows:
+            rows[normalized_name] = {
+                "user_id": user_id,
+                "name": name.strip(),
+                "normalized_name": normalized_name,
+            }
+
+    if not rows:
+        return []
+
+    dialect = db.get_bind().dialect
+    upsert_insert = _UPSERT_INSERTS.get(dialect.name)
+
+    if upsert_insert is not None and dialect.insert_returning:
+        statement = (
+            upsert_insert(InventoryItem)
+            .values(list(rows.values()))
+            .on_conflict_do_nothing(index_elements=["user_id", "normalized_name"])
+            .returning(InventoryItem.name)
+        )
+        return list((await db.execute(statement)).scalars())
+
+    # Fallback without ON CONFLICT ... RETURNING support
+    existing = set(
+        await db.scalars(
+            select(InventoryItem.normalized_name).where(
+                InventoryItem.user_id == user_id,
+                InventoryItem.normalized_name.in_(list(rows)),
+            )
+        )
+    )
+    new_rows = [row for key, row in rows.items() if key not in existing]
+    if new_rows:
+        await db.execute(insert(InventoryItem).values(new_rows))
+
+    return [row["name"] for row in new_rows]
+
+
+async def get_or_create_recipe(
+    db: AsyncSession, values: Dict, ingredient_names: Iterable[str]
+) -> int:
+    """
+    Get the recipe with values["content_hash"], inserting it if it's new
+
+    Saving a recipe that is already stored costs one SELECT. A new recipe is
+    inserted with ON CONFLICT DO NOTHING where supported, so a concurrent
+    save of the same recipe can't create a duplicate, and its ingredients
+    are added with one multi-row INSERT. The caller commits.
+
+    Returns:
+        int: ID of the stored recipe
+    """
+    existing = select(Recipe.recipe_id).where(
+        Recipe.content_hash == values["content_hash"]
+    )
+    recipe_id = await db.scalar(existing)
+    if recipe_id is not None:
+        return recipe_id
+
+    dialect = db.get_bind().dialect
+    upsert_insert = _UPSERT_INSERTS.get(dialect.name)
+
+    if upsert_insert is not None and dialect.insert_returning:
+        recipe_id = await db.scalar(
+            upsert_insert(Recipe)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=["content_hash"])
+            .returning(Recipe.recipe_id)
+        )
+        if recipe_id is None:
+            # Saved by a concurrent request since the SELECT above
+            return await db.scalar(existing)
+    else:
+        # Fallback without ON CONFLICT ... RETURNING support
+        recipe = Recipe(**values)
+        db.add(recipe)
+        await db.flush()
+        recipe_id = recipe.recipe_id
+
+    # Ingredient names are part of the primary key, so drop repeats
+    await db.execute(
+        insert(RecipeIngredient).values(
+            [
+                {"recipe_id": recipe_id, "ingredient_name": name}
+                for name in dict.fromkeys(ingredient_names)
+            ]
+        )
+    )
+    return recipe_id
+
+
+async def save_to_recipe_history(
+    db: AsyncSession, user_id, recipe_id: int, max_entries: int
+) -> None:
+    """
+    Add a recipe to the front of a user's history, keeping at most max_entries
+
+    One DELETE removes the user's existing entry for the recipe along with
+    every entry past the newest max_entries - 1 others, ranked with a window
+    function, and one INSERT adds the new entry. The DELETE returns the
+    cooked flag of the entry it replaces, so saving a recipe again keeps it
+    (a SELECT comes first on databases without DELETE ... RETURNING).
+    Recipes left without any history entry are kept so later saves of the
+    same content can reuse them. The caller commits.
+    """
+    ranked = (
+        select(
+            UserRecipeHistory.history_id,
+            func.row_number()
+            .over(
+                order_by=(
+                    UserRecipeHistory.created_at.desc(),
+                    UserRecipeHistory.history_id.desc(),
+                )
+            )
+            .label("position"),
+        )
+        .where(
+            UserRecipeHistory.user_id == user_id,
+            UserRecipeHistory.recipe_id.is_distinct_from(recipe_id),
+        )
+        .subquery()
+    )
+    stale = select(ranked.c.history_id).where(ranked.c.position >= max_entries)
+    replaced = delete(UserRecipeHistory).where(
+        UserRecipeHistory.user_id == user_id,
+        or_(
+            UserRecipeHistory.recipe_id == recipe_id,
+            UserRecipeHistory.history_id.in_(stale),
+        ),
+    )
+
+    # Saving a recipe again must not forget that it was cooked
+    if db.get_bind().dialect.delete_returning:
+        deleted = await db.execute(
+            replaced.returning(
+                UserRecipeHistory.recipe_id, UserRecipeHistory.cooked
+            ).execution_options(synchronize_session=False)
+        )
+        cooked = any(row.cooked for row in deleted if row.recipe_id == recipe_id)
+    else:
+        # Fallback without DELETE ... RETURNING support
+        cooked = await db.scalar(
+            select(UserRecipeHistory.cooked).where(
+                UserRecipeHistory.user_id == user_id,
+                UserRecipeHistory.recipe_id == recipe_id,
+            )
+        )
+        await db.execute(replaced.execution_options(synchronize_session=False))
+
+    await db.execute(
+        insert(UserRecipeHistory).values(
+            user_id=user_id, recipe_id=recipe_id, cooked=bool(cooked)
+        )
+    )
+
+
+async def consume_recipe_ingredients(
+    db: AsyncSession, user_id, recipe_id: int
+) -> List[str]:
+    """
+    Remove the user's inventory items that match a recipe's ingredients
+
+    Ingredient names are matched against the normalized item names inside
+    the database, so this is a single DELETE ... RETURNING statement however
+    many ingredients the recipe has (a SELECT plus a DELETE on databases
+    without DELETE ... RETURNING). The caller commits.
+
+    Returns:
+        list: Names of the inventory items that were removed
+    """
+    ingredient_names = select(
+        func.lower(func.trim(RecipeIngredient.ingredient_name))
+    ).where(RecipeIngredient.recipe_id == recipe_id)
+    matches_recipe = (
+        InventoryItem.user_id == user_id,
+        InventoryItem.normalized_name.in_(ingredient_names),
+    )
+
+    if db.get_bind().dialect.delete_returning:
+        statement = (
+            delete(InventoryItem)
+            .where(*matches_recipe)
+            .returning(InventoryItem.name)
+            .execution_options(synchronize_session=False)
+        )
+        return list((await db.execute(statement)).scalars())
+
+    # Fallback without DELETE ... RETURNING support
+    consumed = list(await db.scalars(select(InventoryItem.name).where(*matches_recipe)))
+    await db.execute(
+        delete(InventoryItem)
+        .where(*matches_recipe)
+        .execution_options(synchronize_session=False)
+    )
+    return consumed
+
+
+async def mark_recipe_cooked(db: AsyncSession, user_id, recipe_id: int) -> None:
+    """
+    Flag the user's history entry for a recipe as cooked, creating it if missing
+
+    On PostgreSQL and SQLite this is one INSERT ... ON CONFLICT DO UPDATE
+    against the unique (user_id, recipe_id) index, so concurrent cooks of
+    the same recipe leave a single entry. Other databases UPDATE and then
+    INSERT if nothing matched, and the index rejects a concurrent duplicate.
+    The caller commits.
+    """
+    upsert_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if upsert_insert is not None:
+        await db.execute(
+            upsert_insert(UserRecipeHistory)
+            .values(user_id=user_id, recipe_id=recipe_id, cooked=True)
+            .on_conflict_do_update(
+                index_elements=["user_id", "recipe_id"], set_={"cooked": True}
+            )
+        )
+        return
+
+    # Fallback without ON CONFLICT support
+    result = await db.execute(
+        update(UserRecipeHistory)
+        .where(
+            UserRecipeHistory.user_id == user_id,
+            UserRecipeHistory.recipe_id == recipe_id,
+        )
+        .values(cooked=True)
+        .execution_options(synchronize_session=False)
+    )
+
+    if result.rowcount == 0:
+        await db.execute(
+            insert(UserRecipeHistory).values(
+                user_id=user_id, recipe_id=recipe_id, cooked=True
+            )
+        )
+
+
+async def add_user_preferences(
+    db: AsyncSession, user_id, preference_id: int, cuisine_id: int
+) -> None:
+    """
+    Link a user to a dietary preference and a cuisine
+
+    The IDs are expected to be validated already, so the association rows are
+    inserted directly without loading either side. The caller commits.
+    """
+    await db.execute(
+        insert(user_dietary_preferences).values(
+            user_id=user_id, preference_id=preference_id
+        )
+    )
+    await db.execute(
+        insert(user_preferred_cuisines).values(user_id=user_id, cuisine_id=cuisine_id)
+    )
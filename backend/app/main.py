@@ -1,21 +1,31 @@
-from fastapi import FastAPI, Request
+import asyncio
+import logging
+
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
 
 from app.api import auth, users, inventory, recipes
+from app.config import settings
 from app.db.database import create_tables
-from app.config import limiter
+from app.utils.jobs import collect_upload_garbage_periodically, image_jobs
+from app.utils.metrics import metrics
+from app.utils.recipe_index import recipe_index
+from app.utils.rate_limit import RateLimitExceeded, rate_limit_exceeded_handler
+from app.utils.reference_data import reference_data
+from app.utils.resilience import CircuitOpen, circuit_open_handler
+from app.utils.security import get_current_admin
+from app.utils.storage import ImmutableStaticFiles
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="StockChef API", description="API for StockChef recipe generator")
 
-# Set up rate limiter
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SlowAPIMiddleware)
+# Answer exhausted rate limits with 429 and Retry-After
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+
+# Answer while Gemini is failing with 503 and Retry-After
+app.add_exception_handler(CircuitOpen, circuit_open_handler)
 
 # CORS settings
 origins = [
@@ -39,16 +49,44 @@ app.include_router(inventory.router, prefix="/api")
 app.include_router(recipes.router, prefix="/api")
 
 # Create uploads directory if it doesn't exist
-os.makedirs("uploads", exist_ok=True)
+os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
-# Serve uploaded files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Serve uploaded files and thumbnails, which are named by content hash
+app.mount(
+    "/uploads", ImmutableStaticFiles(directory=settings.UPLOAD_DIR), name="uploads"
+)
 
 
 @app.on_event("startup")
 async def startup():
     # Create tables if they don't exist
-    create_tables()
+    await create_tables()
+
+    # Load reference data up front and keep it fresh
+    try:
+        await reference_data.load()
+    except Exception as e:
+        logger.error(f"Failed to load reference data at startup: {e}")
+    app.state.reference_data_refresh = asyncio.create_task(
+        reference_data.refresh_periodically()
+    )
+
+    # Index the stored recipes for local suggestions
+    try:
+        await recipe_index.build()
+    except Exception as e:
+        logger.error(f"Failed to build recipe index at startup: {e}")
+
+    # Start the image extraction workers, resuming unfinished jobs
+    await image_jobs.start()
+    app.state.upload_gc = asyncio.create_task(collect_upload_garbage_periodically())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.reference_data_refresh.cancel()
+    app.state.upload_gc.cancel()
+    await image_jobs.stop()
 
 
 @app.get("/api/health")
@@ -56,6 +94,12 @@ async def health_check():
     return {"status": "healthy", "message": "StockChef API is running"}
 
 
+@app.get("/api/metrics", dependencies=[Depends(get_current_admin)])
+async def get_metrics():
+    """Counters and component stats, for the operators in ADMIN_EMAILS"""
+    return metrics.snapshot()
+
+
 @app.get("/")
 async def root():
     return {
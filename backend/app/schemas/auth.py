@@ -1,3 +1,5 @@
+from uuid import UUID
+
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -12,6 +14,7 @@ class TokenData(BaseModel):
     """Token data schema (for internal use)"""
 
     email: str | None = None
+    user_id: UUID | None = None
 
 
 class UserLogin(BaseModel):
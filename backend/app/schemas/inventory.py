@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field
@@ -33,3 +33,24 @@ class InventoryUpdate(BaseModel):
     """Schema for updating multiple inventory items at once"""
 
     items: List[str] = Field(..., min_items=1)
+
+
+class ExtractedItems(BaseModel):
+    """Schema for Gemini's item extraction output, also its response schema"""
+
+    status: str
+    items: List[str]
+
+
+class ImageJobSchema(BaseModel):
+    """Schema for an image extraction job"""
+
+    job_id: UUID
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -49,6 +49,19 @@ class RecipeSuggestion(BaseModel):
     steps: List[str]
 
 
+class GeneratedRecipe(RecipeSuggestion):
+    """Schema for one recipe in Gemini's generation output"""
+
+    status: int
+
+
+class RecipeGenerationResult(BaseModel):
+    """Schema for Gemini's recipe generation output, also its response schema"""
+
+    status: int
+    recipes: List[GeneratedRecipe]
+
+
 class RecipeCreate(BaseModel):
     """Schema for creating a recipe"""
 
@@ -64,3 +77,5 @@ class RecipeSuggestionRequest(BaseModel):
 
     custom_ingredients: Optional[List[str]] = None
     ignore_history: bool = False
+    # auto: stored recipes when the pantry covers them well enough, else Gemini
+    mode: Literal["auto", "local", "gemini"] = "gemini"
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from cachetools import TTLCache
+
+from app.config import settings
+from app.schemas.recipe import RecipeGenerationResult
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """Interface for recipe cache storage backends"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """The value stored under key, or None if it is missing or expired"""
+
+    @abstractmethod
+    async def set(self, key: str, value: str) -> None:
+        """Store value under key"""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Drop every entry"""
+
+    def size(self) -> Optional[int]:
+        """Number of stored entries, or None if the backend can't tell cheaply"""
+        return None
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process TTL cache with LRU eviction"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._cache = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._cache.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    async def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def size(self) -> Optional[int]:
+        with self._lock:
+            return len(self._cache)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite file cache shared by all workers on the same host
+
+    Entries expire after the TTL; once the table grows past max_entries the
+    least recently read entries are dropped.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS recipe_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_recipe_cache_accessed_at ON recipe_cache (accessed_at)"
+        )
+        self._conn.commit()
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM recipe_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE recipe_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def _set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recipe_cache VALUES (?, ?, ?, ?)",
+                (key, value, now + self._ttl, now),
+            )
+            self._conn.execute("DELETE FROM recipe_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                """DELETE FROM recipe_cache WHERE key IN (
+                    SELECT key FROM recipe_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self._max_entries,),
+            )
+            self._conn.commit()
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM recipe_cache")
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._clear)
+
+    def size(self) -> Optional[int]:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM recipe_cache").fetchone()[0]
+
+
+class RedisBackend(CacheBackend):
+    """
+    Cache stored in any Redis-protocol server
+
+    The TTL is applied per key; LRU eviction is left to the server's
+    maxmemory-policy (allkeys-lru), as is usual for Redis caches.
+    """
+
+    key_prefix = "stockchef:recipe-cache:"
+
+    def __init__(self, url: str, ttl: float):
+        # Imported lazily so the default memory backend doesn't need redis installed
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._ttl = int(ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._client.get(self.key_prefix + key)
+        return value.decode() if value is not None else None
+
+    async def set(self, key: str, value: str) -> None:
+        await self._client.set(self.key_prefix + key, value, ex=self._ttl)
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=self.key_prefix + "*"):
+            await self._client.delete(key)
+
+
+class RecipeCache:
+    """Cache of Gemini recipe suggestions keyed on a canonical request form"""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    @staticmethod
+    def make_key(
+        ingredients: List[str],
+        dietary_preference: str,
+        cuisine_preference: str,
+        previous_recipes: List[str],
+    ) -> str:
+        """Build a cache key that ignores ingredient order, case and duplicates"""
+        canonical = {
+            "ingredients": sorted(
+                {item.strip().lower() for item in ingredients if item.strip()}
+            ),
+            "dietary_preference": dietary_preference.strip().lower(),
+            "cuisine_preference": cuisine_preference.strip().lower(),
+            "previous_recipes": sorted(
+                recipe.strip().lower() for recipe in previous_recipes
+            ),
+        }
+        payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[RecipeGenerationResult]:
+        """Get cached suggestions, recording a hit or miss"""
+        try:
+            value = await self.backend.get(key)
+            if value is not None:
+                value = RecipeGenerationResult.model_validate_json(value)
+        except Exception as e:
+            # A broken cache or stale entry must never fail the request,
+            # treat it as a miss
+            logger.error(f"Recipe cache read failed: {str(e)}")
+            value = None
+
+        if value is None:
+            metrics.increment("recipe_cache.misses")
+            return None
+
+        metrics.increment("recipe_cache.hits")
+        return value
+
+    async def set(self, key: str, value: RecipeGenerationResult) -> None:
+        """Store suggestions in the cache"""
+        try:
+            await self.backend.set(key, value.model_dump_json())
+        except Exception as e:
+            logger.error(f"Recipe cache write failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        """Get hit/miss statistics for the metrics endpoint"""
+        hits = metrics.get("recipe_cache.hits")
+        misses = metrics.get("recipe_cache.misses")
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "size": self.backend.size(),
+        }
+
+
+def _create_backend() -> CacheBackend:
+    """Create the backend selected by RECIPE_CACHE_BACKEND"""
+    if settings.RECIPE_CACHE_BACKEND == "sqlite":
+        return SQLiteBackend(
+            settings.RECIPE_CACHE_URL or "recipe_cache.sqlite3",
+            settings.RECIPE_CACHE_MAX_ENTRIES,
+            settings.RECIPE_CACHE_TTL_SECONDS,
+        )
+    if settings.RECIPE_CACHE_BACKEND == "redis":
+        return RedisBackend(
+            settings.RECIPE_CACHE_URL or "redis://localhost:6379/0",
+            settings.RECIPE_CACHE_TTL_SECONDS,
+        )
+    return MemoryBackend(
+        settings.RECIPE_CACHE_MAX_ENTRIES, settings.RECIPE_CACHE_TTL_SECONDS
+    )
+
+
+recipe_cache = RecipeCache(_create_backend())
+metrics.register_collector("recipe_cache", recipe_cache.stats)
@@ -1,99 +1,187 @@
+import asyncio
+import hashlib
 import json
 import os
 import logging
-from typing import Dict, List, Optional
+import time
+from typing import AsyncIterator, Dict, List, Optional, Type, TypeVar
 
-from google import genai
 from google.genai import types
-from PIL import Image
+from pydantic import BaseModel, ValidationError
 
 from app.config import settings
+from app.schemas.inventory import ExtractedItems
+from app.schemas.recipe import GeneratedRecipe, RecipeGenerationResult
+from app.utils.cache import recipe_cache
+from app.utils.metrics import metrics
+from app.utils.prompts import IMAGE_PROMPT, RECIPE_PROMPT, PromptTemplate
+from app.utils.providers import create_provider
+from app.utils.rate_limit import RateLimitExceeded, upstream_rate_limiter
+from app.utils.resilience import CircuitBreaker, CircuitOpen, Resilience, Upstream
+from app.utils.single_flight import SingleFlight
+from app.utils.streaming import RecipeStreamParser
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini API with API key
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
-model = "gemini-2.0-flash"
+M = TypeVar("M", bound=BaseModel)
 
+# Model backend: Gemini, or recorded responses for offline runs
+provider = create_provider()
 
-def extract_items_from_image(image_data: bytes) -> Dict:
+# Bound the number of in-flight upstream calls in this worker
+_upstream_semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+
+# Identical requests already in flight share one upstream call
+_image_flights = SingleFlight("gemini.extract_items")
+_recipe_flights = SingleFlight("gemini.generate_recipes")
+
+# Deadlines, retries, hedging and fail-fast for all upstream calls
+resilience = Resilience(
+    "llm.resilience",
+    CircuitBreaker(
+        "llm.circuit",
+        window_seconds=settings.LLM_BREAKER_WINDOW_SECONDS,
+        min_calls=settings.LLM_BREAKER_MIN_CALLS,
+        error_rate=settings.LLM_BREAKER_ERROR_RATE,
+        open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+    ),
+)
+metrics.register_collector("llm_circuit", resilience.breaker.stats)
+
+
+def _record_usage(endpoint: str, usage) -> None:
+    """Count the input, cached and output tokens of a call per endpoint"""
+    if usage is None:
+        return
+    metrics.increment(f"llm.{endpoint}.input_tokens", usage.prompt_token_count or 0)
+    metrics.increment(
+        f"llm.{endpoint}.cached_tokens", usage.cached_content_token_count or 0
+    )
+    metrics.increment(
+        f"llm.{endpoint}.output_tokens", usage.candidates_token_count or 0
+    )
+
+
+def _record_call(endpoint: str, variant: str, seconds: float) -> None:
+    metrics.increment("llm.calls")
+    metrics.increment("llm.upstream_seconds", seconds)
+    metrics.increment(f"llm.{endpoint}.calls")
+    metrics.increment(f"llm.{endpoint}.upstream_seconds", seconds)
+    metrics.increment(f"llm.{endpoint}.prompt.{variant}")
+
+
+def _parse(endpoint: str, model: Type[M], text: str) -> Optional[M]:
+    """Parse and validate a response into model in one step, counting failures"""
+    try:
+        return model.model_validate_json(text or "")
+    except ValidationError as e:
+        metrics.increment(f"llm.{endpoint}.parse_failures")
+        logger.error(f"Invalid {endpoint} response: {e}")
+        logger.error(f"Response text: {text}")
+        return None
+
+
+async def _generate_content(
+    endpoint: str, prompt: PromptTemplate, parts: List[types.Part]
+) -> types.GenerateContentResponse:
+    """
+    Call the model through the configured provider
+
+    Each attempt charges the shared upstream quota and waits for a free
+    upstream slot. The resilience layer bounds the whole request by a
+    deadline, retries failed attempts, hedges slow ones and fails fast while
+    the circuit breaker is open; only the provider call itself is timed and
+    counted by the breaker. Time and tokens spent in the provider are
+    counted per endpoint so upstream latency and cost can be told apart from
+    the app's own overhead.
+    """
+
+    async def attempt(upstream: Upstream) -> types.GenerateContentResponse:
+        await upstream_rate_limiter.acquire("gemini")
+        contents, config, variant = await prompt.build(provider, parts)
+
+        async with _upstream_semaphore:
+            started = time.perf_counter()
+            try:
+                response = await upstream(lambda: provider.generate(contents, config))
+            except Exception:
+                # The context cache may have expired or been deleted upstream
+                if variant == "cached":
+                    prompt.invalidate_cache()
+                raise
+            finally:
+                _record_call(endpoint, variant, time.perf_counter() - started)
+
+        _record_usage(endpoint, getattr(response, "usage_metadata", None))
+        return response
+
+    return await resilience.call(endpoint, attempt)
+
+
+async def extract_items_from_image(
+    image_data: bytes, mime_type: str = "image/jpeg"
+) -> ExtractedItems:
     """
     Extract food items from an image using Gemini API
 
+    Concurrent calls with the same image bytes share one upstream call.
+
     Args:
-        image_data: Raw image bytes
+        image_data: Encoded image bytes
+        mime_type: MIME type of image_data
 
     Returns:
-        dict: A dictionary containing status and items list
+        ExtractedItems: The status ("200" or "404") and items list
     """
+    key = f"{mime_type}:{hashlib.sha256(image_data).hexdigest()}"
+    return await _image_flights.do(
+        key, lambda: _request_items_from_image(image_data, mime_type)
+    )
+
+
+async def _request_items_from_image(
+    image_data: bytes, mime_type: str
+) -> ExtractedItems:
+    """Send an image extraction request to Gemini and parse the result"""
     try:
-        # Define the image extraction prompt with examples
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(
-                        text="""You will be given an image. You need to extract all the food items from the image. Basically the image can be their fridge, their shelves or straight up food. Extract all the food items from the image and return them. The output json should have two things.
-1. Status : 200 if food found, 404 no food found
-2. items: list of items
-
-If no food found the items list should be empty.
-Just return the items, no quantity, unit etc, just the items"""
-                    ),
-                ],
-            ),
-            types.Content(
-                role="model",
-                parts=[
-                    types.Part.from_text(
-                        text="""{
-  \"status\": \"404\",
-  \"items\": []
-}"""
-                    ),
-                ],
-            ),
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_bytes(data=image_data, mime_type="image/jpeg"),
-                ],
-            ),
-        ]
-        generate_content_config = types.GenerateContentConfig(
-            response_mime_type="application/json",
-        )
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
+        response = await _generate_content(
+            "extract_items",
+            IMAGE_PROMPT,
+            [types.Part.from_bytes(data=image_data, mime_type=mime_type)],
         )
 
-        # Parse JSON response
-        try:
-            result = json.loads(response.text)
-            logger.info(
-                f"Successfully extracted items: {len(result.get('items', []))} items found"
-            )
-            return result
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {e}")
-            logger.error(f"Response text: {response.text}")
-            return {"status": "404", "items": []}
+        # Parse and validate the response
+        result = _parse("extract_items", ExtractedItems, response.text)
+        if result is None:
+            return ExtractedItems(status="404", items=[])
+        logger.info(f"Successfully extracted items: {len(result.items)} items found")
+        return result
 
+    except (RateLimitExceeded, CircuitOpen):
+        raise
+    except asyncio.TimeoutError:
+        logger.error(
+            f"Gemini call timed out after {settings.LLM_DEADLINE_SECONDS}s in extract_items_from_image"
+        )
+        return ExtractedItems(status="404", items=[])
     except Exception as e:
         logger.error(f"Error in extract_items_from_image: {str(e)}")
-        return {"status": "404", "items": []}
+        return ExtractedItems(status="404", items=[])
+
 
+def _recipe_parts(input_payload: Dict) -> List[types.Part]:
+    """The user parts of a recipe generation request"""
+    return [types.Part.from_text(text=json.dumps(input_payload))]
 
-def generate_recipes(
+
+async def generate_recipes(
     ingredients: List[str],
     dietary_preference: str,
     cuisine_preference: str,
     previous_recipes: List[str] = [],
-) -> Dict:
+) -> RecipeGenerationResult:
     """
     Generate recipe suggestions based on ingredients and preferences
 
@@ -104,185 +192,171 @@ def generate_recipes(
         previous_recipes: List of previously cooked recipes
 
     Returns:
-        dict: A dictionary containing recipe suggestions
+        RecipeGenerationResult: The status (200 or 400) and generated recipes
     """
-    try:
-        # Build the input payload
-        input_payload = {
-            "ingredients": ingredients,
-            "dietary_preference": dietary_preference,
-            "cuisine_preference": cuisine_preference,
-            "previous_recipes": previous_recipes,
-        }
-
-        # Define the recipe generation prompt with examples
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(
-                        text="""You will be given a list of ingredients, dietary preferences (vegan, vegetarian [dairy but no eggs], halal, non-veg, etc.) and preferred cuisine (Indian, Mexican, Japanese, etc.). You will also have a previous recipe made. Return three recipes. Assume the basic things such as water, salt, sugar, ginger, etc., spices and condiments to be available. Two recipes aligning to cuisine preference, one can be a random cuisine. Try to not give the previous recipe, but if there are no ingredients, then you can return the same recipe. If you can make a recipe out of the ingredients but cannot adhere to the cuisine preference, then still return it but make sure to strictly align to dietary preference. If you cannot return three recipes, that's fine—return as many as you can generate, but a maximum of three. You dont need to utilize all the available ingredients, I mean you can use all, or a subset.
-
-Follow these steps in returning the output:
-
-1) 200 if you can at least generate one, 400 if you cannot generate any or the ingredient list has nothing. Make sure, if you cannot generate any recipe to return 400. and 200 if you can generate atleast 1.
-2) First recipe
-    2.1) status 200 if you were able to generate the recipe, 400 if not due to any reason, then keep all other things empty
-    2.2) Recipe name
-    2.3) Short description
-    2.4) ingredient list as needed(make sure available from the original list provided to you), only the ingredients, nothing else such as 1 pound, for garnish etc, just the ingredient list.
-    2.5) approx time to make
-    2.6) Actual step by step recipe.(this should be in extreme detail guiding the user step by step for each task)
-3) Second recipe
-    3.1) status 200 if you were able to generate the recipe, 400 if not due to any reason, then keep all other things empty
-    3.2) Recipe name
-    3.3) Short description
-    3.4) ingredient list as needed(make sure available from the original list provided to you), only the ingredients, nothing else such as 1 pound, for garnish etc, just the ingredient list.
-    3.5) approx time to make
-    3.6) Actual step by step recipe.(this should be in extreme detail guiding the user step by step for each task)
-4) Third recipe
-    4.1) status 200 if you were able to generate the recipe, 400 if not due to any reason, then keep all other things empty
-    4.2) Recipe name
-    4.3) Short description
-    4.4) ingredient list as needed(make sure available from the original list provided to you), only the ingredients, nothing else such as 1 pound, for garnish etc, just the ingredient list.
-    4.5) approx time to make
-    4.6) Actual step by step recipe.(this should be in extreme detail guiding the user step by step for each task)
-
-"""
-                    ),
-                ],
-            ),
-            types.Content(
-                role="model",
-                parts=[
-                    types.Part.from_text(
-                        text="""{
-  \"recipes\": [
-    {
-      \"status\": 200,
-      \"recipe_name\": \"Vegan Chickpea Curry (Chana Masala)\",
-      \"description\": \"A classic Indian vegan curry made with chickpeas in a flavorful tomato-based sauce.\",
-      \"ingredients\": [
-        \"Chickpeas\",
-        \"Tomato\",
-        \"Onion\",
-        \"Garlic\",
-        \"Ginger\",
-        \"Cilantro\",
-        \"Spices\"
-      ],
-      \"approx_time\": \"45 minutes\",
-      \"steps\": [
-        \"Soak chickpeas overnight or use canned chickpeas.\",
-        \"If using dried chickpeas, boil them until tender.\",
-        \"Finely chop onion, garlic, and ginger.\",
-        \"Heat oil in a pot or pan. Add onion and sauté until golden brown.\",
-        \"Add garlic and ginger and sauté for another minute.\",
-        \"Add chopped tomatoes and cook until they soften.\",
-        \"Add spices such as turmeric powder, cumin powder, coriander powder, and garam masala. Adjust spices to your taste.\",
-        \"Add the cooked chickpeas to the sauce.\",
-        \"Add water to adjust the consistency.\",
-        \"Simmer for 20-25 minutes, allowing the flavors to meld together.\",
-        \"Garnish with chopped cilantro.\",
-        \"Serve hot with rice or roti.\"
-      ]
-    },
-    {
-      \"status\": 200,
-      \"recipe_name\": \"Vegan Black Bean Tacos\",
-      \"description\": \"Delicious and easy vegan tacos filled with seasoned black beans and your favorite toppings.\",
-      \"ingredients\": [
-        \"Black Beans\",
-        \"Onion\",
-        \"Garlic\",
-        \"Tomato\",
-        \"Cilantro\",
-        \"Taco Shells\",
-        \"Spices\"
-      ],
-      \"approx_time\": \"30 minutes\",
-      \"steps\": [
-        \"Finely chop onion and garlic.\",
-        \"Heat oil in a pan. Add onion and sauté until translucent.\",
-        \"Add garlic and sauté for another minute.\",
-        \"Add black beans (canned or cooked) to the pan.\",
-        \"Add spices such as cumin powder, chili powder, and smoked paprika.\",
-        \"Mash some of the black beans to create a creamy texture.\",
-        \"Cook for 10-15 minutes, stirring occasionally.\",
-        \"Warm the taco shells according to package directions.\",
-        \"Fill the taco shells with the black bean mixture.\",
-        \"Top with your favorite toppings such as chopped tomatoes, cilantro, and salsa.\",
-        \"Serve immediately.\"
-      ]
-    },
-    {
-      \"status\": 200,
-      \"recipe_name\": \"Vegan Lentil Soup\",
-      \"description\": \"A hearty and nutritious lentil soup perfect for a comforting meal.\",
-      \"ingredients\": [
-        \"Lentils\",
-        \"Onion\",
-        \"Garlic\",
-        \"Tomato\",
-        \"Carrot\",
-        \"Celery\",
-        \"Vegetable Broth\",
-        \"Spices\"
-      ],
-      \"approx_time\": \"50 minutes\",
-      \"steps\": [
-        \"Finely chop onion, garlic, carrot, and celery.\",
-        \"Heat oil in a pot.\",
-        \"Add onion, carrot, and celery and sauté until softened.\",
-        \"Add garlic and sauté for another minute.\",
-        \"Add lentils to the pot.\",
-        \"Add chopped tomatoes and vegetable broth.\",
-        \"Add spices such as cumin powder, coriander powder, and bay leaf.\",
-        \"Bring to a boil, then reduce heat and simmer for 30-40 minutes, or until the lentils are tender.\",
-        \"Remove the bay leaf.\",
-        \"Use an immersion blender to partially blend the soup for a creamier texture (optional).\",
-        \"Season with salt and pepper to taste.\",
-        \"Serve hot with crusty bread.\"
-      ]
+    # The normalized request form keys both the cache and in-flight calls
+    key = recipe_cache.make_key(
+        ingredients, dietary_preference, cuisine_preference, previous_recipes
+    )
+
+    # Serve repeated pantry/preference combinations from the cache
+    if settings.RECIPE_CACHE_ENABLED:
+        cached = await recipe_cache.get(key)
+        if cached is not None:
+            logger.info("Serving recipe suggestions from cache")
+            return cached
+
+    # Build the input payload
+    input_payload = {
+        "ingredients": ingredients,
+        "dietary_preference": dietary_preference,
+        "cuisine_preference": cuisine_preference,
+        "previous_recipes": previous_recipes,
     }
-  ],
-  \"status\": 200
-}"""
-                    ),
-                ],
-            ),
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text=json.dumps(input_payload)),
-                ],
-            ),
-        ]
-        generate_content_config = types.GenerateContentConfig(
-            response_mime_type="application/json",
-            system_instruction=[
-                types.Part.from_text(
-                    text="""You are an expert chef. You know all the recipes in the world. Given the ingredient list, dietary  preference, cuisne preference, you can suggest any recipe keeping in mind these things. You can also change recipes according to availabe ingredients and dietray preference."""
-                ),
-            ],
+
+    return await _recipe_flights.do(key, lambda: _request_recipes(input_payload, key))
+
+
+async def _request_recipes(
+    input_payload: Dict, cache_key: str
+) -> RecipeGenerationResult:
+    """Send a recipe generation request to Gemini, caching a successful result"""
+    try:
+        response = await _generate_content(
+            "generate_recipes", RECIPE_PROMPT, _recipe_parts(input_payload)
+        )
+
+        # Parse and validate the response
+        result = _parse("generate_recipes", RecipeGenerationResult, response.text)
+        if result is None:
+            return RecipeGenerationResult(status=400, recipes=[])
+        logger.info(f"Successfully generated recipes: {result.status}")
+        if settings.RECIPE_CACHE_ENABLED and result.status == 200:
+            await recipe_cache.set(cache_key, result)
+        return result
+
+    except (RateLimitExceeded, CircuitOpen):
+        raise
+    except asyncio.TimeoutError:
+        logger.error(
+            f"Gemini call timed out after {settings.LLM_DEADLINE_SECONDS}s in generate_recipes"
+        )
+        return RecipeGenerationResult(status=400, recipes=[])
+    except Exception as e:
+        logger.error(f"Error in generate_recipes: {str(e)}")
+        return RecipeGenerationResult(status=400, recipes=[])
+
+
+async def stream_recipes(
+    ingredients: List[str],
+    dietary_preference: str,
+    cuisine_preference: str,
+    previous_recipes: List[str] = [],
+) -> AsyncIterator[GeneratedRecipe]:
+    """
+    Stream recipe suggestions, yielding each recipe as soon as it is complete
+
+    Args:
+        ingredients: List of available ingredients
+        dietary_preference: User's dietary preference (vegetarian, vegan, etc.)
+        cuisine_preference: User's preferred cuisine (Italian, Indian, etc.)
+        previous_recipes: List of previously cooked recipes
+
+    Yields:
+        GeneratedRecipe: Each valid recipe, as generate_recipes returns them
+    """
+    cache_key = None
+    if settings.RECIPE_CACHE_ENABLED:
+        cache_key = recipe_cache.make_key(
+            ingredients, dietary_preference, cuisine_preference, previous_recipes
         )
+        cached = await recipe_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving recipe suggestions from cache")
+            for recipe in cached.recipes:
+                yield recipe
+            return
+
+    input_payload = {
+        "ingredients": ingredients,
+        "dietary_preference": dietary_preference,
+        "cuisine_preference": cuisine_preference,
+        "previous_recipes": previous_recipes,
+    }
+    parser = RecipeStreamParser(GeneratedRecipe)
 
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
+    try:
+        # Streams fail fast and keep to the deadline, but aren't retried or
+        # hedged once recipes may have been sent
+        deadline = time.perf_counter() + settings.LLM_DEADLINE_SECONDS
+        resilience.breaker.check()
+        await upstream_rate_limiter.acquire("gemini")
+        contents, config, variant = await RECIPE_PROMPT.build(
+            provider, _recipe_parts(input_payload)
         )
 
-        # Parse JSON response
+        resilience.breaker.allow()
+        stream = provider.generate_stream(contents, config)
+        upstream_seconds = 0.0
+        usage = None
+
+        # An upstream slot is held, and the per-attempt timeout applies, only
+        # while waiting for the next chunk, so a slow client reading the
+        # recipes doesn't keep other calls from going upstream
         try:
-            result = json.loads(response.text)
-            logger.info(f"Successfully generated recipes: {result.get('status')}")
-            return result
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {e}")
-            logger.error(f"Response text: {response.text}")
-            return {"status": 400, "recipes": []}
+            while True:
+                async with _upstream_semaphore:
+                    timeout = min(
+                        settings.GEMINI_TIMEOUT_SECONDS,
+                        deadline - time.perf_counter(),
+                    )
+                    started = time.perf_counter()
+                    try:
+                        chunk = await asyncio.wait_for(
+                            stream.__anext__(), timeout=max(timeout, 0)
+                        )
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        upstream_seconds += time.perf_counter() - started
+
+                # Usage is reported with the final chunks
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                for recipe in parser.feed(chunk.text or ""):
+                    yield recipe
+        except asyncio.TimeoutError as e:
+            resilience.breaker.record_error(e)
+            raise
+        except Exception as e:
+            resilience.breaker.record_error(e)
+            if variant == "cached":
+                RECIPE_PROMPT.invalidate_cache()
+            raise
+        else:
+            resilience.breaker.record(True)
+        finally:
+            await stream.aclose()
+            _record_call("stream_recipes", variant, upstream_seconds)
+            _record_usage("stream_recipes", usage)
+            if parser.failures:
+                metrics.increment("llm.stream_recipes.parse_failures", parser.failures)
 
+    except (RateLimitExceeded, CircuitOpen):
+        raise
+    except asyncio.TimeoutError:
+        logger.error(
+            f"Gemini call timed out after {settings.LLM_DEADLINE_SECONDS}s in stream_recipes"
+        )
+        return
     except Exception as e:
-        logger.error(f"Error in generate_recipes: {str(e)}")
-        return {"status": 400, "recipes": []}
+        logger.error(f"Error in stream_recipes: {str(e)}")
+        return
+
+    # Cache the complete response so the next identical request is instant
+    try:
+        result = RecipeGenerationResult.model_validate_json(parser.text)
+        logger.info(f"Successfully streamed recipes: {result.status}")
+        if cache_key and result.status == 200:
+            await recipe_cache.set(cache_key, result)
+    except ValidationError as e:
+        logger.error(f"Failed to parse streamed JSON response: {e}")
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from cachetools import LRUCache
+from PIL import Image
+
+from app.config import settings
+from app.utils.metrics import metrics
+
+# dHash compares each pixel with its right neighbour on a 9x8 grayscale grid
+HASH_SIZE = 8
+
+
+def dhash_image(image: Image.Image) -> int:
+    """
+    Compute a 64-bit difference hash of a decoded image
+
+    The hash survives re-encoding, resizing and small exposure changes, so a
+    retake of the same fridge shelf lands within a few bits of the original.
+    """
+    small = image.convert("L").resize(
+        (HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS
+    )
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+
+    return value
+
+
+class ImageDedupIndex:
+    """
+    Per-user index of image hashes and the items extracted from them
+
+    Each user keeps their most recently matched max_entries_per_user images
+    and only the max_users most recently active users are kept at all.
+    """
+
+    def __init__(self, max_users: int, max_entries_per_user: int, max_distance: int):
+        self.max_entries_per_user = max_entries_per_user
+        self.max_distance = max_distance
+        self._users = LRUCache(maxsize=max_users)
+        self._lock = threading.Lock()
+
+    def lookup(self, user_id, image_hash: int) -> Optional[List[str]]:
+        """Get the items of the closest stored image within max_distance bits"""
+        with self._lock:
+            entries = self._users.get(user_id)
+            best_hash, best_distance = None, self.max_distance + 1
+
+            if entries:
+                for stored_hash in entries:
+                    distance = (stored_hash ^ image_hash).bit_count()
+                    if distance < best_distance:
+                        best_hash, best_distance = stored_hash, distance
+
+            if best_hash is None:
+                metrics.increment("image_dedup.misses")
+                return None
+
+            entries.move_to_end(best_hash)
+            metrics.increment("image_dedup.hits")
+            return list(entries[best_hash])
+
+    def add(self, user_id, image_hash: int, items: List[str]) -> None:
+        """Store the items extracted from an image"""
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is None:
+                entries = OrderedDict()
+                self._users[user_id] = entries
+
+            entries[image_hash] = list(items)
+            entries.move_to_end(image_hash)
+            while len(entries) > self.max_entries_per_user:
+                entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Get hit rate and size for the metrics endpoint"""
+        hits = metrics.get("image_dedup.hits")
+        misses = metrics.get("image_dedup.misses")
+        lookups = hits + misses
+        with self._lock:
+            entries = sum(len(user_entries) for user_entries in self._users.values())
+            users = len(self._users)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "users": users,
+            "entries": entries,
+        }
+
+
+image_index = ImageDedupIndex(
+    settings.IMAGE_DEDUP_MAX_USERS,
+    settings.IMAGE_DEDUP_MAX_ENTRIES_PER_USER,
+    settings.IMAGE_DEDUP_MAX_DISTANCE,
+)
+metrics.register_collector("image_dedup", image_index.stats)
@@ -0,0 +1,128 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import ExifTags, Image, ImageOps
+
+from app.config import settings
+from app.utils.image_dedup import dhash_image
+from app.utils.metrics import metrics
+from app.utils.storage import thumbnail_path
+
+# Pillow releases the GIL while decoding, resizing and encoding, so a small
+# thread pool keeps this CPU work off the event loop without process overhead
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image"
+)
+
+_OUTPUT_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Formats that can be forwarded as-is when re-encoding doesn't help
+_PASSTHROUGH_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+@dataclass
+class PreparedImage:
+    """An uploaded image re-encoded for the Gemini API"""
+
+    data: bytes
+    mime_type: str
+    original_size: int
+    dhash: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - len(self.data)
+
+
+def save_thumbnail(image: Image.Image, path: str) -> None:
+    """Save a THUMBNAIL_SIZE WebP copy of an oriented image"""
+    size = settings.THUMBNAIL_SIZE
+    thumbnail = image.copy()
+    thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if thumbnail.mode not in ("RGB", "RGBA"):
+        thumbnail = thumbnail.convert("RGB")
+
+    # Write beside the target and rename, so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.{os.getpid()}.partial"
+    thumbnail.save(partial, format="WEBP", quality=settings.THUMBNAIL_QUALITY)
+    os.replace(partial, path)
+    metrics.increment("images.thumbnails")
+
+
+def prepare_image(image_data: bytes, thumbnail: Optional[str] = None) -> PreparedImage:
+    """
+    Decode an upload once and re-encode it compactly
+
+    Applies the EXIF orientation, downscales so the longest edge is at most
+    IMAGE_MAX_EDGE and encodes to IMAGE_FORMAT at IMAGE_QUALITY. Upright
+    originals are kept as-is when re-encoding would not make them smaller.
+    If a thumbnail path is given and no thumbnail exists there yet, one is
+    saved from the same decode.
+    """
+    max_edge = settings.IMAGE_MAX_EDGE
+    output_format = settings.IMAGE_FORMAT.upper()
+
+    with Image.open(io.BytesIO(image_data)) as image:
+        source_format = image.format
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+
+        # Let the JPEG decoder scale down by DCT while decoding
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image_hash = dhash_image(image)
+
+        if thumbnail and not os.path.exists(thumbnail):
+            save_thumbnail(image, thumbnail)
+
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if output_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+
+        buffer = io.BytesIO()
+        image.save(
+            buffer, format=output_format, quality=settings.IMAGE_QUALITY, optimize=True
+        )
+        data = buffer.getvalue()
+
+    if (
+        len(data) >= len(image_data)
+        and orientation == 1
+        and source_format in _PASSTHROUGH_MIME_TYPES
+    ):
+        return PreparedImage(
+            data=image_data,
+            mime_type=_PASSTHROUGH_MIME_TYPES[source_format],
+            original_size=len(image_data),
+            dhash=image_hash,
+        )
+
+    return PreparedImage(
+        data=data,
+        mime_type=_OUTPUT_MIME_TYPES[output_format],
+        original_size=len(image_data),
+        dhash=image_hash,
+    )
+
+
+def prepare_image_file(path: str) -> PreparedImage:
+    """Read a stored upload and prepare it, making its thumbnail on first use"""
+    with open(path, "rb") as f:
+        return prepare_image(f.read(), thumbnail_path(path))
+
+
+async def preprocess_image_file(path: str) -> PreparedImage:
+    """Read and prepare a stored upload in the image worker pool"""
+    loop = asyncio.get_running_loop()
+    prepared = await loop.run_in_executor(_executor, prepare_image_file, path)
+    metrics.increment("images.preprocessed")
+    metrics.increment("images.bytes_saved", prepared.bytes_saved)
+    return prepared
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from uuid import UUID
+
+from sqlalchemy import desc, func, select, update
+
+from app.config import settings
+from app.db.database import SessionLocal
+from app.db.models import ImageJob
+from app.db.queries import insert_inventory_items
+from app.schemas.inventory import ExtractedItems
+from app.utils.gemini import extract_items_from_image
+from app.utils.image_dedup import image_index
+from app.utils.images import preprocess_image_file
+from app.utils.metrics import metrics
+from app.utils.rate_limit import RateLimitExceeded
+from app.utils.resilience import CircuitOpen
+from app.utils.storage import collect_uploads, public_url, thumbnail_path
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobFailed(Exception):
+    """Raised by a job that can't complete, with a message for the user"""
+
+
+async def extract_inventory_from_image(db, user_id: UUID, image_path: str) -> Dict:
+    """
+    Extract food items from a stored image and add them to the inventory
+
+    Returns:
+        dict: The summary reported to the user when the job is done
+    """
+    # Decode, orient, downscale and re-encode the image once
+    try:
+        prepared = await preprocess_image_file(image_path)
+    except Exception as e:
+        logger.warning(f"Could not decode uploaded image: {str(e)}")
+        raise JobFailed("Could not read image")
+
+    logger.info(
+        f"Preprocessed image from {prepared.original_size} to {len(prepared.data)} bytes"
+    )
+
+    # Look for a near-identical image this user already uploaded
+    cached_items = None
+    if settings.IMAGE_DEDUP_ENABLED:
+        cached_items = image_index.lookup(user_id, prepared.dhash)
+
+    # Extract items from image
+    if cached_items is not None:
+        logger.info(f"Reusing items from a near-duplicate image for user {user_id}")
+        result = ExtractedItems(status="200", items=cached_items)
+    else:
+        result = await extract_items_from_image(prepared.data, prepared.mime_type)
+        if settings.IMAGE_DEDUP_ENABLED and result.status != "404":
+            image_index.add(user_id, prepared.dhash, result.items)
+
+    thumbnail_url = public_url(thumbnail_path(image_path))
+
+    if result.status == "404":
+        return {
+            "message": "No food items detected in the image",
+            "items_added": 0,
+            "bytes_saved": prepared.bytes_saved,
+            "thumbnail_url": thumbnail_url,
+        }
+
+    # Add items to inventory
+    items_added = len(await insert_inventory_items(db, user_id, result.items))
+
+    return {
+        "message": f"Inventory updated with {items_added} new items",
+        "items_added": items_added,
+        "total_items_detected": len(result.items),
+        "detected_items": result.items,
+        "bytes_saved": prepared.bytes_saved,
+        "thumbnail_url": thumbnail_url,
+    }
+
+
+class ImageJobQueue:
+    """
+    Runs image extraction jobs on a pool of asyncio workers
+
+    Jobs live in the image_jobs table and only their ids pass through the
+    in-memory queue. A worker claims a job by moving it from pending to
+    running in one UPDATE, so a job enqueued in several processes still runs
+    once, and jobs left pending or stuck running are picked up again when
+    the queue starts.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._queue: asyncio.Queue = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, job_id: UUID) -> None:
+        self._queue.put_nowait(job_id)
+        metrics.increment("image_jobs.enqueued")
+
+    async def _recover(self) -> None:
+        """Requeue pending jobs and running jobs whose worker went away"""
+        stale = datetime.now(timezone.utc) - timedelta(
+            seconds=settings.IMAGE_JOB_STALE_SECONDS
+        )
+        async with SessionLocal() as db:
+            await db.execute(
+                update(ImageJob)
+                .where(ImageJob.status == RUNNING, ImageJob.updated_at < stale)
+                .values(status=PENDING)
+            )
+            job_ids = (
+                await db.scalars(
+                    select(ImageJob.job_id)
+                    .where(ImageJob.status == PENDING)
+                    .order_by(ImageJob.created_at)
+                )
+            ).all()
+            await db.commit()
+
+        for job_id in job_ids:
+            self.enqueue(job_id)
+        if job_ids:
+            logger.info(f"Requeued {len(job_ids)} image jobs")
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Image job {job_id} crashed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: UUID) -> None:
+        async with SessionLocal() as db:
+            claimed = (
+                await db.execute(
+                    update(ImageJob)
+                    .where(ImageJob.job_id == job_id, ImageJob.status == PENDING)
+                    .values(status=RUNNING, attempts=ImageJob.attempts + 1)
+                    .returning(ImageJob.user_id, ImageJob.image_path)
+                )
+            ).first()
+            await db.commit()
+
+            # Another worker or process got to it first
+            if claimed is None:
+                return
+
+            user_id, image_path = claimed
+            try:
+                result = await extract_inventory_from_image(db, user_id, image_path)
+            except (RateLimitExceeded, CircuitOpen) as e:
+                # The shared Gemini quota is spent or Gemini is failing; try
+                # again once the quota refills or the circuit lets calls through
+                await db.rollback()
+                await self._finish(db, job_id, status=PENDING)
+                asyncio.get_running_loop().call_later(
+                    e.retry_after, self.enqueue, job_id
+                )
+                metrics.increment("image_jobs.deferred")
+                return
+            except JobFailed as e:
+                await db.rollback()
+                await self._finish(db, job_id, status=FAILED, error=str(e))
+                metrics.increment("image_jobs.failed")
+                return
+            except Exception as e:
+                logger.error(f"Image job {job_id} failed: {str(e)}")
+                await db.rollback()
+                await self._finish(
+                    db, job_id, status=FAILED, error="Failed to process image"
+                )
+                metrics.increment("image_jobs.failed")
+                return
+
+            # The inventory rows and the job result commit together
+            await self._finish(db, job_id, status=DONE, result=result)
+            metrics.increment("image_jobs.done")
+
+    @staticmethod
+    async def _finish(db, job_id: UUID, **values) -> None:
+        await db.execute(
+            update(ImageJob).where(ImageJob.job_id == job_id).values(**values)
+        )
+        await db.commit()
+
+    def stats(self) -> Dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+
+async def collect_upload_garbage() -> None:
+    """Apply the upload retention age and per-user quota"""
+    async with SessionLocal() as db:
+        last_used = func.max(ImageJob.created_at).label("last_used")
+        owners = (
+            await db.execute(
+                select(ImageJob.user_id, ImageJob.image_path)
+                .group_by(ImageJob.user_id, ImageJob.image_path)
+                .order_by(desc(last_used))
+            )
+        ).all()
+        in_use = set(
+            await db.scalars(
+                select(ImageJob.image_path).where(
+                    ImageJob.status.in_([PENDING, RUNNING])
+                )
+            )
+        )
+
+    deleted = await asyncio.to_thread(collect_uploads, owners, in_use)
+    metrics.increment("uploads.gc_files", deleted["files"])
+    metrics.increment("uploads.gc_bytes", deleted["bytes"])
+    if deleted["files"]:
+        logger.info(
+            f"Deleted {deleted['files']} stored uploads ({deleted['bytes']} bytes)"
+        )
+
+
+async def collect_upload_garbage_periodically() -> None:
+    """Run the upload retention job every UPLOAD_GC_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await collect_upload_garbage()
+        except Exception as e:
+            logger.error(f"Failed to collect stored uploads: {e}")
+        await asyncio.sleep(settings.UPLOAD_GC_INTERVAL_SECONDS)
+
+
+image_jobs = ImageJobQueue(settings.IMAGE_JOB_WORKERS)
+metrics.register_collector("image_jobs", image_jobs.stats)
@@ -0,0 +1,44 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+
+class Metrics:
+    """
+    In-process counters shared by the utility modules
+
+    Components increment named counters and may register a collector that
+    reports derived values (sizes, rates) when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(int)
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Increment a named counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        """Get the current value of a counter"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def register_collector(self, name: str, collector: Callable[[], Dict]) -> None:
+        """Register a callable whose result is included in snapshots"""
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict:
+        """Get all counters plus the output of every registered collector"""
+        with self._lock:
+            result = {"counters": dict(self._counters)}
+
+        for name, collector in self._collectors.items():
+            result[name] = collector()
+
+        return result
+
+
+metrics = Metrics()
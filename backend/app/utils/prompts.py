@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple, Type
+
+from google.genai import types
+from pydantic import BaseModel
+
+from app.config import settings
+from app.schemas.inventory import ExtractedItems
+from app.schemas.recipe import RecipeGenerationResult
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_INSTRUCTION = """You will be given an image. You need to extract all the food items from the image. Basically the image can be their fridge, their shelves or straight up food. Extract all the food items from the image and return them. The output json should have two things.
+1. Status : 200 if food found, 404 no food found
+2. items: list of items
+
+If no food found the items list should be empty.
+Just return the items, no quantity, unit etc, just the items"""
+
+IMAGE_EXAMPLE = """{
+  \"status\": \"404\",
+  \"items\": []
+}"""
+
+COMPACT_IMAGE_INSTRUCTION = """List every food item in the image (a fridge, shelves or food). Names only, no quantities or units.
+Reply as JSON: {"status": "200" if any food is found else "404", "items": [item names]}"""
+
+RECIPE_SYSTEM_INSTRUCTION = """You are an expert chef. You know all the recipes in the world. Given the ingredient list, dietary  preference, cuisne preference, you can suggest any recipe keeping in mind these things. You can also change recipes according to availabe ingredients and dietray preference."""
+
+RECIPE_INSTRUCTION = """You will be given a list of ingredients, dietary preferences (vegan, vegetarian [dairy but no eggs], halal, non-veg, etc.) and preferred cuisine (Indian, Mexican, Japanese, etc.). You will also have a previous recipe made. Return three recipes. Assume the basic things such as water, salt, sugar, ginger, etc., spices and condiments to be available. Two recipes aligning to cuisine preference, one can be a random cuisine. Try to not give the previous recipe, but if there are no ingredients, then you can return the same recipe. If you can make a recipe out of the ingredients but cannot adhere to the cuisine preference, then still return it but make sure to strictly align to dietary preference. If you cannot return three recipes, that's fine—return as many as you can generate, but a maximum of three. You dont need to utilize all the available ingredients, I mean you can use all, or a subset.
+
+Follow these steps in returning the output:
+
+1) 200 if you can at least generate one, 400 if you cannot generate any or the ingredient list has nothing. Make sure, if you cannot generate any recipe to return 400. and 200 if you can generate atleast 1.
+2) First recipe
+    2.1) status 200 if you were able to generate the recipe, 400 if not due to any reason, then keep all other things empty
+    2.2) Recipe name
+    2.3) Short description
+    2.4) ingredient list as needed(make sure available from the original list provided to you), only the ingredients, nothing else such as 1 pound, for garnish etc, just the ingredient list.
+    2.5) approx time to make
+    2.6) Actual step by step recipe.(this should be in extreme detail guiding the user step by step for each task)
+3) Second recipe
+    3.1) status 200 if you were able to generate the recipe, 400 if not due to any reason, then keep all other things empty
+    3.2) Recipe name
+    3.3) Short description
+    3.4) ingredient list as needed(make sure available from the original list provided to you), only the ingredients, nothing else such as 1 pound, for garnish etc, just the ingredient list.
+    3.5) approx time to make
+    3.6) Actual step by step recipe.(this should be in extreme detail guiding the user step by step for each task)
+4) Third recipe
+    4.1) status 200 if you were able to generate the recipe, 400 if not due to any reason, then keep all other things empty
+    4.2) Recipe name
+    4.3) Short description
+    4.4) ingredient list as needed(make sure available from the original list provided to you), only the ingredients, nothing else such as 1 pound, for garnish etc, just the ingredient list.
+    4.5) approx time to make
+    4.6) Actual step by step recipe.(this should be in extreme detail guiding the user step by step for each task)
+
+"""
+
+RECIPE_EXAMPLE = """{
+  \"recipes\": [
+    {
+      \"status\": 200,
+      \"recipe_name\": \"Vegan Chickpea Curry (Chana Masala)\",
+      \"description\": \"A classic Indian vegan curry made with chickpeas in a flavorful tomato-based sauce.\",
+      \"ingredients\": [
+        \"Chickpeas\",
+        \"Tomato\",
+        \"Onion\",
+        \"Garlic\",
+        \"Ginger\",
+        \"Cilantro\",
+        \"Spices\"
+      ],
+      \"approx_time\": \"45 minutes\",
+      \"steps\": [
+        \"Soak chickpeas overnight or use canned chickpeas.\",
+        \"If using dried chickpeas, boil them until tender.\",
+        \"Finely chop onion, garlic, and ginger.\",
+        \"Heat oil in a pot or pan. Add onion and sauté until golden brown.\",
+        \"Add garlic and ginger and sauté for another minute.\",
+        \"Add chopped tomatoes and cook until they soften.\",
+        \"Add spices such as turmeric powder, cumin powder, coriander powder, and garam masala. Adjust spices to your taste.\",
+        \"Add the cooked chickpeas to the sauce.\",
+        \"Add water to adjust the consistency.\",
+        \"Simmer for 20-25 minutes, allowing the flavors to meld together.\",
+        \"Garnish with chopped cilantro.\",
+        \"Serve hot with rice or roti.\"
+      ]
+    },
+    {
+      \"status\": 200,
+      \"recipe_name\": \"Vegan Black Bean Tacos\",
+      \"description\": \"Delicious and easy vegan tacos filled with seasoned black beans and your favorite toppings.\",
+      \"ingredients\": [
+        \"Black Beans\",
+        \"Onion\",
+        \"Garlic\",
+        \"Tomato\",
+        \"Cilantro\",
+        \"Taco Shells\",
+        \"Spices\"
+      ],
+      \"approx_time\": \"30 minutes\",
+      \"steps\": [
+        \"Finely chop onion and garlic.\",
+        \"Heat oil in a pan. Add onion and sauté until translucent.\",
+        \"Add garlic and sauté for another minute.\",
+        \"Add black beans (canned or cooked) to the pan.\",
+        \"Add spices such as cumin powder, chili powder, and smoked paprika.\",
+        \"Mash some of the black beans to create a creamy texture.\",
+        \"Cook for 10-15 minutes, stirring occasionally.\",
+        \"Warm the taco shells according to package directions.\",
+        \"Fill the taco shells with the black bean mixture.\",
+        \"Top with your favorite toppings such as chopped tomatoes, cilantro, and salsa.\",
+        \"Serve immediately.\"
+      ]
+    },
+    {
+      \"status\": 200,
+      \"recipe_name\": \"Vegan Lentil Soup\",
+      \"description\": \"A hearty and nutritious lentil soup perfect for a comforting meal.\",
+      \"ingredients\": [
+        \"Lentils\",
+        \"Onion\",
+        \"Garlic\",
+        \"Tomato\",
+        \"Carrot\",
+        \"Celery\",
+        \"Vegetable Broth\",
+        \"Spices\"
+      ],
+      \"approx_time\": \"50 minutes\",
+      \"steps\": [
+        \"Finely chop onion, garlic, carrot, and celery.\",
+        \"Heat oil in a pot.\",
+        \"Add onion, carrot, and celery and sauté until softened.\",
+        \"Add garlic and sauté for another minute.\",
+        \"Add lentils to the pot.\",
+        \"Add chopped tomatoes and vegetable broth.\",
+        \"Add spices such as cumin powder, coriander powder, and bay leaf.\",
+        \"Bring to a boil, then reduce heat and simmer for 30-40 minutes, or until the lentils are tender.\",
+        \"Remove the bay leaf.\",
+        \"Use an immersion blender to partially blend the soup for a creamier texture (optional).\",
+        \"Season with salt and pepper to taste.\",
+        \"Serve hot with crusty bread.\"
+      ]
+    }
+  ],
+  \"status\": 200
+}"""
+
+COMPACT_RECIPE_INSTRUCTION = """You are an expert chef. The user sends JSON with ingredients, dietary_preference, cuisine_preference and previous_recipes. Suggest up to three recipes using any subset of the ingredients; water, salt, sugar, ginger, spices and condiments are always available. Strictly follow the dietary preference (vegetarian means dairy but no eggs). Two recipes should match the cuisine preference, one may be any cuisine. Avoid previous recipes unless nothing else is possible.
+Reply as JSON: {"status": 200 if at least one recipe else 400, "recipes": [{"status": 200, "recipe_name": "...", "description": "one sentence", "ingredients": ["names only, from the list"], "approx_time": "30 minutes", "steps": ["detailed step by step instructions"]}]}"""
+
+
+def _text(role: str, text: str) -> types.Content:
+    return types.Content(role=role, parts=[types.Part.from_text(text=text)])
+
+
+def _instruction(text: str) -> types.Content:
+    return types.Content(parts=[types.Part.from_text(text=text)])
+
+
+class PromptTemplate:
+    """
+    A static few-shot prompt prefix, built once and reused for every request
+
+    With GEMINI_CONTEXT_CACHE_ENABLED and a provider that supports it, the
+    full prefix is stored as a Gemini context cache and requests only send
+    their own parts. Otherwise requests send the compact variant of the
+    prefix, or the full one if GEMINI_COMPACT_PROMPTS is off. A cache that
+    can't be created is retried after GEMINI_CONTEXT_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prefix: List[types.Content],
+        compact_prefix: List[types.Content],
+        system_instruction: Optional[str] = None,
+        compact_system_instruction: Optional[str] = None,
+        response_schema: Optional[Type[BaseModel]] = None,
+    ):
+        self.name = name
+        self.response_schema = response_schema
+        self.prefix = tuple(prefix)
+        self.compact_prefix = tuple(compact_prefix)
+        self.system_instruction = (
+            _instruction(system_instruction) if system_instruction else None
+        )
+        self.config = self._config(system_instruction=self.system_instruction)
+        self.compact_config = self._config(
+            system_instruction=(
+                _instruction(compact_system_instruction)
+                if compact_system_instruction
+                else None
+            )
+        )
+
+        self._cache_name: Optional[str] = None
+        self._cache_config: Optional[types.GenerateContentConfig] = None
+        self._cache_expires_at = 0.0
+        self._cache_retry_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _config(self, **kwargs) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=self.response_schema,
+            **kwargs,
+        )
+
+    async def _cached_content(self, provider) -> Optional[str]:
+        """The name of a live context cache for the prefix, creating one if needed"""
+        ttl = settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+        now = time.monotonic()
+        # Replace the cache a minute before it expires upstream
+        if self._cache_name and now < self._cache_expires_at - 60:
+            return self._cache_name
+        if now < self._cache_retry_at:
+            return None
+
+        async with self._lock:
+            now = time.monotonic()
+            if self._cache_name and now < self._cache_expires_at - 60:
+                return self._cache_name
+            if now < self._cache_retry_at:
+                return None
+
+            try:
+                name = await provider.create_cache(
+                    list(self.prefix), self.system_instruction, ttl
+                )
+            except Exception as e:
+                logger.warning(f"Could not cache the {self.name} prompt: {str(e)}")
+                name = None
+
+            if name is None:
+                self._cache_name = None
+                self._cache_retry_at = now + ttl
+                return None
+
+            self._cache_name = name
+            self._cache_config = self._config(cached_content=name)
+            self._cache_expires_at = now + ttl
+            metrics.increment(f"prompts.{self.name}.caches_created")
+            return name
+
+    def invalidate_cache(self) -> None:
+        """Stop using the current context cache, e.g. after a request failed"""
+        self._cache_name = None
+        self._cache_expires_at = 0.0
+
+    async def build(
+        self, provider, parts: List[types.Part]
+    ) -> Tuple[List[types.Content], types.GenerateContentConfig, str]:
+        """
+        Build the contents and config for a request ending in the given user parts
+
+        Returns:
+            tuple: Contents, config and the prompt variant used (cached,
+            compact or full)
+        """
+        request = types.Content(role="user", parts=parts)
+
+        if settings.GEMINI_CONTEXT_CACHE_ENABLED:
+            if await self._cached_content(provider):
+                return [request], self._cache_config, "cached"
+
+        if settings.GEMINI_COMPACT_PROMPTS:
+            return [*self.compact_prefix, request], self.compact_config, "compact"
+
+        return [*self.prefix, request], self.config, "full"
+
+
+IMAGE_PROMPT = PromptTemplate(
+    "extract_items",
+    prefix=[_text("user", IMAGE_INSTRUCTION), _text("model", IMAGE_EXAMPLE)],
+    compact_prefix=[],
+    compact_system_instruction=COMPACT_IMAGE_INSTRUCTION,
+    response_schema=ExtractedItems,
+)
+
+RECIPE_PROMPT = PromptTemplate(
+    "generate_recipes",
+    prefix=[_text("user", RECIPE_INSTRUCTION), _text("model", RECIPE_EXAMPLE)],
+    compact_prefix=[],
+    system_instruction=RECIPE_SYSTEM_INSTRUCTION,
+    compact_system_instruction=COMPACT_RECIPE_INSTRUCTION,
+    response_schema=RecipeGenerationResult,
+)
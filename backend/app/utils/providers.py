@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import AsyncIterator, Dict, List, Optional
+
+from google import genai
+from google.genai import types
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """Raised when a provider can't produce a response"""
+
+
+class ProviderResponse:
+    """A response from a provider without a native response object"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class LLMProvider(ABC):
+    """
+    Interface for the model backends behind the Gemini service layer
+
+    Both methods take google-genai contents and config. generate returns an
+    object with a .text attribute, and optionally .usage_metadata with token
+    counts; generate_stream yields such objects for each chunk of the
+    response.
+    """
+
+    @abstractmethod
+    async def generate(
+        self, contents: List[types.Content], config: types.GenerateContentConfig
+    ):
+        """Get the whole response to a request"""
+
+    @abstractmethod
+    def generate_stream(
+        self, contents: List[types.Content], config: types.GenerateContentConfig
+    ) -> AsyncIterator:
+        """Get the response to a request chunk by chunk"""
+
+    async def create_cache(
+        self,
+        contents: List[types.Content],
+        system_instruction: Optional[types.Content],
+        ttl_seconds: int,
+    ) -> Optional[str]:
+        """Store a prompt prefix upstream, returning its name, or None if unsupported"""
+        return None
+
+
+class GeminiProvider(LLMProvider):
+    """Calls the Gemini API through the google-genai async client"""
+
+    def __init__(self, model: str, api_key: str = "", client=None):
+        self.model = model
+        self.client = client or genai.Client(api_key=api_key)
+
+    async def generate(self, contents, config):
+        return await self.client.aio.models.generate_content(
+            model=self.model, contents=contents, config=config
+        )
+
+    async def generate_stream(self, contents, config):
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=contents, config=config
+        )
+        async for chunk in stream:
+            yield chunk
+
+    async def create_cache(self, contents, system_instruction, ttl_seconds):
+        cache = await self.client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                contents=contents,
+                system_instruction=system_instruction,
+                ttl=f"{ttl_seconds}s",
+            ),
+        )
+        return cache.name
+
+
+def describe_request(contents: List[types.Content], config) -> Dict:
+    """Serialize a request for recording, replacing inline image data with its hash"""
+
+    def describe_part(part: types.Part) -> Dict:
+        if part.inline_data is not None:
+            return {
+                "inline_data": {
+                    "mime_type": part.inline_data.mime_type,
+                    "sha256": hashlib.sha256(part.inline_data.data).hexdigest(),
+                    "size": len(part.inline_data.data),
+                }
+            }
+        return {"text": part.text}
+
+    return {
+        "contents": [
+            {"role": content.role, "parts": [describe_part(p) for p in content.parts]}
+            for content in contents
+        ],
+        "config": describe_config(config) if config else None,
+    }
+
+
+def describe_config(config: types.GenerateContentConfig) -> Dict:
+    """Serialize a generation config, representing a model class by its JSON schema"""
+    described = config.model_dump(
+        mode="json", exclude_none=True, exclude={"response_schema"}
+    )
+    if config.response_schema is not None:
+        # Response schemas are pydantic model classes in this app
+        described["response_schema"] = config.response_schema.model_json_schema()
+    return described
+
+
+def request_key(request: Dict) -> str:
+    return hashlib.sha256(
+        json.dumps(request, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def request_kind(request: Dict) -> str:
+    """Group requests so replay can substitute one recording for another"""
+    for content in request["contents"]:
+        if any("inline_data" in part for part in content["parts"]):
+            return "image"
+    return "text"
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Passes requests to another provider and appends each exchange to a file
+
+    Every line of the JSONL file holds the request, the response text (and
+    chunks for streams), the upstream latency and any error, in the format
+    ReplayProvider reads.
+    """
+
+    def __init__(self, inner: LLMProvider, path: str):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _append(self, record: Dict) -> None:
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def _record(self, request: Dict, started: float, **fields) -> None:
+        record = {
+            "key": request_key(request),
+            "kind": request_kind(request),
+            "request": request,
+            "latency": round(time.perf_counter() - started, 4),
+            **fields,
+        }
+        try:
+            await asyncio.to_thread(self._append, record)
+        except OSError as e:
+            logger.error(f"Failed to record LLM exchange: {str(e)}")
+
+    async def create_cache(self, contents, system_instruction, ttl_seconds):
+        return await self.inner.create_cache(contents, system_instruction, ttl_seconds)
+
+    async def generate(self, contents, config):
+        request = describe_request(contents, config)
+        started = time.perf_counter()
+        try:
+            response = await self.inner.generate(contents, config)
+        except Exception as e:
+            await self._record(request, started, text=None, error=str(e))
+            raise
+
+        await self._record(request, started, text=response.text, error=None)
+        return response
+
+    async def generate_stream(self, contents, config):
+        request = describe_request(contents, config)
+        started = time.perf_counter()
+        chunks = []
+        try:
+            async for chunk in self.inner.generate_stream(contents, config):
+                chunks.append(chunk.text or "")
+                yield chunk
+        except Exception as e:
+            await self._record(request, started, text=None, chunks=chunks, error=str(e))
+            raise
+
+        await self._record(
+            request, started, text="".join(chunks), chunks=chunks, error=None
+        )
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Serves recorded exchanges instead of calling an upstream model
+
+    A request is answered with a recording of the same request if there is
+    one, otherwise with a random recording of the same kind (text or image),
+    so traffic with new pantries can still be replayed. Responses take the
+    recorded latency unless a fixed latency is given, and error_rate injects
+    failures on top of any recorded ones.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        latency: Optional[float] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._by_key: Dict[str, List[Dict]] = defaultdict(list)
+        self._by_kind: Dict[str, List[Dict]] = defaultdict(list)
+        self._next: Dict[str, int] = defaultdict(int)
+
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._by_key[record["key"]].append(record)
+                    self._by_kind[record["kind"]].append(record)
+
+        logger.info(f"Loaded {sum(map(len, self._by_kind.values()))} LLM recordings")
+
+    def _pick(self, contents, config) -> Dict:
+        request = describe_request(contents, config)
+        key = request_key(request)
+
+        # Cycle through the recordings of an identical request
+        records = self._by_key.get(key)
+        if records:
+            record = records[self._next[key] % len(records)]
+            self._next[key] += 1
+            return record
+
+        candidates = self._by_kind.get(request_kind(request))
+        if not candidates:
+            raise ProviderError("No recording matches the request")
+        return self._random.choice(candidates)
+
+    def _latency(self, record: Dict) -> float:
+        return record["latency"] if self.latency is None else self.latency
+
+    def _maybe_fail(self, record: Dict) -> None:
+        if record.get("error"):
+            raise ProviderError(f"Recorded error: {record['error']}")
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise ProviderError("Injected error")
+
+    async def generate(self, contents, config):
+        record = self._pick(contents, config)
+        await asyncio.sleep(self._latency(record))
+        self._maybe_fail(record)
+        return ProviderResponse(record["text"])
+
+    async def generate_stream(self, contents, config):
+        record = self._pick(contents, config)
+        chunks = record.get("chunks") or [record["text"] or ""]
+        delay = self._latency(record) / len(chunks)
+
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield ProviderResponse(chunk)
+        self._maybe_fail(record)
+
+
+def create_provider() -> LLMProvider:
+    """Create the provider selected by LLM_PROVIDER, recording if LLM_RECORD_PATH is set"""
+    if settings.LLM_PROVIDER == "replay":
+        provider = ReplayProvider(
+            settings.LLM_REPLAY_PATH,
+            latency=settings.LLM_REPLAY_LATENCY_SECONDS,
+            error_rate=settings.LLM_REPLAY_ERROR_RATE,
+        )
+    else:
+        provider = GeminiProvider(settings.GEMINI_MODEL, settings.GEMINI_API_KEY)
+
+    if settings.LLM_RECORD_PATH:
+        provider = RecordingProvider(provider, settings.LLM_RECORD_PATH)
+
+    return provider
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from cachetools import TTLCache
+from fastapi import Depends, Request
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.schemas.user import UserProfile
+from app.utils.metrics import metrics
+from app.utils.security import get_current_user
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+
+
+@dataclass(frozen=True)
+class Rate:
+    """A token bucket holding up to capacity tokens, refilled evenly over period seconds"""
+
+    capacity: int
+    period: int
+
+    @property
+    def refill_per_second(self) -> float:
+        return self.capacity / self.period
+
+
+def parse_rates(spec: str) -> List[Rate]:
+    """Parse a limit string such as "5/minute;500/day" into bucket rates"""
+    rates = []
+    for part in spec.split(";"):
+        count, _, unit = part.strip().partition("/")
+        rates.append(Rate(capacity=int(count), period=_PERIODS[unit.strip()]))
+    return rates
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a bucket is empty, carrying the seconds until a token is free"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def _take_tokens(
+    states: Sequence[Optional[Tuple[float, float]]],
+    rates: Sequence[Rate],
+    now: float,
+) -> Tuple[float, List[Tuple[float, float]]]:
+    """
+    Refill each bucket and take one token from all of them
+
+    Returns the seconds to wait (0 if the tokens were taken) and the new
+    (tokens, updated_at) state of every bucket. Nothing is taken unless every
+    bucket has a token.
+    """
+    refilled = []
+    wait = 0.0
+    for state, rate in zip(states, rates):
+        tokens, updated_at = state if state is not None else (rate.capacity, now)
+        tokens = min(
+            rate.capacity,
+            tokens + max(0.0, now - updated_at) * rate.refill_per_second,
+        )
+        refilled.append(tokens)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / rate.refill_per_second)
+
+    if wait > 0:
+        return wait, [(tokens, now) for tokens in refilled]
+    return 0.0, [(tokens - 1, now) for tokens in refilled]
+
+
+class BucketStore(ABC):
+    """Interface for token bucket storage backends"""
+
+    @abstractmethod
+    async def take(self, keys: List[str], rates: List[Rate]) -> float:
+        """
+        Atomically take one token from each bucket
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they will be
+        """
+
+
+class MemoryBucketStore(BucketStore):
+    """Per-process buckets, only correct with a single worker"""
+
+    def __init__(self, max_entries: int = 100_000):
+        # A bucket left alone for a day is full again and can be forgotten
+        self._buckets = TTLCache(maxsize=max_entries, ttl=_PERIODS["day"])
+        self._lock = threading.Lock()
+
+    async def take(self, keys: List[str], rates: List[Rate]) -> float:
+        with self._lock:
+            wait, states = _take_tokens(
+                [self._buckets.get(key) for key in keys], rates, time.time()
+            )
+            if wait == 0:
+                for key, state in zip(keys, states):
+                    self._buckets[key] = state
+            return wait
+
+
+class SQLiteBucketStore(BucketStore):
+    """
+    Buckets in a SQLite file shared by all workers on the same host
+
+    Each take runs in a BEGIN IMMEDIATE transaction, so concurrent workers
+    serialize on the database write lock.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=5, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+
+    def _take(self, keys: List[str], rates: List[Rate]) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                rows = dict(
+                    (key, (tokens, updated_at))
+                    for key, tokens, updated_at in self._conn.execute(
+                        f"SELECT key, tokens, updated_at FROM rate_limit_buckets WHERE key IN ({','.join('?' * len(keys))})",
+                        keys,
+                    )
+                )
+                wait, states = _take_tokens([rows.get(key) for key in keys], rates, now)
+                if wait == 0:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO rate_limit_buckets VALUES (?, ?, ?)",
+                        [(key, *state) for key, state in zip(keys, states)],
+                    )
+                self._conn.execute("COMMIT")
+                return wait
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def take(self, keys: List[str], rates: List[Rate]) -> float:
+        return await asyncio.to_thread(self._take, keys, rates)
+
+
+class RedisBucketStore(BucketStore):
+    """
+    Buckets in any Redis-protocol server, shared by all workers and hosts
+
+    The refill-and-take runs as one Lua script against the server clock, so
+    it is atomic across clients. Any client object with a redis-py style
+    async eval() can be passed in place of a URL.
+    """
+
+    key_prefix = "stockchef:rate-limit:"
+
+    # KEYS: bucket keys; ARGV: capacity and refill per second for each key
+    _script = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[2 * i - 1])
+  local rate = tonumber(ARGV[2 * i])
+  local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+  local available = tonumber(state[1]) or capacity
+  local updated_at = tonumber(state[2]) or now
+  available = math.min(capacity, available + math.max(0, now - updated_at) * rate)
+  tokens[i] = available
+  if available < 1 then
+    wait = math.max(wait, (1 - available) / rate)
+  end
+end
+if wait > 0 then
+  return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[2 * i - 1])
+  local rate = tonumber(ARGV[2 * i])
+  redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'updated_at', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(capacity / rate))
+end
+return '0'
+"""
+
+    def __init__(self, url: Optional[str] = None, client=None):
+        if client is None:
+            # Imported lazily so the other stores don't need redis installed
+            import redis.asyncio as redis
+
+            client = redis.from_url(url)
+        self._client = client
+
+    async def take(self, keys: List[str], rates: List[Rate]) -> float:
+        args = []
+        for rate in rates:
+            args += [rate.capacity, rate.refill_per_second]
+        wait = await self._client.eval(
+            self._script, len(keys), *[self.key_prefix + key for key in keys], *args
+        )
+        return float(wait)
+
+
+class RateLimiter:
+    """A set of token buckets applied together to each key"""
+
+    def __init__(self, store: BucketStore, name: str, rates: List[Rate]):
+        self.store = store
+        self.name = name
+        self.rates = rates
+
+    async def acquire(self, key: str) -> None:
+        """Take a token for key, raising RateLimitExceeded if any bucket is empty"""
+        keys = [f"{self.name}:{key}:{rate.period}" for rate in self.rates]
+        try:
+            wait = await self.store.take(keys, self.rates)
+        except Exception as e:
+            # A broken store must not take the API down with it, so fail open
+            logger.error(f"Rate limit store failed for {self.name}: {str(e)}")
+            metrics.increment(f"rate_limit.{self.name}.errors")
+            return
+
+        if wait > 0:
+            metrics.increment(f"rate_limit.{self.name}.rejected")
+            raise RateLimitExceeded(wait)
+
+
+def _create_store() -> BucketStore:
+    """Create the store selected by RATE_LIMIT_BACKEND"""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisBucketStore(settings.RATE_LIMIT_URL or "redis://localhost:6379/0")
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryBucketStore()
+    return SQLiteBucketStore(settings.RATE_LIMIT_URL or "rate_limits.sqlite3")
+
+
+_store = _create_store()
+
+# Gemini-backed endpoints, per authenticated user
+user_rate_limiter = RateLimiter(
+    _store, "user", parse_rates(settings.GEMINI_API_RATE_LIMIT)
+)
+
+# Calls that actually reach Gemini, across all users and workers
+upstream_rate_limiter = RateLimiter(
+    _store, "upstream", parse_rates(settings.GEMINI_UPSTREAM_RATE_LIMIT)
+)
+
+
+async def limit_gemini_requests(
+    current_user: UserProfile = Depends(get_current_user),
+) -> None:
+    """Dependency that charges the current user's Gemini request buckets"""
+    await user_rate_limiter.acquire(str(current_user.user_id))
+
+
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """Answer with 429 and the number of seconds to wait"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Rate limit exceeded, please try again later"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
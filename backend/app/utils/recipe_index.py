@@ -0,0 +1,211 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.db.database import SessionLocal
+from app.db.models import (
+    Cuisine,
+    DietaryPreference,
+    RecipeIngredient,
+    UserRecipeHistory,
+    normalize_item_name,
+    user_dietary_preferences,
+    user_preferred_cuisines,
+)
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def dietary_tag(name: str) -> str:
+    return f"dietary:{name.strip().lower()}"
+
+
+def cuisine_tag(name: str) -> str:
+    return f"cuisine:{name.strip().lower()}"
+
+
+class RecipeIndex:
+    """
+    In-memory retrieval index over the stored recipes
+
+    Each recipe is a row in a bitset matrix with one bit per known ingredient,
+    and an inverted index maps each ingredient to the rows that use it. A
+    search gathers the candidate rows from the pantry's postings and scores
+    them all at once by coverage: the share of a recipe's ingredients that
+    are in the pantry.
+
+    Recipes are tagged with the dietary preference and cuisine of the users
+    who saved them, since recipes carry no tags of their own. Mutations never
+    await, so the index needs no lock within the event loop.
+    """
+
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._postings: Dict[int, Set[int]] = defaultdict(set)
+        self._rows: Dict[int, int] = {}
+        self._recipe_ids = np.zeros(0, dtype=np.int64)
+        self._sizes = np.zeros(0, dtype=np.int32)
+        self._bits = np.zeros((0, 1), dtype=np.uint64)
+        self._tags: Dict[str, np.ndarray] = {}
+        self._count = 0
+
+    def _grow(self, rows: int, words: int) -> None:
+        """Make room for at least rows recipes and words * 64 ingredients"""
+        capacity, width = self._bits.shape
+        if rows <= capacity and words <= width:
+            return
+
+        new_capacity = max(rows, capacity * 2, 64) if rows > capacity else capacity
+        new_width = max(words, width * 2) if words > width else width
+
+        bits = np.zeros((new_capacity, new_width), dtype=np.uint64)
+        bits[:capacity, :width] = self._bits
+        self._bits = bits
+
+        if new_capacity > capacity:
+            self._recipe_ids = np.resize(self._recipe_ids, new_capacity)
+            self._sizes = np.resize(self._sizes, new_capacity)
+            for tag, rows_mask in self._tags.items():
+                self._tags[tag] = np.concatenate(
+                    [rows_mask, np.zeros(new_capacity - capacity, dtype=bool)]
+                )
+
+    def add(
+        self, recipe_id: int, ingredients: Iterable[str], tags: Iterable[str] = ()
+    ) -> None:
+        """Index a recipe, or add tags to one that is already indexed"""
+        row = self._rows.get(recipe_id)
+
+        if row is None:
+            columns = set()
+            for name in ingredients:
+                normalized = normalize_item_name(name)
+                if normalized:
+                    columns.add(self._vocab.setdefault(normalized, len(self._vocab)))
+
+            row = self._count
+            self._grow(row + 1, len(self._vocab) // 64 + 1)
+            self._bits[row] = 0
+            for column in columns:
+                self._bits[row, column >> 6] |= np.uint64(1) << np.uint64(column & 63)
+                self._postings[column].add(row)
+            self._recipe_ids[row] = recipe_id
+            self._sizes[row] = len(columns)
+            self._rows[recipe_id] = row
+            self._count += 1
+
+        for tag in tags:
+            if tag not in self._tags:
+                self._tags[tag] = np.zeros(self._bits.shape[0], dtype=bool)
+            self._tags[tag][row] = True
+
+    def search(
+        self,
+        pantry: Iterable[str],
+        tags: Iterable[str] = (),
+        limit: int = 3,
+        min_coverage: float = 0.0,
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the recipes best covered by the pantry
+
+        Args:
+            pantry: Available ingredient names
+            tags: Tags every returned recipe must carry
+            limit: Maximum number of results
+            min_coverage: Minimum share of a recipe's ingredients in the pantry
+
+        Returns:
+            list: (recipe_id, coverage) pairs, best first
+        """
+        columns = {
+            self._vocab[name]
+            for name in map(normalize_item_name, pantry)
+            if name in self._vocab
+        }
+        if not columns:
+            return []
+
+        # Only recipes sharing at least one ingredient can score above zero
+        rows = np.fromiter(
+            set().union(*(self._postings[column] for column in columns)),
+            dtype=np.int64,
+        )
+
+        pantry_bits = np.zeros(self._bits.shape[1], dtype=np.uint64)
+        for column in columns:
+            pantry_bits[column >> 6] |= np.uint64(1) << np.uint64(column & 63)
+
+        covered = np.bitwise_count(self._bits[rows] & pantry_bits).sum(axis=1)
+        coverage = covered / np.maximum(self._sizes[rows], 1)
+
+        keep = coverage >= min_coverage
+        for tag in tags:
+            rows_mask = self._tags.get(tag)
+            if rows_mask is None:
+                return []
+            keep &= rows_mask[rows]
+
+        rows, coverage, covered = rows[keep], coverage[keep], covered[keep]
+
+        # Best coverage first, then recipes that use more of the pantry
+        order = np.lexsort((-covered, -coverage))[:limit]
+        return [(int(self._recipe_ids[rows[i]]), float(coverage[i])) for i in order]
+
+    async def build(self) -> None:
+        """Rebuild the index from every stored recipe"""
+        index = RecipeIndex()
+
+        async with SessionLocal() as db:
+            ingredients = defaultdict(list)
+            for recipe_id, name in await db.execute(
+                select(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_name)
+            ):
+                ingredients[recipe_id].append(name)
+
+            tags = defaultdict(set)
+            for recipe_id, name in await db.execute(
+                select(UserRecipeHistory.recipe_id, DietaryPreference.name)
+                .join(
+                    user_dietary_preferences,
+                    user_dietary_preferences.c.user_id == UserRecipeHistory.user_id,
+                )
+                .join(DietaryPreference)
+                .distinct()
+            ):
+                tags[recipe_id].add(dietary_tag(name))
+            for recipe_id, name in await db.execute(
+                select(UserRecipeHistory.recipe_id, Cuisine.name)
+                .join(
+                    user_preferred_cuisines,
+                    user_preferred_cuisines.c.user_id == UserRecipeHistory.user_id,
+                )
+                .join(Cuisine)
+                .distinct()
+            ):
+                tags[recipe_id].add(cuisine_tag(name))
+
+        for recipe_id, names in ingredients.items():
+            index.add(recipe_id, names, tags.get(recipe_id, ()))
+
+        # Swap the new state in at once
+        self.__dict__.update(index.__dict__)
+        metrics.increment("recipe_index.builds")
+        logger.info(
+            f"Built recipe index: {self._count} recipes, {len(self._vocab)} ingredients"
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "recipes": self._count,
+            "ingredients": len(self._vocab),
+            "tags": len(self._tags),
+        }
+
+
+recipe_index = RecipeIndex()
+metrics.register_collector("recipe_index", recipe_index.stats)
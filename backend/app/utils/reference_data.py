@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Cuisine, DietaryPreference
+from app.schemas.user import CuisineSchema, DietaryPreferenceSchema
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """A loaded copy of the dietary preferences and cuisines"""
+
+    dietary_preferences: Dict[int, DietaryPreferenceSchema]
+    cuisines: Dict[int, CuisineSchema]
+    body: bytes
+    etag: str
+    loaded_at: float
+
+
+class ReferenceDataCache:
+    """
+    In-process copy of the dietary preference and cuisine tables
+
+    The tables are read once at startup and again every refresh_interval
+    seconds, or on the next access after invalidate(). Each load
+    pre-serializes the /users/preferences response body and derives a strong
+    ETag from its bytes.
+
+    Requests that already hold a session pass it in, so a cold load doesn't
+    need a second pooled connection while theirs is checked out. Concurrent
+    misses are loaded once; the other requests wait for that load.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._data: Optional[ReferenceData] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self, db: Optional[AsyncSession] = None) -> ReferenceData:
+        """
+        Read both tables from the database and replace the cached copy
+
+        Args:
+            db: Session to read with, or None to open one
+        """
+        if db is None:
+            async with SessionLocal() as db:
+                return await self.load(db)
+
+        dietary_prefs = await db.scalars(
+            select(DietaryPreference).order_by(DietaryPreference.preference_id)
+        )
+        cuisines = await db.scalars(select(Cuisine).order_by(Cuisine.cuisine_id))
+
+        dietary_schemas = [
+            DietaryPreferenceSchema.model_validate(dp) for dp in dietary_prefs
+        ]
+        cuisine_schemas = [CuisineSchema.model_validate(c) for c in cuisines]
+
+        body = json.dumps(
+            {
+                "dietary_preferences": [dp.model_dump() for dp in dietary_schemas],
+                "cuisines": [c.model_dump() for c in cuisine_schemas],
+            },
+            separators=(",", ":"),
+        ).encode()
+
+        self._data = ReferenceData(
+            dietary_preferences={dp.preference_id: dp for dp in dietary_schemas},
+            cuisines={c.cuisine_id: c for c in cuisine_schemas},
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            loaded_at=time.time(),
+        )
+        metrics.increment("reference_data.loads")
+        return self._data
+
+    async def get(self, db: Optional[AsyncSession] = None) -> ReferenceData:
+        """
+        Get the cached reference data, loading it if needed
+
+        Args:
+            db: The caller's session, used for the load on a miss
+        """
+        data = self._data
+        if data is not None:
+            return data
+
+        # Only one request loads on a miss
+        async with self._lock:
+            # Another request may have loaded it while we waited
+            if self._data is not None:
+                return self._data
+            return await self.load(db)
+
+    def invalidate(self) -> None:
+        """Drop the cached copy so the next access reloads it"""
+        self._data = None
+
+    async def refresh_periodically(self) -> None:
+        """Reload the tables every refresh_interval seconds until cancelled"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Failed to refresh reference data: {e}")
+
+    def stats(self) -> Dict:
+        data = self._data
+        return {
+            "loaded": data is not None,
+            "etag": data.etag if data else None,
+            "age_seconds": round(time.time() - data.loaded_at, 1) if data else None,
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+
+    return False
+
+
+reference_data = ReferenceDataCache(settings.REFERENCE_DATA_REFRESH_SECONDS)
+metrics.register_collector("reference_data", reference_data.stats)
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.utils.metrics import metrics
+from app.utils.rate_limit import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Sends one upstream call under the attempt's timeout and circuit breaker
+Upstream = Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    """Answer with 503 and the number of seconds until upstream is tried again"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Upstream service unavailable, please try again later"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed upstream call may succeed if it is sent again"""
+    # Waiting out our own quota or an open circuit is the caller's call
+    if isinstance(error, (RateLimitExceeded, CircuitOpen)):
+        return False
+    # Client errors other than timeouts and throttling won't go away on retry
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return code in (408, 429)
+    return True
+
+
+class CircuitBreaker:
+    """
+    Fails upstream calls fast while upstream is failing
+
+    Outcomes of the calls of the last window_seconds are kept. Once there are
+    at least min_calls of them and the share of failures reaches error_rate,
+    the circuit opens and calls are rejected for open_seconds. Then one trial
+    call is let through: its success closes the circuit, its failure opens it
+    again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float,
+        min_calls: int,
+        error_rate: float,
+        open_seconds: float,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started: Optional[float] = None
+
+    def check(self) -> None:
+        """Raise CircuitOpen if allow would, without starting a trial call"""
+        if self.state == CLOSED:
+            return
+        retry_after = self._retry_after(time.monotonic())
+        if retry_after is not None:
+            metrics.increment(f"{self.name}.rejected")
+            raise CircuitOpen(retry_after)
+
+    def allow(self) -> None:
+        """Raise CircuitOpen unless a call may go upstream now"""
+        if self.state == CLOSED:
+            return
+
+        # One trial at a time, replaced if it never reported back
+        self.check()
+        self.state = HALF_OPEN
+        self._trial_started = time.monotonic()
+
+    def _retry_after(self, now: float) -> Optional[float]:
+        """Seconds until a call may go upstream, or None if it may now"""
+        if self.state == OPEN:
+            remaining = self._opened_at + self.open_seconds - now
+            return remaining if remaining > 0 else None
+        if (
+            self._trial_started is not None
+            and now - self._trial_started < self.open_seconds
+        ):
+            return self.open_seconds
+        return None
+
+    def record(self, ok: bool) -> None:
+        """Record the outcome of a call that allow let through"""
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            if ok:
+                self._close()
+            else:
+                self._open(now)
+            return
+        if self.state == OPEN:
+            # A call that started before the circuit opened
+            return
+
+        self._outcomes.append((now, ok))
+        if not ok:
+            self._failures += 1
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            if not self._outcomes.popleft()[1]:
+                self._failures -= 1
+
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.error_rate:
+            self._open(now)
+
+    def record_error(self, error: BaseException) -> None:
+        """Record a failed call, unless the failure isn't upstream's"""
+        if isinstance(error, asyncio.TimeoutError) or is_retryable(error):
+            self.record(False)
+
+    def _open(self, now: float) -> None:
+        logger.warning(
+            f"Opening {self.name} for {self.open_seconds}s after "
+            f"{self._failures} failures in {len(self._outcomes)} calls"
+        )
+        metrics.increment(f"{self.name}.opened")
+        self.state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+
+    def _close(self) -> None:
+        logger.info(f"Closing {self.name}")
+        metrics.increment(f"{self.name}.closed")
+        self.state = CLOSED
+        self._trial_started = None
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "calls": len(self._outcomes),
+            "failures": self._failures,
+        }
+
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int) -> Optional[float]:
+        """The q-th quantile of the samples, or None until there are enough"""
+        if len(self._samples) < max(min_samples, 1):
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Resilience:
+    """
+    Deadline, retries, hedging and circuit breaking around upstream calls
+
+    A request gets LLM_DEADLINE_SECONDS in total, and each upstream call at
+    most GEMINI_TIMEOUT_SECONDS of it. Failed attempts are retried with full
+    jitter exponential backoff while the next one can still start before the
+    deadline. With hedging on, an upstream call still running after the
+    endpoint's p95 latency gets a duplicate attempt, and the first success
+    wins. Every upstream call goes through the circuit breaker.
+
+    Only the upstream call itself is timed and counted by the breaker: an
+    attempt may wait for quota or a local concurrency slot first, and that
+    wait is bounded by the deadline alone.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker):
+        self.name = name
+        self.breaker = breaker
+        self._latencies: Dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+
+    async def call(
+        self, endpoint: str, attempt: Callable[[Upstream], Awaitable[T]]
+    ) -> T:
+        """
+        Run attempt until it succeeds, fails for good or the deadline passes
+
+        Args:
+            endpoint: Name the latencies and counters are kept under
+            attempt: Makes one upstream call each time it is called, passing
+                it to the Upstream it is given once ready to send it
+
+        Raises:
+            asyncio.TimeoutError: If the deadline passed first
+            CircuitOpen: If the circuit breaker is open
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.LLM_DEADLINE_SECONDS
+        attempts = max(settings.LLM_RETRY_ATTEMPTS, 1)
+
+        for number in range(1, attempts + 1):
+            try:
+                return await self._hedged(endpoint, attempt, deadline)
+            except Exception as e:
+                if not is_retryable(e) or number == attempts:
+                    raise
+                error = e
+
+            backoff = min(
+                settings.LLM_RETRY_MAX_DELAY_SECONDS,
+                settings.LLM_RETRY_BASE_DELAY_SECONDS * 2 ** (number - 1),
+            )
+            delay = random.uniform(0, backoff)
+            if loop.time() + delay >= deadline:
+                metrics.increment(f"{self.name}.deadline_exceeded")
+                if isinstance(error, asyncio.TimeoutError):
+                    raise error
+                raise asyncio.TimeoutError() from error
+
+            logger.warning(
+                f"Retrying {endpoint} in {delay:.2f}s after attempt {number}: "
+                f"{str(error) or type(error).__name__}"
+            )
+            metrics.increment(f"{self.name}.retries")
+            metrics.increment(f"{self.name}.{endpoint}.retries")
+            await asyncio.sleep(delay)
+
+    async def _hedged(
+        self,
+        endpoint: str,
+        attempt: Callable[[Upstream], Awaitable[T]],
+        deadline: float,
+    ) -> T:
+        """Run one attempt, with a duplicate if its upstream call outlives p95"""
+        delay = None
+        if settings.LLM_HEDGE_ENABLED:
+            delay = self._latencies[endpoint].percentile(
+                0.95, settings.LLM_HEDGE_MIN_SAMPLES
+            )
+        if delay is None:
+            return await self._attempt(endpoint, attempt, deadline)
+
+        # The hedge delay counts from the start of the primary's upstream
+        # call, not from time spent waiting for quota or a slot
+        sent = asyncio.Event()
+
+        async def hedge_due() -> None:
+            await sent.wait()
+            await asyncio.sleep(delay)
+
+        primary = asyncio.ensure_future(
+            self._attempt(endpoint, attempt, deadline, sent)
+        )
+        timer = asyncio.ensure_future(hedge_due())
+        pending = {primary}
+        try:
+            await asyncio.wait({primary, timer}, return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                metrics.increment(f"{self.name}.hedges")
+                metrics.increment(f"{self.name}.{endpoint}.hedges")
+                pending.add(
+                    asyncio.ensure_future(self._attempt(endpoint, attempt, deadline))
+                )
+
+            # The first success wins; a failure waits for the other attempt
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            metrics.increment(f"{self.name}.hedge_wins")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            timer.cancel()
+            for task in pending:
+                task.cancel()
+
+    async def _attempt(
+        self,
+        endpoint: str,
+        attempt: Callable[[Upstream], Awaitable[T]],
+        deadline: float,
+        sent: Optional[asyncio.Event] = None,
+    ) -> T:
+        """Make one attempt, timing its upstream call through the breaker"""
+        loop = asyncio.get_running_loop()
+
+        async def upstream(send: Callable[[], Awaitable[Any]]) -> Any:
+            self.breaker.allow()
+            if sent is not None:
+                sent.set()
+            timeout = min(settings.GEMINI_TIMEOUT_SECONDS, deadline - loop.time())
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(send(), timeout=max(timeout, 0))
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.increment(f"{self.name}.timeouts")
+                self.breaker.record_error(e)
+                raise
+
+            self.breaker.record(True)
+            self._latencies[endpoint].add(time.perf_counter() - started)
+            return result
+
+        # Fail fast before charging quota while the circuit is open
+        self.breaker.check()
+        return await asyncio.wait_for(
+            attempt(upstream), timeout=max(deadline - loop.time(), 0)
+        )
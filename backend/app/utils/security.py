@@ -1,31 +1,113 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+from uuid import UUID
 
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.db.database import get_db
+from app.db.loading import USER_PROFILE_OPTIONS
 from app.db.models import User
+from app.schemas.auth import TokenData
+from app.schemas.user import UserProfile
+from app.utils.metrics import metrics
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing. Hashes made with a different cost are flagged for update.
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 
 # OAuth2 configuration for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
+# Resolved user profiles keyed by token subject (email)
+_user_cache = TTLCache(
+    maxsize=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+_user_cache_lock = threading.Lock()
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a dedicated thread pool
+
+    bcrypt releases the GIL while hashing, so throughput scales with the
+    number of workers up to the core count while the event loop stays free.
+    At most max_pending operations may be queued or running; callers that
+    can't get a slot within queue_timeout seconds get a 503.
+    """
+
+    def __init__(
+        self,
+        context: CryptContext,
+        workers: int,
+        max_pending: int,
+        queue_timeout: float,
+    ):
+        self.context = context
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+        self._slots = asyncio.Semaphore(max_pending)
+
+    async def _run(self, func, *args):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("password_hashing.rejected")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        """Generate a password hash"""
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Verify a password, returning a new hash if the stored one is outdated"""
+        return await self._run(
+            self.context.verify_and_update, password, hashed_password
+        )
+
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS,
+)
+
 
-def verify_password(plain_password, hashed_password):
-    """Verify that a password matches its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Verify that a password matches its hash, returning a rehash if the cost changed"""
+    return await password_hasher.verify_and_update(plain_password, hashed_password)
 
 
-def get_password_hash(password):
+async def get_password_hash(password: str) -> str:
     """Generate password hash"""
-    return pwd_context.hash(password)
+    return await password_hasher.hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -47,9 +129,33 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def invalidate_user(email: str):
+    """Drop a user's cached profile so the next request reloads it"""
+    with _user_cache_lock:
+        _user_cache.pop(email, None)
+
+
+async def _load_user_profile(
+    db: AsyncSession, token_data: TokenData
+) -> Optional[UserProfile]:
+    """Load a user with their preferences and cuisines from the database"""
+    query = select(User).options(*USER_PROFILE_OPTIONS)
+
+    # Prefer the primary key when the token carries it
+    if token_data.user_id is not None:
+        user = await db.scalar(query.where(User.user_id == token_data.user_id))
+    else:
+        user = await db.scalar(query.where(User.email == token_data.email))
+
+    if user is None or user.email != token_data.email:
+        return None
+
+    return UserProfile.model_validate(user)
+
+
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+) -> UserProfile:
     """Get the current authenticated user from the token"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -62,15 +168,45 @@ async def get_current_user(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
         email: str = payload.get("sub")
+        user_id: Optional[str] = payload.get("user_id")
 
         if email is None:
             raise credentials_exception
-    except JWTError:
+
+        token_data = TokenData(email=email, user_id=UUID(user_id) if user_id else None)
+    except (JWTError, ValueError):
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
+    with _user_cache_lock:
+        user = _user_cache.get(email)
+
+    if user is not None:
+        metrics.increment("user_cache.hits")
+        return user
+
+    metrics.increment("user_cache.misses")
+    user = await _load_user_profile(db, token_data)
 
     if user is None:
         raise credentials_exception
 
+    with _user_cache_lock:
+        _user_cache[email] = user
+
     return user
+
+
+async def get_current_admin(
+    current_user: UserProfile = Depends(get_current_user),
+) -> UserProfile:
+    """Get the current user, who must be listed in ADMIN_EMAILS"""
+    admins = {
+        email.strip().lower()
+        for email in settings.ADMIN_EMAILS.split(",")
+        if email.strip()
+    }
+    if current_user.email.lower() not in admins:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
+        )
+    return current_user
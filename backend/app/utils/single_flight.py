@@ -0,0 +1,44 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from app.utils.metrics import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it is in flight await the same task and get the same result or
+    exception. The task is shielded, so a caller that disconnects does not
+    cancel the call for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Run func for key, or join the call already in flight for it"""
+        task = self._calls.get(key)
+        if task is not None:
+            metrics.increment(f"{self.name}.coalesced")
+            return await asyncio.shield(task)
+
+        metrics.increment(f"{self.name}.issued")
+        task = asyncio.ensure_future(func())
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
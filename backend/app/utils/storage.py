@@ -0,0 +1,390 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Scope
+from starlette.staticfiles import StaticFiles
+
+from app.config import settings
+from app.utils.metrics import metrics
+
+# Room for the multipart boundaries and part headers around the file itself
+_MULTIPART_OVERHEAD = 64 * 1024
+
+# Unfinished uploads older than this were abandoned by a crashed request
+_INCOMING_MAX_AGE_SECONDS = 24 * 60 * 60
+
+# Younger thumbnails without an original may belong to an upload stored
+# while the collector was running
+_ORPHAN_THUMBNAIL_MAX_AGE_SECONDS = 24 * 60 * 60
+
+_THUMBNAIL_DIR = "thumbs"
+
+# Uploads are written here and moved into place once complete
+_INCOMING_DIR = ".incoming"
+
+
+class UploadError(Exception):
+    """Raised when an upload is malformed or not acceptable"""
+
+
+class UploadTooLarge(UploadError):
+    """Raised as soon as an upload is known to exceed the size limit"""
+
+
+@dataclass
+class StoredUpload:
+    """An uploaded file stored under its content hash"""
+
+    digest: str
+    path: str
+    size: int
+    content_type: str
+    filename: str
+    duplicate: bool
+
+
+def content_path(digest: str, content_type: str) -> str:
+    """Where the file with this SHA-256 digest and type is stored"""
+    extension = mimetypes.guess_extension(content_type) or ""
+    return os.path.join(settings.UPLOAD_DIR, digest[:2], f"{digest}{extension}")
+
+
+def thumbnail_path(path: str) -> str:
+    """Where the WebP thumbnail of a stored upload is kept"""
+    digest = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(
+        settings.UPLOAD_DIR,
+        _THUMBNAIL_DIR,
+        digest[:2],
+        f"{digest}-{settings.THUMBNAIL_SIZE}.webp",
+    )
+
+
+def public_url(path: str) -> str:
+    """URL of a file under UPLOAD_DIR as served from /uploads"""
+    relative = os.path.relpath(path, settings.UPLOAD_DIR)
+    return f"/uploads/{relative.replace(os.sep, '/')}"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    Serves uploads, with long-lived cache headers for content-addressed files
+
+    Originals in the two-character shard directories and their thumbnails
+    are named after their content hash, so their URLs always refer to the
+    same bytes and clients never need to revalidate. Files saved before
+    uploads were content-addressed get the default headers, and unfinished
+    uploads aren't served at all.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        top, _, rest = path.partition(os.sep)
+        if top == _INCOMING_DIR:
+            raise HTTPException(status_code=404)
+
+        response = await super().get_response(path, scope)
+        content_addressed = rest and (top == _THUMBNAIL_DIR or len(top) == 2)
+        if response.status_code == 200 and content_addressed:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def _open_incoming():
+    directory = os.path.join(settings.UPLOAD_DIR, _INCOMING_DIR)
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory)
+    return os.fdopen(fd, "wb"), path
+
+
+def _discard(f, path: str) -> None:
+    f.close()
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _commit(f, incoming_path: str, path: str) -> bool:
+    """Move a finished upload into place, returning True if it was already stored"""
+    f.close()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(incoming_path)
+        # Refresh the age of the stored copy for retention
+        os.utime(path)
+        return True
+    os.replace(incoming_path, path)
+    return False
+
+
+class _FilePart:
+    """Collects the data of the file field while the multipart body is parsed"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self.current = False
+        self.found = False
+        self.content_type = ""
+        self.filename = ""
+        self.chunks: List[bytes] = []
+
+    def on_part_begin(self) -> None:
+        self.headers = {}
+        self.current = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self.headers.get(b"content-disposition"))
+        name = options.get(b"name", b"").decode("latin-1")
+        if name != self.field or b"filename" not in options or self.found:
+            return
+
+        self.current = True
+        self.found = True
+        self.filename = options[b"filename"].decode("utf-8", "replace")
+        self.content_type = self.headers.get(
+            b"content-type", b"application/octet-stream"
+        ).decode("latin-1")
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.current:
+            self.chunks.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        self.current = False
+
+
+async def receive_upload(
+    request: Request,
+    field: str = "file",
+    content_type_prefix: str = "",
+    max_size: Optional[int] = None,
+) -> StoredUpload:
+    """
+    Stream a multipart file field to content-addressed storage
+
+    The request body is parsed as it arrives, so only one chunk of it is held
+    in memory. The file is hashed while it is written to a temporary file off
+    the event loop, and the upload is abandoned as soon as it passes max_size.
+    Finished files are stored under their SHA-256 digest, so uploading the
+    same bytes again costs no extra disk.
+
+    Args:
+        request: The incoming multipart/form-data request
+        field: Name of the form field holding the file
+        content_type_prefix: Required prefix of the file's content type
+        max_size: Maximum file size in bytes, MAX_UPLOAD_SIZE by default
+
+    Returns:
+        StoredUpload: The stored file
+
+    Raises:
+        UploadTooLarge: If the file is larger than max_size
+        UploadError: If the body has no acceptable file in field
+    """
+    max_size = max_size or settings.MAX_UPLOAD_SIZE
+
+    # Reject declared oversize bodies before reading any of them
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_size + _MULTIPART_OVERHEAD:
+        metrics.increment("uploads.too_large")
+        raise UploadTooLarge("Upload is too large")
+
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError("Expected a multipart/form-data upload")
+
+    part = _FilePart(field)
+    parser = MultipartParser(
+        options[b"boundary"],
+        {
+            name: getattr(part, name)
+            for name in (
+                "on_part_begin",
+                "on_header_field",
+                "on_header_value",
+                "on_header_end",
+                "on_headers_finished",
+                "on_part_data",
+                "on_part_end",
+            )
+        },
+    )
+
+    hasher = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    f, incoming_path = await asyncio.to_thread(_open_incoming)
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+
+            if part.found and not part.content_type.startswith(content_type_prefix):
+                raise UploadError(f"File must be of type {content_type_prefix}*")
+
+            for data in part.chunks:
+                size += len(data)
+                if size > max_size:
+                    metrics.increment("uploads.too_large")
+                    raise UploadTooLarge("Upload is too large")
+                hasher.update(data)
+                buffer += data
+            part.chunks.clear()
+
+            if len(buffer) >= settings.UPLOAD_CHUNK_SIZE:
+                await asyncio.to_thread(f.write, bytes(buffer))
+                buffer.clear()
+
+        parser.finalize()
+        if not part.found:
+            raise UploadError(f"No file in the {field} field")
+
+        if buffer:
+            await asyncio.to_thread(f.write, bytes(buffer))
+
+        digest = hasher.hexdigest()
+        path = content_path(digest, part.content_type)
+        duplicate = await asyncio.to_thread(_commit, f, incoming_path, path)
+    except BaseException:
+        await asyncio.to_thread(_discard, f, incoming_path)
+        raise
+
+    metrics.increment("uploads.stored")
+    metrics.increment("uploads.bytes", size)
+    if duplicate:
+        metrics.increment("uploads.duplicates")
+
+    return StoredUpload(
+        digest=digest,
+        path=path,
+        size=size,
+        content_type=part.content_type,
+        filename=part.filename,
+        duplicate=duplicate,
+    )
+
+
+def collect_uploads(
+    owners: Iterable[Tuple[object, str]], in_use: Set[str]
+) -> Dict[str, int]:
+    """
+    Delete stored originals past retention or beyond their owners' quotas
+
+    The thumbnail of a deleted original goes with it, and thumbnails left
+    without an original for more than a day are swept up.
+
+    Args:
+        owners: (user_id, path) pairs, most recently used first
+        in_use: Paths that unfinished jobs still need
+
+    Returns:
+        dict: Number of files and bytes deleted
+    """
+    now = time.time()
+    cutoff = now - settings.UPLOAD_RETENTION_DAYS * 24 * 60 * 60
+
+    # A file survives the quota if it fits in any owner's newest uploads
+    sizes: Dict[str, int] = {}
+    used: Dict[object, int] = defaultdict(int)
+    owned: Set[str] = set()
+    kept: Set[str] = set()
+    for user_id, path in owners:
+        if path not in sizes:
+            try:
+                sizes[path] = os.stat(path).st_size
+            except FileNotFoundError:
+                sizes[path] = None
+        if sizes[path] is None:
+            continue
+        owned.add(path)
+        if used[user_id] + sizes[path] <= settings.UPLOAD_USER_QUOTA_BYTES:
+            used[user_id] += sizes[path]
+            kept.add(path)
+
+    deleted = {"files": 0, "bytes": 0}
+
+    def delete(path: str, stat: os.stat_result) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        deleted["files"] += 1
+        deleted["bytes"] += stat.st_size
+
+    def delete_original(path: str, stat: os.stat_result) -> None:
+        delete(path, stat)
+        thumbnail = thumbnail_path(path)
+        try:
+            delete(thumbnail, os.stat(thumbnail))
+        except FileNotFoundError:
+            pass
+
+    if not os.path.isdir(settings.UPLOAD_DIR):
+        return deleted
+
+    # Digests of the originals that are still stored
+    stored: Set[str] = set()
+
+    for entry in os.scandir(settings.UPLOAD_DIR):
+        if entry.is_file():
+            # Files saved before uploads were content-addressed
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                delete_original(entry.path, stat)
+            else:
+                stored.add(os.path.splitext(entry.name)[0])
+        elif entry.name == _INCOMING_DIR:
+            for incoming in os.scandir(entry.path):
+                stat = incoming.stat()
+                if stat.st_mtime < now - _INCOMING_MAX_AGE_SECONDS:
+                    delete(incoming.path, stat)
+        elif entry.is_dir() and len(entry.name) == 2:
+            for original in os.scandir(entry.path):
+                path = os.path.join(settings.UPLOAD_DIR, entry.name, original.name)
+                stat = original.stat()
+                if path not in in_use and (
+                    stat.st_mtime < cutoff or (path in owned and path not in kept)
+                ):
+                    delete_original(path, stat)
+                else:
+                    stored.add(os.path.splitext(original.name)[0])
+
+    # Thumbnails whose original is gone
+    thumbnails = os.path.join(settings.UPLOAD_DIR, _THUMBNAIL_DIR)
+    if os.path.isdir(thumbnails):
+        for shard in os.scandir(thumbnails):
+            for thumbnail in os.scandir(shard.path):
+                digest = thumbnail.name.rsplit("-", 1)[0]
+                stat = thumbnail.stat()
+                if (
+                    digest not in stored
+                    and stat.st_mtime < now - _ORPHAN_THUMBNAIL_MAX_AGE_SECONDS
+                ):
+                    delete(thumbnail.path, stat)
+
+    return deleted
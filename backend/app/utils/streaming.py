@@ -0,0 +1,96 @@
+import json
+import logging
+from typing import Any, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+class RecipeStreamParser:
+    """
+    Incrementally extract recipe objects from a streamed Gemini response
+
+    The response is a JSON object whose "recipes" key holds an array of
+    recipe objects. Chunks are scanned once as they arrive, tracking string
+    and nesting state, and each recipe is returned as soon as its closing
+    brace has been received: parsed and validated into model if one is
+    given, otherwise as a dict. Recipes that fail are counted in failures.
+    """
+
+    def __init__(self, model: Optional[Type[BaseModel]] = None):
+        self.model = model
+        self.failures = 0
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._array_done = False
+        self._object_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add a chunk of response text and return any newly completed recipes"""
+        self.text += chunk
+        completed = []
+
+        while self._pos < len(self.text):
+            char = self.text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self.text[self._string_start + 1 : self._pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char in "{[":
+                self._depth += 1
+                if (
+                    char == "["
+                    and not self._array_done
+                    and self._depth == 2
+                    and self._last_string == "recipes"
+                ):
+                    self._array_depth = self._depth
+                elif (
+                    char == "{"
+                    and self._array_depth is not None
+                    and self._depth == self._array_depth + 1
+                ):
+                    self._object_start = self._pos
+            elif char in "}]":
+                if (
+                    char == "}"
+                    and self._object_start is not None
+                    and self._depth == self._array_depth + 1
+                ):
+                    recipe = self._parse_object(self._object_start, self._pos + 1)
+                    if recipe is not None:
+                        completed.append(recipe)
+                    self._object_start = None
+                elif char == "]" and self._depth == self._array_depth:
+                    self._array_depth = None
+                    self._array_done = True
+                self._depth -= 1
+
+            self._pos += 1
+
+        return completed
+
+    def _parse_object(self, start: int, end: int) -> Optional[Any]:
+        try:
+            if self.model is not None:
+                return self.model.model_validate_json(self.text[start:end])
+            return json.loads(self.text[start:end])
+        except (json.JSONDecodeError, ValidationError) as e:
+            logger.error(f"Failed to parse streamed recipe: {e}")
+            self.failures += 1
+            return None
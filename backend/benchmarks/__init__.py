@@ -0,0 +1 @@
+# Benchmarks for the StockChef API, run from the backend directory
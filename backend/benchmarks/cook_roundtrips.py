@@ -0,0 +1,102 @@
+"""
+Count the database statements issued by POST /api/recipes/{id}/cook
+
+Creates recipes with a growing number of ingredients, stocks the inventory
+with all of them and records how many statements the cook request runs.
+The count should stay the same however many ingredients the recipe has.
+
+Usage (from the backend directory):
+    python -m benchmarks.cook_roundtrips
+"""
+
+import os
+import sys
+import tempfile
+
+WORK_DIR = tempfile.mkdtemp(prefix="stockchef-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/bench.db"
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db.database import SessionLocal, engine
+from app.db.models import Cuisine, DietaryPreference
+from app.main import app
+from app.utils.reference_data import reference_data
+
+RECIPE_SIZES = [1, 5, 20, 50, 100]
+
+
+async def seed_reference_data():
+    async with SessionLocal() as db:
+        db.add_all(
+            [
+                DietaryPreference(preference_id=1, name="Vegan"),
+                Cuisine(cuisine_id=1, name="Indian"),
+            ]
+        )
+        await db.commit()
+
+    # Startup cached the empty tables
+    reference_data.invalidate()
+
+
+def main():
+    # main.py creates the uploads directory relative to the working directory
+    os.chdir(WORK_DIR)
+
+    statements = []
+    event.listen(
+        engine.sync_engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    with TestClient(app) as client:
+        client.portal.call(seed_reference_data)
+
+        response = client.post(
+            "/api/auth/register",
+            json={
+                "email": "bench@example.com",
+                "password": "benchmark",
+                "first_name": "Bench",
+                "last_name": "Mark",
+                "dietary_preference_id": 1,
+                "cuisine_preference_id": 1,
+            },
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        print(f"{'ingredients':>12} {'statements':>11} {'consumed':>9}")
+        for size in RECIPE_SIZES:
+            ingredients = [f"Ingredient {size}-{i}" for i in range(size)]
+            recipe = client.post(
+                "/api/recipes/create",
+                json={
+                    "recipe_name": f"Recipe with {size} ingredients",
+                    "description": "Benchmark recipe",
+                    "ingredients": ingredients,
+                    "approx_time": "30 minutes",
+                    "steps": ["Cook everything"],
+                },
+                headers=headers,
+            ).json()
+            client.post(
+                "/api/inventory/update-multiple",
+                json={"items": ingredients},
+                headers=headers,
+            )
+
+            statements.clear()
+            result = client.post(
+                f"/api/recipes/{recipe['recipe_id']}/cook", headers=headers
+            ).json()
+            print(f"{size:>12} {len(statements):>11} {result['ingredients_used']:>9}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+"""
+Measure latency, throughput and queries per request for the main endpoints
+
+Boots app.main:app in-process against a fresh SQLite database, swaps the
+Gemini client for a stub with configurable latency (or, with --replay, for
+responses recorded with LLM_RECORD_PATH), registers a set of users
+with stocked pantries and then drives a weighted mix of requests at a fixed
+concurrency. Reports throughput, p50/p95/p99 latency and database queries per
+request for each operation, and writes the results to a JSON file. Pass an
+earlier results file with --compare to print the change in latency.
+
+Usage (from the backend directory):
+    python -m benchmarks.endpoints [--concurrency 16] [--requests 2000]
+        [--mix inventory=35,suggest=15,create=15,cook=10,restock=15,login=10]
+        [--gemini-latency 0.5] [--replay recordings.jsonl]
+        [--output results.json] [--compare old.json]
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List
+
+DEFAULT_MIX = "inventory=35,suggest=15,create=15,cook=10,restock=15,login=10"
+PASSWORD = "benchmark-password"
+VOCABULARY = [
+    "Eggs", "Milk", "Rice", "Chicken", "Onion", "Garlic", "Tomatoes", "Spinach",
+    "Cheddar", "Butter", "Potatoes", "Carrots", "Beans", "Lentils", "Tofu",
+    "Pasta", "Basil", "Lemon", "Yogurt", "Peppers", "Mushrooms", "Ginger",
+    "Coconut Milk", "Chickpeas", "Bread", "Flour", "Oats", "Apples",
+]  # fmt: skip
+
+# Statements issued while serving the current request
+_queries = contextvars.ContextVar("queries", default=None)
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Collects latency, status and query count per operation"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[tuple]] = defaultdict(list)
+
+    def add(self, operation: str, seconds: float, status: int, queries: int) -> None:
+        self.samples[operation].append((seconds, status, queries))
+
+    def summary(self, elapsed: float) -> Dict:
+        results = {}
+        all_samples = []
+        for operation, samples in sorted(self.samples.items()):
+            results[operation] = self._summarize(samples, elapsed)
+            all_samples += samples
+        results["all"] = self._summarize(all_samples, elapsed)
+        return results
+
+    @staticmethod
+    def _summarize(samples: List[tuple], elapsed: float) -> Dict:
+        latencies = sorted(seconds for seconds, _, _ in samples)
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for _, status, _ in samples if status >= 400),
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+            "queries_per_request": round(
+                sum(queries for _, _, queries in samples) / max(len(samples), 1), 2
+            ),
+        }
+
+
+class VirtualUser:
+    def __init__(self, email: str, pantry: List[str]):
+        self.email = email
+        self.pantry = pantry
+        self.headers: Dict[str, str] = {}
+        self.recipe_ids: List[int] = []
+
+
+class Workload:
+    """Issues the benchmark operations for a set of virtual users"""
+
+    def __init__(self, client, recorder: Recorder, suggest_mode: str):
+        self.client = client
+        self.recorder = recorder
+        self.suggest_mode = suggest_mode
+
+    async def request(self, operation: str, method: str, url: str, **kwargs):
+        counter = [0]
+        token = _queries.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        finally:
+            _queries.reset(token)
+        self.recorder.add(
+            operation, time.perf_counter() - started, response.status_code, counter[0]
+        )
+        return response
+
+    async def inventory(self, user: VirtualUser, rng: random.Random) -> None:
+        await self.request("inventory", "GET", "/api/inventory/", headers=user.headers)
+
+    async def restock(self, user: VirtualUser, rng: random.Random) -> None:
+        await self.request(
+            "restock",
+            "POST",
+            "/api/inventory/update-multiple",
+            json={"items": user.pantry},
+            headers=user.headers,
+        )
+
+    async def suggest(self, user: VirtualUser, rng: random.Random) -> None:
+        await self.request(
+            "suggest",
+            "POST",
+            "/api/recipes/suggest",
+            json={"mode": self.suggest_mode},
+            headers=user.headers,
+        )
+
+    async def create(self, user: VirtualUser, rng: random.Random) -> None:
+        ingredients = rng.sample(
+            user.pantry, k=min(len(user.pantry), rng.randint(3, 8))
+        )
+        response = await self.request(
+            "create",
+            "POST",
+            "/api/recipes/create",
+            json={
+                # A small pool of names, so some saves repeat stored recipes
+                "recipe_name": f"Benchmark Dish {rng.randint(1, 40)}",
+                "description": "Saved by the benchmark",
+                "ingredients": ingredients,
+                "approx_time": "30 minutes",
+                "steps": ["Prepare", "Cook", "Serve"],
+            },
+            headers=user.headers,
+        )
+        if response.status_code == 200:
+            user.recipe_ids.append(response.json()["recipe_id"])
+
+    async def cook(self, user: VirtualUser, rng: random.Random) -> None:
+        if not user.recipe_ids:
+            return await self.create(user, rng)
+        await self.request(
+            "cook",
+            "POST",
+            f"/api/recipes/{rng.choice(user.recipe_ids)}/cook",
+            headers=user.headers,
+        )
+
+    async def login(self, user: VirtualUser, rng: random.Random) -> None:
+        await self.request(
+            "login",
+            "POST",
+            "/api/auth/login",
+            json={"email": user.email, "password": PASSWORD},
+        )
+
+
+def _parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> Dict:
+    # Imported here so the environment is configured first
+    import httpx
+    from sqlalchemy import event
+
+    from app.db.database import SessionLocal, engine
+    from app.db.models import Cuisine, DietaryPreference
+    from app.main import app
+    from app.utils import gemini
+    from app.utils.metrics import metrics
+    from app.utils.providers import ReplayProvider
+    from app.utils.reference_data import reference_data
+    from benchmarks import gemini_stub
+
+    if args.replay:
+        gemini.provider = ReplayProvider(
+            args.replay,
+            latency=args.replay_latency,
+            error_rate=args.replay_error_rate,
+            seed=args.seed,
+        )
+    else:
+        gemini_stub.install(args.gemini_latency, args.gemini_jitter, args.seed)
+
+    def count_query(conn, cursor, statement, *rest):
+        counter = _queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+
+    rng = random.Random(args.seed)
+    mix = _parse_mix(args.mix)
+    recorder = Recorder()
+    setup_recorder = Recorder()
+
+    try:
+        async with app.router.lifespan_context(app):
+            async with SessionLocal() as db:
+                db.add_all(
+                    [
+                        DietaryPreference(preference_id=1, name="Vegetarian"),
+                        DietaryPreference(preference_id=2, name="Non-vegetarian"),
+                        Cuisine(cuisine_id=1, name="Indian"),
+                        Cuisine(cuisine_id=2, name="Italian"),
+                    ]
+                )
+                await db.commit()
+            reference_data.invalidate()
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://benchmark"
+            ) as client:
+                setup = Workload(client, setup_recorder, args.suggest_mode)
+                users = [
+                    VirtualUser(f"user{i}@example.com", rng.sample(VOCABULARY, k=12))
+                    for i in range(args.users)
+                ]
+
+                async def register(i: int, user: VirtualUser) -> None:
+                    response = await setup.request(
+                        "register",
+                        "POST",
+                        "/api/auth/register",
+                        json={
+                            "email": user.email,
+                            "password": PASSWORD,
+                            "first_name": "Bench",
+                            "last_name": f"User{i}",
+                            "dietary_preference_id": 1 + i % 2,
+                            "cuisine_preference_id": 1 + i % 2,
+                        },
+                    )
+                    response.raise_for_status()
+                    user.headers = {
+                        "Authorization": f"Bearer {response.json()['access_token']}"
+                    }
+                    await setup.restock(user, rng)
+
+                await asyncio.gather(*(register(i, u) for i, u in enumerate(users)))
+
+                workload = Workload(client, recorder, args.suggest_mode)
+                operations = list(mix)
+                weights = [mix[name] for name in operations]
+                remaining = args.requests
+                before = metrics.snapshot()["counters"]
+
+                async def worker(worker_id: int) -> None:
+                    nonlocal remaining
+                    worker_rng = random.Random(args.seed * 1000 + worker_id)
+                    while remaining > 0:
+                        remaining -= 1
+                        operation = worker_rng.choices(operations, weights)[0]
+                        user = worker_rng.choice(users)
+                        await getattr(workload, operation)(user, worker_rng)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+                elapsed = time.perf_counter() - started
+    finally:
+        # Close pooled connections so their driver threads let the process exit
+        await engine.dispose()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": args.commit,
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare", "commit")
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "gemini_calls": metrics.get("llm.calls") - before.get("llm.calls", 0),
+        "upstream_seconds": round(
+            metrics.get("llm.upstream_seconds") - before.get("llm.upstream_seconds", 0),
+            3,
+        ),
+        "tokens": _token_counts(before, metrics.snapshot()["counters"]),
+        "results": recorder.summary(elapsed),
+    }
+
+
+def _token_counts(before: Dict, after: Dict) -> Dict:
+    """Input, cached and output tokens used per Gemini endpoint during the run"""
+    tokens = defaultdict(dict)
+    for name, value in after.items():
+        parts = name.split(".")
+        if len(parts) == 3 and parts[0] == "llm" and parts[2].endswith("_tokens"):
+            tokens[parts[1]][parts[2]] = value - before.get(name, 0)
+    return dict(tokens)
+
+
+def _print_results(report: Dict, baseline: Dict = None) -> None:
+    print(
+        f"{report['results']['all']['requests']} requests in "
+        f"{report['elapsed_seconds']}s, {report['gemini_calls']} Gemini calls "
+        f"taking {report['upstream_seconds']}s upstream"
+    )
+    for endpoint, counts in report["tokens"].items():
+        print(
+            f"{endpoint}: "
+            + ", ".join(f"{value} {name}" for name, value in sorted(counts.items()))
+        )
+    header = f"{'operation':>10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+    if baseline:
+        header += f" {'p95 change':>11}"
+    print(header)
+
+    for operation, stats in report["results"].items():
+        line = (
+            f"{operation:>10} {stats['requests']:>9} {stats['errors']:>7} "
+            f"{stats['throughput_rps']:>8.1f} {stats['p50_ms']:>8.1f} "
+            f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} "
+            f"{stats['queries_per_request']:>8.2f}"
+        )
+        previous = (baseline or {}).get("results", {}).get(operation)
+        if previous and previous["p95_ms"]:
+            change = (stats["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"]
+            line += f" {change:>+10.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument(
+        "--suggest-mode", default="gemini", choices=["auto", "local", "gemini"]
+    )
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--gemini-jitter", type=float, default=0.1)
+    parser.add_argument("--replay", help="Replay recorded LLM responses from a file")
+    parser.add_argument(
+        "--replay-latency",
+        type=float,
+        help="Fixed replay latency in seconds instead of the recorded one",
+    )
+    parser.add_argument("--replay-error-rate", type=float, default=0.0)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    args.commit = _git_commit()
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    work_dir = tempfile.mkdtemp(prefix="stockchef-bench-")
+    output = os.path.abspath(
+        args.output
+        or os.path.join(
+            "benchmarks",
+            "results",
+            f"endpoints-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json",
+        )
+    )
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{work_dir}/bench.db"
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ["RATE_LIMIT_BACKEND"] = "memory"
+    os.environ["GEMINI_API_RATE_LIMIT"] = "1000000/second"
+    os.environ["GEMINI_UPSTREAM_RATE_LIMIT"] = "1000000/second"
+
+    # The app keeps uploads and cache files relative to the working directory
+    sys.path.insert(0, os.getcwd())
+    os.chdir(work_dir)
+
+    report = asyncio.run(run(args))
+    _print_results(report, baseline)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Deterministic stand-in for the Gemini client used by the benchmarks
+
+Installed behind a GeminiProvider so the real service layer (provider,
+caching, coalescing, rate limiting, parsing) still runs, while upstream calls take a
+configurable, seeded latency and return well-formed responses derived from
+the request.
+"""
+
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+from typing import Dict, List
+
+IMAGE_ITEMS = ["Eggs", "Milk", "Tomatoes", "Spinach", "Cheddar", "Butter"]
+
+
+class StubResponse:
+    def __init__(self, text: str, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def _estimate_tokens(contents, system_instruction=None) -> int:
+    """Roughly four characters of text per token, a flat cost per image"""
+    tokens = 0
+    for content in [*(contents or []), system_instruction]:
+        for part in getattr(content, "parts", None) or []:
+            if getattr(part, "inline_data", None) is not None:
+                tokens += 258
+            else:
+                tokens += len(part.text or "") // 4
+    return tokens
+
+
+class StubCaches:
+    """Accepts context caches and remembers their size for usage estimates"""
+
+    def __init__(self):
+        self.tokens: Dict[str, int] = {}
+
+    async def create(self, model, config):
+        name = f"cachedContents/stub-{len(self.tokens)}"
+        self.tokens[name] = _estimate_tokens(config.contents, config.system_instruction)
+        return SimpleNamespace(name=name)
+
+
+class StubModels:
+    """Answers generate_content and generate_content_stream after a delay"""
+
+    def __init__(self, latency: float, jitter: float, seed: int, caches: StubCaches):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.caches = caches
+        self._random = random.Random(seed)
+
+    async def _delay(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(
+            max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        )
+
+    @staticmethod
+    def _request_payload(contents) -> Dict:
+        """Find the JSON input payload in the last user message, if any"""
+        for content in reversed(contents):
+            for part in content.parts or []:
+                if getattr(part, "inline_data", None) is not None:
+                    return {"image": True}
+                try:
+                    payload = json.loads(part.text or "")
+                except (TypeError, ValueError):
+                    continue
+                if isinstance(payload, dict) and "ingredients" in payload:
+                    return payload
+        return {}
+
+    @staticmethod
+    def _recipes(payload: Dict) -> str:
+        ingredients: List[str] = payload.get("ingredients") or ["Rice"]
+        recipes = []
+        for i in range(3):
+            chosen = ingredients[i : i + 4] or ingredients[:4]
+            recipes.append(
+                {
+                    "status": 200,
+                    "recipe_name": f"{payload.get('cuisine_preference', 'House')} {chosen[0]} Bowl {i + 1}",
+                    "description": "A quick benchmark recipe",
+                    "ingredients": chosen,
+                    "approx_time": f"{20 + 5 * i} minutes",
+                    "steps": ["Prepare the ingredients", "Cook", "Serve"],
+                }
+            )
+        return json.dumps({"status": 200, "recipes": recipes})
+
+    def _answer(self, contents) -> str:
+        payload = self._request_payload(contents)
+        if payload.get("image"):
+            return json.dumps({"status": "200", "items": IMAGE_ITEMS})
+        return self._recipes(payload)
+
+    def _usage(self, contents, config, text: str) -> SimpleNamespace:
+        cached = self.caches.tokens.get(getattr(config, "cached_content", None), 0)
+        return SimpleNamespace(
+            prompt_token_count=cached
+            + _estimate_tokens(contents, getattr(config, "system_instruction", None)),
+            cached_content_token_count=cached,
+            candidates_token_count=len(text) // 4,
+        )
+
+    async def generate_content(self, model, contents, config=None, **kwargs):
+        await self._delay()
+        text = self._answer(contents)
+        return StubResponse(text, self._usage(contents, config, text))
+
+    async def generate_content_stream(self, model, contents, config=None, **kwargs):
+        await self._delay()
+        text = self._answer(contents)
+        usage = self._usage(contents, config, text)
+
+        async def chunks():
+            for start in range(0, len(text), 64):
+                last = start + 64 >= len(text)
+                yield StubResponse(text[start : start + 64], usage if last else None)
+
+        return chunks()
+
+
+class StubClient:
+    def __init__(self, latency: float, jitter: float = 0.0, seed: int = 0):
+        self.caches = StubCaches()
+        self.models = StubModels(latency, jitter, seed, self.caches)
+        self.aio = SimpleNamespace(models=self.models, caches=self.caches)
+
+
+def install(latency: float, jitter: float = 0.0, seed: int = 0) -> StubClient:
+    """Point the Gemini service layer at a stub client"""
+    from app.utils import gemini
+    from app.utils.providers import GeminiProvider
+
+    stub = StubClient(latency, jitter, seed)
+    gemini.provider = GeminiProvider(gemini.settings.GEMINI_MODEL, client=stub)
+    return stub
@@ -0,0 +1,78 @@
+"""
+Measure password verification throughput for different pool sizes
+
+Runs concurrent bcrypt verifications through PasswordHasher and reports
+logins per second together with the worst event loop stall seen while they
+run. Throughput should grow with the worker count up to the number of
+cores, and the loop stall should stay around the tick interval.
+
+Usage (from the backend directory):
+    python -m benchmarks.password_hashing [--rounds 12] [--logins 64]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from passlib.context import CryptContext
+
+from app.utils.security import PasswordHasher
+
+TICK_SECONDS = 0.005
+
+
+async def _measure_loop_lag(stop: asyncio.Event) -> float:
+    """Return the longest delay between ticks that should be TICK_SECONDS apart"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        worst = max(worst, time.perf_counter() - started - TICK_SECONDS)
+    return worst
+
+
+async def run(workers: int, rounds: int, logins: int):
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    hasher = PasswordHasher(
+        context, workers=workers, max_pending=logins, queue_timeout=600
+    )
+    hashed = context.hash("benchmark-password")
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(hasher.verify_and_update("benchmark-password", hashed) for _ in range(logins))
+    )
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    worst_lag = await lag_task
+    assert all(valid for valid, _ in results)
+    return logins / elapsed, worst_lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--logins", type=int, default=64)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    pool_sizes = sorted({size for size in (1, 2, 4, cores) if size <= cores})
+
+    print(f"bcrypt cost {args.rounds}, {args.logins} concurrent logins, {cores} cores")
+    print(f"{'workers':>8} {'logins/s':>10} {'max loop lag ms':>16}")
+    for workers in pool_sizes:
+        throughput, lag = asyncio.run(run(workers, args.rounds, args.logins))
+        print(f"{workers:>8} {throughput:>10.1f} {lag * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Shared fixtures
+
+Tests run the real app against a throwaway SQLite database, with Gemini
+replaced by the deterministic stub from the benchmarks. The environment is
+set before anything under app/ is imported, since settings, the engine and
+the module-level caches are created at import time.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import time
+from uuid import UUID
+
+_root = tempfile.mkdtemp(prefix="stockchef-tests-")
+os.environ.update(
+    {
+        "DATABASE_URL": f"sqlite:///{_root}/stockchef.db",
+        "SECRET_KEY": "test-secret-key",
+        "GEMINI_API_KEY": "test-api-key",
+        "BCRYPT_ROUNDS": "4",
+        "RATE_LIMIT_BACKEND": "memory",
+        "RECIPE_CACHE_BACKEND": "memory",
+        "UPLOAD_DIR": os.path.join(_root, "uploads"),
+        "LLM_PROVIDER": "gemini",
+        "LLM_RECORD_PATH": "",
+    }
+)
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.config import settings
+from app.db.database import Base, SessionLocal, engine
+from app.db.models import Cuisine, DietaryPreference
+from app.main import app
+from app.utils import gemini, jobs, security
+from app.utils.cache import recipe_cache
+from app.utils.image_dedup import ImageDedupIndex
+from app.utils.rate_limit import (
+    MemoryBucketStore,
+    upstream_rate_limiter,
+    user_rate_limiter,
+)
+from app.utils.recipe_index import recipe_index
+from app.utils.reference_data import reference_data
+from app.utils.resilience import CircuitBreaker, Resilience
+from benchmarks import gemini_stub
+
+PASSWORD = "test-password"
+
+
+async def _reset_database() -> None:
+    """Recreate every table and seed the reference data"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with SessionLocal() as db:
+        db.add_all(
+            [
+                DietaryPreference(preference_id=1, name="Vegetarian"),
+                DietaryPreference(preference_id=2, name="Non-vegetarian"),
+                Cuisine(cuisine_id=1, name="Indian"),
+                Cuisine(cuisine_id=2, name="Italian"),
+            ]
+        )
+        await db.commit()
+
+    reference_data.invalidate()
+    await recipe_index.build()
+    await recipe_cache.backend.clear()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """The Gemini stub every test talks to instead of the real service"""
+    monkeypatch.setattr(gemini, "provider", None)
+    return gemini_stub.install(latency=0)
+
+
+@pytest.fixture
+def client(stub, monkeypatch):
+    """A client for the app on an empty database, uploads and in-memory state"""
+    monkeypatch.setattr(settings, "UPLOAD_DIR", os.environ["UPLOAD_DIR"])
+    shutil.rmtree(settings.UPLOAD_DIR, ignore_errors=True)
+    os.makedirs(settings.UPLOAD_DIR)
+    monkeypatch.setattr(user_rate_limiter, "store", MemoryBucketStore())
+    monkeypatch.setattr(upstream_rate_limiter, "store", MemoryBucketStore())
+    monkeypatch.setattr(
+        jobs,
+        "image_index",
+        ImageDedupIndex(
+            settings.IMAGE_DEDUP_MAX_USERS,
+            settings.IMAGE_DEDUP_MAX_ENTRIES_PER_USER,
+            settings.IMAGE_DEDUP_MAX_DISTANCE,
+        ),
+    )
+    monkeypatch.setattr(
+        gemini,
+        "resilience",
+        Resilience(
+            "llm.resilience",
+            CircuitBreaker(
+                "llm.circuit",
+                window_seconds=settings.LLM_BREAKER_WINDOW_SECONDS,
+                min_calls=settings.LLM_BREAKER_MIN_CALLS,
+                error_rate=settings.LLM_BREAKER_ERROR_RATE,
+                open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+            ),
+        ),
+    )
+    with security._user_cache_lock:
+        security._user_cache.clear()
+
+    with TestClient(app) as client:
+        client.portal.call(_reset_database)
+        yield client
+        client.portal.call(engine.dispose)
+
+
+def register(client, email: str = "cook@example.com", dietary=1, cuisine=1) -> dict:
+    """Register a user and get the headers that authenticate as them"""
+    response = client.post(
+        "/api/auth/register",
+        json={
+            "email": email,
+            "password": PASSWORD,
+            "first_name": "Test",
+            "last_name": "Cook",
+            "dietary_preference_id": dietary,
+            "cuisine_preference_id": cuisine,
+        },
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def user_id(client, headers: dict) -> UUID:
+    return UUID(client.get("/api/users/me", headers=headers).json()["user_id"])
+
+
+@pytest.fixture
+def headers(client):
+    return register(client)
+
+
+@pytest.fixture
+def run(client):
+    """Run an async function of a database session on the app's event loop"""
+
+    def run(func):
+        async def call():
+            async with SessionLocal() as db:
+                result = await func(db)
+                await db.commit()
+                return result
+
+        return client.portal.call(call)
+
+    return run
+
+
+def make_image(
+    seed: int = 0, size=(800, 600), format: str = "JPEG", brightness: int = 0, **kwargs
+) -> bytes:
+    """Encode a blocky random picture, which keeps its dHash across re-encodes"""
+    blocks = np.random.default_rng(seed).integers(0, 200, (6, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(blocks + brightness).resize(size, Image.Resampling.NEAREST)
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
+
+
+def upload_image(client, headers: dict, data: bytes, content_type="image/jpeg"):
+    return client.post(
+        "/api/inventory/upload-image",
+        files={"file": ("fridge.jpg", data, content_type)},
+        headers=headers,
+    )
+
+
+def wait_for_job(client, headers: dict, location: str, timeout: float = 10) -> dict:
+    """Poll an image job until it is done or failed"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(location, headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {location} did not finish")
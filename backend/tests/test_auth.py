@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+from sqlalchemy import select, update
+
+from app.db.models import User
+from app.utils.security import PasswordHasher
+from tests.conftest import PASSWORD
+
+
+class RecordingContext:
+    """Stands in for a CryptContext, blocking until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.threads = []
+
+    def hash(self, password):
+        self.threads.append(threading.current_thread().name)
+        self.release.wait(5)
+        return f"hashed:{password}"
+
+
+def login(client, password=PASSWORD):
+    return client.post(
+        "/api/auth/login", json={"email": "cook@example.com", "password": password}
+    )
+
+
+def stored_hash(run) -> str:
+    return run(
+        lambda db: db.scalar(
+            select(User.password_hash).where(User.email == "cook@example.com")
+        )
+    )
+
+
+def test_login(client, headers):
+    response = login(client)
+
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    me = client.get("/api/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert me.json()["email"] == "cook@example.com"
+
+
+def test_token_login_with_form_data(client, headers):
+    response = client.post(
+        "/api/auth/token", data={"username": "cook@example.com", "password": PASSWORD}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+
+def test_login_rejects_a_wrong_password(client, headers):
+    assert login(client, "wrong-password").status_code == 401
+
+
+def test_login_rejects_an_unknown_email(client):
+    response = client.post(
+        "/api/auth/login", json={"email": "nobody@example.com", "password": PASSWORD}
+    )
+
+    assert response.status_code == 401
+
+
+def test_login_rehashes_with_the_configured_cost(client, headers, run):
+    # A hash made before BCRYPT_ROUNDS was lowered to the test setting of 4
+    old_hash = bcrypt.using(rounds=5).hash(PASSWORD)
+    run(
+        lambda db: db.execute(
+            update(User)
+            .where(User.email == "cook@example.com")
+            .values(password_hash=old_hash)
+        )
+    )
+
+    assert login(client).status_code == 200
+
+    new_hash = stored_hash(run)
+    assert new_hash != old_hash
+    assert new_hash.startswith("$2b$04$")
+    assert login(client).status_code == 200
+    assert stored_hash(run) == new_hash
+
+
+@pytest.mark.anyio
+async def test_hashing_runs_in_the_worker_pool():
+    context = RecordingContext()
+    context.release.set()
+    hasher = PasswordHasher(context, workers=2, max_pending=4, queue_timeout=1)
+
+    assert await hasher.hash("secret") == "hashed:secret"
+    assert context.threads[0].startswith("bcrypt")
+
+
+@pytest.mark.anyio
+async def test_hashing_sheds_load_when_the_queue_is_full():
+    context = RecordingContext()
+    hasher = PasswordHasher(context, workers=1, max_pending=1, queue_timeout=0.05)
+
+    busy = asyncio.create_task(hasher.hash("first"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await hasher.hash("second")
+
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.headers["Retry-After"] == "1"
+
+    context.release.set()
+    assert await busy == "hashed:first"
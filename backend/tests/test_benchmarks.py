@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from google.genai import types
+
+from benchmarks import gemini_stub
+from benchmarks.endpoints import Recorder, _parse_mix, _percentile, _token_counts
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+
+    assert _percentile(values, 0.50) == 51
+    assert _percentile(values, 0.95) == 95
+    assert _percentile(values, 1.0) == 100
+    assert _percentile([], 0.95) == 0
+
+
+def test_parse_mix():
+    assert _parse_mix("inventory=35, suggest=15") == {"inventory": 35, "suggest": 15}
+
+
+def test_recorder_summary():
+    recorder = Recorder()
+    recorder.add("inventory", 0.010, 200, 2)
+    recorder.add("inventory", 0.030, 200, 2)
+    recorder.add("suggest", 0.500, 429, 3)
+
+    results = recorder.summary(elapsed=2.0)
+
+    assert results["inventory"]["requests"] == 2
+    assert results["inventory"]["throughput_rps"] == 1.0
+    assert results["inventory"]["queries_per_request"] == 2
+    assert results["suggest"]["errors"] == 1
+    assert results["all"]["requests"] == 3
+    assert results["all"]["p99_ms"] == 500
+
+
+def test_token_counts():
+    before = {"llm.generate_recipes.input_tokens": 100, "recipe_cache.hits": 1}
+    after = {
+        "llm.generate_recipes.input_tokens": 250,
+        "llm.generate_recipes.output_tokens": 40,
+        "recipe_cache.hits": 5,
+    }
+
+    assert _token_counts(before, after) == {
+        "generate_recipes": {"input_tokens": 150, "output_tokens": 40}
+    }
+
+
+@pytest.mark.anyio
+async def test_stub_answers_are_deterministic():
+    contents = [
+        types.Content(
+            role="user",
+            parts=[types.Part.from_text(text=json.dumps({"ingredients": ["Rice"]}))],
+        )
+    ]
+    first = gemini_stub.StubClient(latency=0.01, jitter=0.005, seed=1)
+    second = gemini_stub.StubClient(latency=0.01, jitter=0.005, seed=1)
+
+    answers = [
+        await client.aio.models.generate_content("model", contents)
+        for client in (first, second)
+    ]
+
+    assert answers[0].text == answers[1].text
+    assert len(json.loads(answers[0].text)["recipes"]) == 3
+    assert first.models.calls == 1
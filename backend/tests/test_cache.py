@@ -0,0 +1,78 @@
+import pytest
+
+from app.config import settings
+from app.utils import gemini
+from app.utils.cache import CacheBackend, MemoryBackend, RecipeCache
+from app.utils.metrics import metrics
+from tests.conftest import register
+
+
+def test_key_ignores_order_case_whitespace_and_duplicates():
+    key = RecipeCache.make_key(
+        ["Rice", "egg", "  Tomato "], "Vegetarian", "Indian", ["Dal", "Pulao"]
+    )
+
+    assert key == RecipeCache.make_key(
+        ["tomato", "EGG", "rice", "Rice"], " vegetarian", "INDIAN ", ["pulao", "dal"]
+    )
+    assert key != RecipeCache.make_key(
+        ["Rice", "egg"], "Vegetarian", "Indian", ["Dal", "Pulao"]
+    )
+    assert key != RecipeCache.make_key(
+        ["Rice", "egg", "Tomato"], "Vegetarian", "Italian", ["Dal", "Pulao"]
+    )
+
+
+@pytest.mark.anyio
+async def test_equivalent_requests_are_served_from_the_cache(client, stub):
+    first = await gemini.generate_recipes(["Rice", "Egg"], "Vegetarian", "Indian")
+    second = await gemini.generate_recipes([" egg", "RICE"], "vegetarian", "Indian")
+
+    assert stub.models.calls == 1
+    assert second == first
+
+
+@pytest.mark.anyio
+async def test_failed_generations_are_not_cached(client, stub, monkeypatch):
+    monkeypatch.setattr(
+        stub.models, "_recipes", lambda payload: '{"status": 400, "recipes": []}'
+    )
+
+    for _ in range(2):
+        result = await gemini.generate_recipes(["Stone"], "Vegetarian", "Indian")
+        assert result.status == 400
+
+    assert stub.models.calls == 2
+
+
+@pytest.mark.anyio
+async def test_unreadable_entries_are_misses():
+    cache = RecipeCache(MemoryBackend(max_entries=10, ttl=60))
+    await cache.backend.set("key", "not json")
+    misses = metrics.get("recipe_cache.misses")
+
+    assert await cache.get("key") is None
+    assert metrics.get("recipe_cache.misses") == misses + 1
+
+
+def test_metrics_require_an_admin(client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_EMAILS", "ops@example.com")
+
+    assert client.get("/api/metrics").status_code == 401
+
+    user = register(client, "cook@example.com")
+    assert client.get("/api/metrics", headers=user).status_code == 403
+
+    admin = register(client, "Ops@example.com")
+    response = client.get("/api/metrics", headers=admin)
+    assert response.status_code == 200
+    assert "recipe_cache" in response.json()
+
+
+def test_incomplete_backend_fails_at_construction():
+    class WriteOnlyBackend(CacheBackend):
+        async def set(self, key, value):
+            pass
+
+    with pytest.raises(TypeError):
+        WriteOnlyBackend()
@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.config import settings
+from app.db.database import _async_database_url, _engine_options
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("postgresql://u:p@db/stockchef", "postgresql+asyncpg://u:p@db/stockchef"),
+        ("sqlite:///./stockchef.db", "sqlite+aiosqlite:///./stockchef.db"),
+        ("postgresql+asyncpg://u:p@db/x", "postgresql+asyncpg://u:p@db/x"),
+        ("mysql+aiomysql://u:p@db/x", "mysql+aiomysql://u:p@db/x"),
+    ],
+)
+def test_async_database_url(url, expected):
+    assert _async_database_url(url) == expected
+
+
+def test_postgres_engine_options():
+    options = _engine_options("postgresql+asyncpg://u:p@db/stockchef")
+
+    assert options["pool_size"] == settings.DB_POOL_SIZE
+    assert options["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert options["pool_recycle"] == settings.DB_POOL_RECYCLE_SECONDS
+    assert options["connect_args"]["server_settings"]["statement_timeout"] == str(
+        settings.DB_STATEMENT_TIMEOUT_MS
+    )
+
+
+def test_sqlite_engine_options():
+    options = _engine_options("sqlite+aiosqlite:///./stockchef.db")
+
+    assert options == {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+
+
+def test_a_slow_request_does_not_hold_up_others(client, headers, stub):
+    stub.models.latency = 0.3
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        slow = pool.submit(
+            client.post,
+            "/api/recipes/suggest",
+            json={"mode": "gemini"},
+            headers=headers,
+        )
+        time.sleep(0.05)
+        started = time.perf_counter()
+        fast = client.get("/api/inventory/", headers=headers)
+        elapsed = time.perf_counter() - started
+
+        assert slow.result().status_code == 200
+
+    assert fast.status_code == 200
+    assert elapsed < 0.2
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils import gemini
+
+
+@pytest.mark.anyio
+async def test_upstream_calls_do_not_block_the_event_loop(client, stub):
+    stub.models.latency = 0.2
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            gemini.generate_recipes([f"Item {i}", "Rice"], "Vegetarian", "Indian")
+            for i in range(4)
+        )
+    )
+
+    # Four calls of 0.2s each overlap instead of running back to back
+    assert time.perf_counter() - started < 0.6
+    assert [result.status for result in results] == [200] * 4
+    assert stub.models.calls == 4
+
+
+@pytest.mark.anyio
+async def test_extract_items_from_image(stub):
+    result = await gemini.extract_items_from_image(b"not really a jpeg")
+
+    assert result.status == "200"
+    assert "Eggs" in result.items
+
+
+def test_suggest_returns_gemini_recipes(client, headers):
+    client.post(
+        "/api/inventory/update-multiple",
+        json={"items": ["Rice", "Egg"]},
+        headers=headers,
+    )
+
+    response = client.post(
+        "/api/recipes/suggest", json={"mode": "gemini"}, headers=headers
+    )
+
+    assert response.status_code == 200
+    recipes = response.json()
+    assert len(recipes) == 3
+    assert set(recipes[0]) == {
+        "recipe_name",
+        "description",
+        "ingredients",
+        "approx_time",
+        "steps",
+    }
+
+
+@pytest.mark.anyio
+async def test_a_stalled_stream_reader_does_not_hold_an_upstream_slot(
+    client, stub, monkeypatch
+):
+    monkeypatch.setattr(gemini, "_upstream_semaphore", asyncio.Semaphore(1))
+    recipes = gemini.stream_recipes(["Rice", "Egg"], "Vegetarian", "Indian")
+
+    # The client reads one recipe and then stops reading
+    await anext(recipes)
+    try:
+        result = await asyncio.wait_for(
+            gemini.generate_recipes(["Pasta", "Basil"], "Vegetarian", "Italian"),
+            timeout=2,
+        )
+    finally:
+        await recipes.aclose()
+
+    assert result.status == 200
@@ -0,0 +1,54 @@
+import io
+
+from PIL import Image
+
+from app.config import settings
+from app.utils.image_dedup import ImageDedupIndex, dhash_image
+from tests.conftest import make_image, upload_image, wait_for_job
+
+
+def _hash(data: bytes) -> int:
+    with Image.open(io.BytesIO(data)) as image:
+        return dhash_image(image)
+
+
+def test_hash_survives_reencoding_resizing_and_exposure():
+    original = _hash(make_image(seed=1))
+    retake = _hash(make_image(seed=1, size=(640, 480), brightness=20, quality=60))
+    other = _hash(make_image(seed=2))
+
+    assert (original ^ retake).bit_count() <= settings.IMAGE_DEDUP_MAX_DISTANCE
+    assert (original ^ other).bit_count() > settings.IMAGE_DEDUP_MAX_DISTANCE
+
+
+def test_index_matches_close_hashes_per_user():
+    index = ImageDedupIndex(max_users=10, max_entries_per_user=2, max_distance=4)
+    index.add("alice", 0b1111, ["Milk"])
+
+    assert index.lookup("alice", 0b0111) == ["Milk"]
+    assert index.lookup("alice", 0xFF00FF) is None
+    assert index.lookup("bob", 0b1111) is None
+
+
+def test_index_keeps_the_most_recent_entries():
+    index = ImageDedupIndex(max_users=10, max_entries_per_user=2, max_distance=0)
+    index.add("alice", 1, ["Milk"])
+    index.add("alice", 2, ["Eggs"])
+    index.add("alice", 3, ["Rice"])
+
+    assert index.lookup("alice", 1) is None
+    assert index.lookup("alice", 3) == ["Rice"]
+
+
+def test_near_duplicate_upload_skips_gemini(client, headers, stub):
+    first = upload_image(client, headers, make_image(seed=3))
+    first_job = wait_for_job(client, headers, first.headers["Location"])
+
+    retake = upload_image(client, headers, make_image(seed=3, brightness=15))
+    retake_job = wait_for_job(client, headers, retake.headers["Location"])
+
+    assert stub.models.calls == 1
+    assert first_job["status"] == retake_job["status"] == "done"
+    assert (
+        retake_job["result"]["detected_items"] == first_job["result"]["detected_items"]
+    )
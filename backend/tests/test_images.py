@@ -0,0 +1,56 @@
+import io
+
+from PIL import Image
+
+from app.config import settings
+from app.utils.images import prepare_image
+from tests.conftest import make_image
+
+
+def _decode(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def test_large_images_are_downscaled_and_reencoded():
+    original = make_image(size=(4000, 3000), format="PNG")
+
+    prepared = prepare_image(original)
+
+    image = _decode(prepared.data)
+    assert max(image.size) == settings.IMAGE_MAX_EDGE
+    assert image.format == "JPEG"
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.bytes_saved > 0
+
+
+def test_exif_orientation_is_applied():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees clockwise
+    original = make_image(size=(800, 600), exif=exif)
+
+    image = _decode(prepare_image(original).data)
+
+    assert image.size == (600, 800)
+
+
+def test_originals_are_forwarded_when_reencoding_does_not_help(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_QUALITY", 100)
+    original = make_image(size=(320, 240), quality=30)
+
+    prepared = prepare_image(original)
+
+    assert prepared.data == original
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.bytes_saved == 0
+
+
+def test_thumbnail_is_saved_from_the_same_decode(tmp_path):
+    path = tmp_path / "thumbs" / "image.webp"
+
+    prepare_image(make_image(size=(1200, 900)), str(path))
+
+    thumbnail = _decode(path.read_bytes())
+    assert thumbnail.format == "WEBP"
+    assert max(thumbnail.size) == settings.THUMBNAIL_SIZE
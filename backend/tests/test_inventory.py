@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app.db.models import InventoryItem
+from app.main import app
+from app.db.queries import insert_inventory_items
+from tests.conftest import user_id
+
+
+def _names(client, headers):
+    return sorted(
+        item["name"] for item in client.get("/api/inventory/", headers=headers).json()
+    )
+
+
+def test_bulk_update_skips_items_already_stocked(client, headers):
+    client.post("/api/inventory/item", json={"name": "Milk"}, headers=headers)
+
+    response = client.post(
+        "/api/inventory/update-multiple",
+        json={"items": ["milk ", "Eggs", "EGGS", "Rice", "  "]},
+        headers=headers,
+    )
+
+    assert response.json()["message"] == "Inventory updated with 2 new items"
+    assert _names(client, headers) == ["Eggs", "Milk", "Rice"]
+
+
+def test_single_item_returns_the_existing_row(client, headers):
+    first = client.post("/api/inventory/item", json={"name": "Milk"}, headers=headers)
+    second = client.post("/api/inventory/item", json={"name": " MILK"}, headers=headers)
+
+    assert second.json()["item_id"] == first.json()["item_id"]
+    assert _names(client, headers) == ["Milk"]
+
+
+def test_concurrent_adds_of_an_item_share_one_row(client, headers):
+    async def add_concurrently():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as http:
+            return await asyncio.gather(
+                *(
+                    http.post(
+                        "/api/inventory/item", json={"name": name}, headers=headers
+                    )
+                    for name in ("Milk", "milk", " MILK", "Milk")
+                )
+            )
+
+    responses = client.portal.call(add_concurrently)
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.json()["item_id"] for response in responses}) == 1
+    # Stored as spelled by whichever add won
+    assert [name.lower() for name in _names(client, headers)] == ["milk"]
+
+
+def test_blank_item_is_rejected(client, headers):
+    response = client.post("/api/inventory/item", json={"name": "  "}, headers=headers)
+
+    assert response.status_code == 400
+    assert _names(client, headers) == []
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_insert_returns_only_new_names(client, headers, run, monkeypatch, returning):
+    owner = user_id(client, headers)
+
+    async def insert(db):
+        monkeypatch.setattr(db.get_bind().dialect, "insert_returning", returning)
+        await insert_inventory_items(db, owner, ["Milk"])
+        added = await insert_inventory_items(db, owner, ["milk", "Eggs", "eggs"])
+        rows = await db.scalars(
+            select(InventoryItem.normalized_name).where(InventoryItem.user_id == owner)
+        )
+        return added, sorted(rows)
+
+    added, rows = run(insert)
+
+    assert added == ["Eggs"]
+    assert rows == ["eggs", "milk"]
@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+from app.db.models import ImageJob
+from app.utils.jobs import PENDING, image_jobs
+from app.utils.metrics import metrics
+from app.utils.rate_limit import Rate, upstream_rate_limiter
+from app.utils.storage import content_path
+from tests.conftest import make_image, register, upload_image, user_id, wait_for_job
+
+
+def inventory_names(client, headers) -> list:
+    return [
+        item["name"] for item in client.get("/api/inventory/", headers=headers).json()
+    ]
+
+
+def test_image_job_lifecycle(client, headers):
+    response = upload_image(client, headers, make_image())
+
+    assert response.status_code == 202
+    assert response.json()["status"] == PENDING
+    location = response.headers["Location"]
+    assert location == f"/api/inventory/jobs/{response.json()['job_id']}"
+
+    job = wait_for_job(client, headers, location)
+
+    assert job["status"] == "done"
+    assert job["result"]["items_added"] == 6
+    assert "Eggs" in inventory_names(client, headers)
+
+
+def test_undecodable_image_fails_the_job(client, headers):
+    response = upload_image(client, headers, b"not an image")
+
+    job = wait_for_job(client, headers, response.headers["Location"])
+
+    assert job["status"] == "failed"
+    assert job["error"] == "Could not read image"
+    assert inventory_names(client, headers) == []
+
+
+def test_jobs_are_private(client, headers):
+    response = upload_image(client, headers, make_image())
+    other = register(client, "other@example.com")
+
+    assert client.get(response.headers["Location"], headers=other).status_code == 404
+
+
+def test_jobs_left_pending_run_when_the_queue_starts(client, headers, run):
+    data = make_image()
+    path = content_path(hashlib.sha256(data).hexdigest(), "image/jpeg")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(data)
+
+    # A job accepted by a process that stopped before running it
+    client.portal.call(image_jobs.stop)
+    owner = user_id(client, headers)
+
+    async def add_job(db):
+        job = ImageJob(user_id=owner, image_path=path, status=PENDING)
+        db.add(job)
+        await db.flush()
+        return job.job_id
+
+    job_id = run(add_job)
+    client.portal.call(image_jobs.start)
+
+    job = wait_for_job(client, headers, f"/api/inventory/jobs/{job_id}")
+    assert job["status"] == "done"
+
+
+def test_jobs_wait_for_the_upstream_quota(client, headers, monkeypatch):
+    monkeypatch.setattr(upstream_rate_limiter, "rates", [Rate(capacity=1, period=1)])
+    deferred = metrics.get("image_jobs.deferred")
+
+    locations = [
+        upload_image(client, headers, make_image(seed)).headers["Location"]
+        for seed in (1, 2)
+    ]
+    jobs = [wait_for_job(client, headers, location) for location in locations]
+
+    assert [job["status"] for job in jobs] == ["done", "done"]
+    assert metrics.get("image_jobs.deferred") > deferred
@@ -0,0 +1,124 @@
+import pytest
+from google.genai import types
+
+from app.config import Settings, settings
+from app.utils import gemini
+from app.utils.metrics import metrics
+from app.utils.prompts import RECIPE_PROMPT, PromptTemplate, _text
+from app.utils.providers import GeminiProvider
+from benchmarks import gemini_stub
+
+PARTS = [types.Part.from_text(text='{"ingredients": ["Rice"]}')]
+
+
+@pytest.fixture
+def template():
+    return PromptTemplate(
+        "test",
+        prefix=[_text("user", "Long instructions"), _text("model", "An example")],
+        compact_prefix=[],
+        system_instruction="You are a chef",
+        compact_system_instruction="Short instructions",
+    )
+
+
+@pytest.fixture
+def provider():
+    return GeminiProvider("stub-model", client=gemini_stub.StubClient(latency=0))
+
+
+@pytest.fixture
+def context_cache(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", True)
+    yield
+    for prompt in (RECIPE_PROMPT, gemini.IMAGE_PROMPT):
+        prompt.invalidate_cache()
+        prompt._cache_retry_at = 0.0
+
+
+def test_context_cache_is_off_by_default():
+    assert Settings.model_fields["GEMINI_CONTEXT_CACHE_ENABLED"].default is False
+
+
+@pytest.mark.anyio
+async def test_compact_prompt_by_default(template, provider, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", False)
+
+    contents, config, variant = await template.build(provider, PARTS)
+
+    assert variant == "compact"
+    assert [content.role for content in contents] == ["user"]
+    assert config.system_instruction.parts[0].text == "Short instructions"
+    assert provider.client.caches.tokens == {}
+
+
+@pytest.mark.anyio
+async def test_full_prompt(template, provider, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "GEMINI_COMPACT_PROMPTS", False)
+
+    contents, config, variant = await template.build(provider, PARTS)
+
+    assert variant == "full"
+    assert [content.role for content in contents] == ["user", "model", "user"]
+    assert config.system_instruction.parts[0].text == "You are a chef"
+
+
+@pytest.mark.anyio
+async def test_cached_prompt_is_created_once(template, provider, context_cache):
+    for _ in range(2):
+        contents, config, variant = await template.build(provider, PARTS)
+        assert variant == "cached"
+        assert len(contents) == 1
+        assert config.cached_content == "cachedContents/stub-0"
+
+    assert len(provider.client.caches.tokens) == 1
+
+    template.invalidate_cache()
+    _, config, _ = await template.build(provider, PARTS)
+    assert config.cached_content == "cachedContents/stub-1"
+
+
+@pytest.mark.anyio
+async def test_failed_cache_falls_back_without_retrying(template, context_cache):
+    class RefusingProvider(GeminiProvider):
+        attempts = 0
+
+        async def create_cache(self, contents, system_instruction, ttl_seconds):
+            self.attempts += 1
+            raise ValueError("Cached content is too small")
+
+    provider = RefusingProvider("stub-model", client=gemini_stub.StubClient(latency=0))
+
+    for _ in range(2):
+        _, _, variant = await template.build(provider, PARTS)
+        assert variant == "compact"
+
+    assert provider.attempts == 1
+
+
+@pytest.mark.anyio
+async def test_token_usage_is_counted(client, stub):
+    before = metrics.snapshot()["counters"]
+
+    await gemini.generate_recipes(["Rice", "Egg"], "Vegetarian", "Indian")
+
+    after = metrics.snapshot()["counters"]
+
+    def counted(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    assert counted("llm.generate_recipes.input_tokens") > 0
+    assert counted("llm.generate_recipes.output_tokens") > 0
+    assert counted("llm.generate_recipes.cached_tokens") == 0
+    assert counted("llm.generate_recipes.prompt.compact") == 1
+
+
+@pytest.mark.anyio
+async def test_cached_tokens_are_counted(client, stub, context_cache):
+    before = metrics.get("llm.generate_recipes.cached_tokens")
+
+    await gemini.generate_recipes(["Rice", "Egg"], "Vegetarian", "Indian")
+
+    assert metrics.get("llm.generate_recipes.cached_tokens") > before
+    assert metrics.get("llm.generate_recipes.prompt.cached") >= 1
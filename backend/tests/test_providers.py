@@ -0,0 +1,136 @@
+import json
+
+import pytest
+from google.genai import types
+
+from app.utils.providers import (
+    GeminiProvider,
+    LLMProvider,
+    ProviderError,
+    RecordingProvider,
+    ReplayProvider,
+)
+from benchmarks import gemini_stub
+
+CONFIG = types.GenerateContentConfig(temperature=0.2)
+
+
+def text_request(ingredients):
+    payload = json.dumps({"ingredients": ingredients})
+    return [types.Content(role="user", parts=[types.Part.from_text(text=payload)])]
+
+
+def image_request(data=b"fridge photo"):
+    part = types.Part.from_bytes(data=data, mime_type="image/jpeg")
+    return [types.Content(role="user", parts=[part])]
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = str(tmp_path / "recordings.jsonl")
+    client = gemini_stub.StubClient(latency=0)
+    return path, RecordingProvider(GeminiProvider("stub-model", client=client), path)
+
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.anyio
+async def test_replay_returns_the_recorded_response(recording):
+    path, recorder = recording
+    recorded = await recorder.generate(text_request(["Rice"]), CONFIG)
+
+    replayed = await ReplayProvider(path, latency=0).generate(
+        text_request(["Rice"]), CONFIG
+    )
+
+    assert replayed.text == recorded.text
+    [record] = read_records(path)
+    assert record["kind"] == "text"
+    assert record["error"] is None
+
+
+@pytest.mark.anyio
+async def test_replay_streams_the_recorded_chunks(recording):
+    path, recorder = recording
+    recorded = [
+        chunk.text
+        async for chunk in recorder.generate_stream(text_request(["Rice"]), CONFIG)
+    ]
+
+    replay = ReplayProvider(path, latency=0)
+    replayed = [
+        chunk.text
+        async for chunk in replay.generate_stream(text_request(["Rice"]), CONFIG)
+    ]
+
+    assert len(recorded) > 1
+    assert replayed == recorded
+
+
+@pytest.mark.anyio
+async def test_images_are_recorded_by_hash(recording):
+    path, recorder = recording
+    await recorder.generate(image_request(), CONFIG)
+
+    [record] = read_records(path)
+    inline_data = record["request"]["contents"][0]["parts"][0]["inline_data"]
+    assert record["kind"] == "image"
+    assert inline_data["size"] == len(b"fridge photo")
+    assert "fridge photo" not in json.dumps(record)
+
+
+@pytest.mark.anyio
+async def test_new_requests_fall_back_to_a_recording_of_the_same_kind(recording):
+    path, recorder = recording
+    recorded = await recorder.generate(text_request(["Rice"]), CONFIG)
+    replay = ReplayProvider(path, latency=0, seed=0)
+
+    replayed = await replay.generate(text_request(["Pasta", "Basil"]), CONFIG)
+
+    assert replayed.text == recorded.text
+    with pytest.raises(ProviderError):
+        await replay.generate(image_request(), CONFIG)
+
+
+@pytest.mark.anyio
+async def test_upstream_errors_are_recorded_and_replayed(tmp_path):
+    class FailingProvider(LLMProvider):
+        async def generate(self, contents, config):
+            raise RuntimeError("quota exhausted")
+
+        async def generate_stream(self, contents, config):
+            raise RuntimeError("quota exhausted")
+            yield
+
+    path = str(tmp_path / "recordings.jsonl")
+    with pytest.raises(RuntimeError):
+        await RecordingProvider(FailingProvider(), path).generate(
+            text_request(["Rice"]), CONFIG
+        )
+
+    [record] = read_records(path)
+    assert record["error"] == "quota exhausted"
+    with pytest.raises(ProviderError, match="quota exhausted"):
+        await ReplayProvider(path, latency=0).generate(text_request(["Rice"]), CONFIG)
+
+
+@pytest.mark.anyio
+async def test_replay_injects_errors(recording):
+    path, recorder = recording
+    await recorder.generate(text_request(["Rice"]), CONFIG)
+    replay = ReplayProvider(path, latency=0, error_rate=1.0)
+
+    with pytest.raises(ProviderError, match="Injected"):
+        await replay.generate(text_request(["Rice"]), CONFIG)
+
+
+def test_incomplete_provider_fails_at_construction():
+    class UnstreamedProvider(LLMProvider):
+        async def generate(self, contents, config):
+            return None
+
+    with pytest.raises(TypeError):
+        UnstreamedProvider()
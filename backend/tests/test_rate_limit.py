@@ -0,0 +1,140 @@
+import pytest
+
+from app.config import Settings, settings
+from app.utils import rate_limit
+from app.utils.rate_limit import (
+    BucketStore,
+    MemoryBucketStore,
+    Rate,
+    RateLimiter,
+    RateLimitExceeded,
+    SQLiteBucketStore,
+    _take_tokens,
+    parse_rates,
+    upstream_rate_limiter,
+)
+from tests.conftest import register
+
+
+def suggest(client, headers):
+    return client.post("/api/recipes/suggest", json={"mode": "gemini"}, headers=headers)
+
+
+def test_parse_rates():
+    assert parse_rates("5/minute; 500/day") == [
+        Rate(capacity=5, period=60),
+        Rate(capacity=500, period=86400),
+    ]
+
+
+def test_take_tokens_refills_evenly():
+    rate = Rate(capacity=2, period=10)
+
+    wait, states = _take_tokens([None], [rate], now=100)
+    assert (wait, states) == (0, [(1, 100)])
+
+    wait, states = _take_tokens(states, [rate], now=100)
+    assert (wait, states) == (0, [(0, 100)])
+
+    # Empty: one token comes back every 5 seconds
+    wait, states = _take_tokens(states, [rate], now=101)
+    assert wait == pytest.approx(4)
+    assert states == [(pytest.approx(0.2), 101)]
+
+    wait, states = _take_tokens(states, [rate], now=105)
+    assert wait == 0
+    assert states == [(pytest.approx(0), 105)]
+
+
+def test_take_tokens_is_all_or_nothing():
+    rates = [Rate(capacity=5, period=60), Rate(capacity=1, period=60)]
+
+    wait, states = _take_tokens([(3, 0), (0, 0)], rates, now=0)
+
+    assert wait == pytest.approx(60)
+    assert states == [(3, 0), (0, 0)]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+async def test_store_rejects_once_a_bucket_is_empty(backend, tmp_path):
+    if backend == "memory":
+        store = MemoryBucketStore()
+    else:
+        store = SQLiteBucketStore(str(tmp_path / "buckets.sqlite3"))
+    limiter = RateLimiter(store, "test", [Rate(capacity=2, period=60)])
+
+    await limiter.acquire("a")
+    await limiter.acquire("a")
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        await limiter.acquire("a")
+
+    assert excinfo.value.retry_after == pytest.approx(30, abs=0.1)
+    # Other keys have their own buckets
+    await limiter.acquire("b")
+
+
+@pytest.mark.anyio
+async def test_sqlite_buckets_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "buckets.sqlite3")
+    rates = [Rate(capacity=1, period=60)]
+    first = RateLimiter(SQLiteBucketStore(path), "test", rates)
+    second = RateLimiter(SQLiteBucketStore(path), "test", rates)
+
+    await first.acquire("gemini")
+    with pytest.raises(RateLimitExceeded):
+        await second.acquire("gemini")
+
+
+@pytest.mark.anyio
+async def test_a_broken_store_fails_open():
+    class BrokenStore(MemoryBucketStore):
+        async def take(self, keys, rates):
+            raise ConnectionError("store is down")
+
+    limiter = RateLimiter(BrokenStore(), "test", [Rate(capacity=1, period=60)])
+
+    for _ in range(3):
+        await limiter.acquire("a")
+
+
+def test_default_store_is_in_memory(monkeypatch):
+    # Nothing is written to the working directory unless a backend is chosen
+    default = Settings.model_fields["RATE_LIMIT_BACKEND"].default
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKEND", default)
+
+    assert isinstance(rate_limit._create_store(), MemoryBucketStore)
+
+
+def test_user_limit_answers_429_with_retry_after(client, headers):
+    for _ in range(5):
+        assert suggest(client, headers).status_code == 200
+
+    response = suggest(client, headers)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) == 12
+    # Another user still has their own allowance
+    assert suggest(client, register(client, "other@example.com")).status_code == 200
+
+
+def test_upstream_quota_is_shared_by_all_users(client, headers, stub, monkeypatch):
+    monkeypatch.setattr(settings, "RECIPE_CACHE_ENABLED", False)
+    monkeypatch.setattr(upstream_rate_limiter, "rates", [Rate(capacity=2, period=60)])
+    other = register(client, "other@example.com")
+
+    assert suggest(client, headers).status_code == 200
+    assert suggest(client, other).status_code == 200
+    response = suggest(client, headers)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) == 30
+    assert stub.models.calls == 2
+
+
+def test_incomplete_bucket_store_fails_at_construction():
+    class NoStore(BucketStore):
+        pass
+
+    with pytest.raises(TypeError):
+        NoStore()
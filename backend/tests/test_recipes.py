@@ -0,0 +1,333 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import SessionLocal, engine
+from app.db.models import (
+    Recipe,
+    RecipeIngredient,
+    UserRecipeHistory,
+    recipe_content_hash,
+)
+from app.api import recipes
+from app.db.queries import mark_recipe_cooked
+from app.utils.metrics import metrics
+from tests.conftest import register, user_id
+
+RECIPE = {
+    "recipe_name": "Egg Fried Rice",
+    "description": "Quick fried rice",
+    "ingredients": ["Rice", "Egg", "Soy Sauce"],
+    "approx_time": "20 minutes",
+    "steps": ["Fry the egg", "Add the rice and soy sauce"],
+}
+
+
+def save_recipe(client, headers: dict, **changes) -> int:
+    response = client.post(
+        "/api/recipes/create", json={**RECIPE, **changes}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["recipe_id"]
+
+
+def history_rows(run, owner) -> list:
+    return run(
+        lambda db: db.execute(
+            select(UserRecipeHistory.recipe_id, UserRecipeHistory.cooked).where(
+                UserRecipeHistory.user_id == owner
+            )
+        )
+    ).all()
+
+
+@contextmanager
+def count_statements():
+    """Count the SQL statements the app runs inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+def test_history_lists_the_newest_recipes(client, headers):
+    for i in range(4):
+        save_recipe(client, headers, recipe_name=f"Dish {i}")
+
+    response = client.get("/api/recipes/history", headers=headers)
+
+    assert response.status_code == 200
+    assert [r["title"] for r in response.json()] == ["Dish 3", "Dish 2", "Dish 1"]
+
+
+def test_history_query_count_does_not_grow_with_the_history(client, headers):
+    client.get("/api/users/me", headers=headers)
+    save_recipe(client, headers, recipe_name="Dish 0")
+    with count_statements() as one:
+        client.get("/api/recipes/history", headers=headers)
+
+    for i in range(1, 3):
+        save_recipe(client, headers, recipe_name=f"Dish {i}")
+    with count_statements() as three:
+        client.get("/api/recipes/history", headers=headers)
+
+    assert len(three) == len(one)
+
+
+def test_recipe_detail_includes_ingredients(client, headers):
+    recipe_id = save_recipe(client, headers)
+
+    with count_statements() as statements:
+        response = client.get(f"/api/recipes/{recipe_id}", headers=headers)
+
+    assert response.status_code == 200
+    detail = response.json()
+    assert detail["instructions"] == "Fry the egg\nAdd the rice and soy sauce"
+    assert detail["total_time_minutes"] == 20
+    assert sorted(i["ingredient_name"] for i in detail["ingredients"]) == [
+        "Egg",
+        "Rice",
+        "Soy Sauce",
+    ]
+    # The recipe and its ingredients, with the user already cached
+    assert len(statements) == 2
+
+
+def test_recipe_detail_not_found(client, headers):
+    assert client.get("/api/recipes/999", headers=headers).status_code == 404
+
+
+def test_content_hash_ignores_case_whitespace_and_ingredient_order():
+    steps = ["Fry the egg", "Add the rice"]
+    base = recipe_content_hash("Egg Fried Rice", ["Rice", "Egg"], steps)
+
+    assert base == recipe_content_hash(
+        " egg  fried RICE", ["egg", "rice", "Egg"], ["fry the  egg", "Add the rice "]
+    )
+    assert base != recipe_content_hash("Egg Fried Rice", ["Rice", "Egg"], steps[::-1])
+    assert base != recipe_content_hash("Egg Fried Rice", ["Rice"], steps)
+
+
+def test_identical_recipes_are_stored_once(client, headers, run):
+    first = save_recipe(client, headers)
+    other = register(client, "other@example.com")
+    second = save_recipe(
+        client,
+        other,
+        recipe_name="egg fried rice",
+        ingredients=["Soy Sauce", "Egg", "Rice", "Egg"],
+    )
+
+    assert first == second
+    assert run(lambda db: db.scalar(select(func.count()).select_from(Recipe))) == 1
+    assert (
+        run(lambda db: db.scalar(select(func.count()).select_from(RecipeIngredient)))
+        == 3
+    )
+    for user_headers in (headers, other):
+        history = client.get("/api/recipes/history", headers=user_headers).json()
+        assert [recipe["recipe_id"] for recipe in history] == [first]
+
+
+def test_changed_recipes_are_stored_separately(client, headers):
+    first = save_recipe(client, headers)
+    second = save_recipe(client, headers, steps=["Boil the rice"])
+
+    assert first != second
+
+
+def test_cook_consumes_matching_inventory(client, headers):
+    recipe_id = save_recipe(client, headers)
+    client.post(
+        "/api/inventory/update-multiple",
+        json={"items": [" rice ", "EGG", "Milk"]},
+        headers=headers,
+    )
+
+    response = client.post(f"/api/recipes/{recipe_id}/cook", headers=headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ingredients_used"] == 2
+    assert sorted(body["consumed_items"]) == ["EGG", "rice"]
+    inventory = client.get("/api/inventory", headers=headers).json()
+    assert [item["name"] for item in inventory] == ["Milk"]
+
+
+def test_cook_unknown_recipe(client, headers):
+    response = client.post("/api/recipes/999/cook", headers=headers)
+
+    assert response.status_code == 404
+
+
+def test_cooking_twice_keeps_one_history_entry(client, headers, run):
+    owner = user_id(client, headers)
+    recipe_id = save_recipe(client, headers)
+
+    for _ in range(2):
+        client.post(f"/api/recipes/{recipe_id}/cook", headers=headers)
+
+    assert history_rows(run, owner) == [(recipe_id, True)]
+
+
+def test_concurrent_cooks_of_a_recipe_not_in_history(client, headers, run):
+    owner = user_id(client, headers)
+    recipe_id = save_recipe(client, headers)
+    run(
+        lambda db: db.execute(
+            UserRecipeHistory.__table__.delete().where(
+                UserRecipeHistory.user_id == owner
+            )
+        )
+    )
+
+    async def cook():
+        async with SessionLocal() as db:
+            await mark_recipe_cooked(db, owner, recipe_id)
+            await db.commit()
+
+    async def cook_concurrently():
+        await asyncio.gather(cook(), cook(), cook())
+
+    client.portal.call(cook_concurrently)
+
+    assert history_rows(run, owner) == [(recipe_id, True)]
+
+
+def test_history_rejects_duplicate_entries(client, headers, run):
+    owner = user_id(client, headers)
+    recipe_id = save_recipe(client, headers)
+
+    with pytest.raises(IntegrityError):
+        run(
+            lambda db: db.execute(
+                insert(UserRecipeHistory).values(user_id=owner, recipe_id=recipe_id)
+            )
+        )
+
+
+def test_history_keeps_the_newest_entries(client, headers, run):
+    owner = user_id(client, headers)
+    ids = [save_recipe(client, headers, recipe_name=f"Dish {i}") for i in range(3)]
+
+    # Saving the oldest again moves it to the front instead of adding an entry
+    save_recipe(client, headers, recipe_name="Dish 0")
+    newest = save_recipe(client, headers, recipe_name="Dish 3")
+
+    history = client.get("/api/recipes/history", headers=headers).json()
+    assert [recipe["recipe_id"] for recipe in history] == [newest, ids[0], ids[2]]
+    assert len(history_rows(run, owner)) == recipes.MAX_RECIPES_PER_USER
+
+
+def test_saving_a_cooked_recipe_again_keeps_it_cooked(
+    client, headers, run, monkeypatch
+):
+    owner = user_id(client, headers)
+    recipe_id = save_recipe(client, headers)
+    client.post(f"/api/recipes/{recipe_id}/cook", headers=headers)
+
+    assert save_recipe(client, headers) == recipe_id
+    assert history_rows(run, owner) == [(recipe_id, True)]
+
+    requests = []
+
+    async def generate_recipes(**inputs):
+        requests.append(inputs)
+        return await generate(**inputs)
+
+    generate = recipes.generate_recipes
+    monkeypatch.setattr(recipes, "generate_recipes", generate_recipes)
+    client.post("/api/recipes/suggest", json={"mode": "gemini"}, headers=headers)
+
+    assert requests[0]["previous_recipes"] == ["Egg Fried Rice"]
+
+
+def test_saving_a_recipe_statement_budget(client, headers):
+    client.get("/api/users/me", headers=headers)
+    with count_statements() as new:
+        recipe_id = save_recipe(client, headers)
+    client.post(f"/api/recipes/{recipe_id}/cook", headers=headers)
+    with count_statements() as known:
+        save_recipe(client, headers)
+
+    history_writes = [
+        statement
+        for statement in known
+        if "user_recipe_history" in statement.split("WHERE")[0]
+    ]
+    # One DELETE ... RETURNING and one INSERT, the cooked flag included
+    assert len(history_writes) == 2
+    # Lookup, recipe, ingredients, history and the detail response
+    assert len(new) == 7
+    assert len(known) == 5
+
+
+def stock_pantry(client, headers, items=("Rice", "Egg", "Soy Sauce")):
+    client.post(
+        "/api/inventory/update-multiple", json={"items": list(items)}, headers=headers
+    )
+
+
+def test_suggestions_ask_gemini_by_default(client, headers, stub):
+    save_recipe(client, headers)
+    stock_pantry(client, headers)
+
+    response = client.post("/api/recipes/suggest", json={}, headers=headers)
+
+    assert len(response.json()) == 3
+    assert stub.models.calls == 1
+
+
+@pytest.mark.parametrize("mode", ["auto", "local"])
+def test_suggestions_from_stored_recipes(client, headers, stub, mode):
+    save_recipe(client, headers)
+    stock_pantry(client, headers)
+    served = metrics.get("recipe_index.served")
+
+    response = client.post("/api/recipes/suggest", json={"mode": mode}, headers=headers)
+
+    assert [r["recipe_name"] for r in response.json()] == ["Egg Fried Rice"]
+    assert response.json()[0]["approx_time"] == "20 minutes"
+    assert stub.models.calls == 0
+    assert metrics.get("recipe_index.served") == served + 1
+
+
+def test_local_suggestions_without_a_match(client, headers, stub):
+    save_recipe(client, headers)
+    stock_pantry(client, headers, ["Milk"])
+    served = metrics.get("recipe_index.served")
+
+    response = client.post(
+        "/api/recipes/suggest", json={"mode": "local"}, headers=headers
+    )
+
+    assert response.json() == []
+    assert stub.models.calls == 0
+    assert metrics.get("recipe_index.served") == served
+
+
+def test_stored_recipe_without_a_time(client, headers, run):
+    recipe_id = save_recipe(client, headers)
+    run(
+        lambda db: db.execute(
+            update(Recipe)
+            .where(Recipe.recipe_id == recipe_id)
+            .values(total_time_minutes=None)
+        )
+    )
+    stock_pantry(client, headers)
+
+    response = client.post(
+        "/api/recipes/suggest", json={"mode": "local"}, headers=headers
+    )
+
+    assert response.json()[0]["approx_time"] == ""
@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.utils import gemini
+from app.utils.metrics import metrics
+from app.utils.resilience import (
+    CLOSED,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+    Resilience,
+    is_retryable,
+)
+from tests.conftest import register
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(
+        "test.circuit",
+        window_seconds=60,
+        min_calls=3,
+        error_rate=0.5,
+        open_seconds=0.05,
+    )
+
+
+@pytest.fixture
+def resilience(breaker, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", False)
+    return Resilience("test.resilience", breaker)
+
+
+def upstream_calls(*outcomes, latency: float = 0.0):
+    """An attempt whose upstream calls return or raise outcomes in turn"""
+    outcomes = list(outcomes)
+
+    async def call():
+        await asyncio.sleep(latency)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def attempt(upstream):
+        return await upstream(call)
+
+    return attempt
+
+
+@pytest.mark.anyio
+async def test_breaker_opens_then_closes_after_a_successful_trial(breaker):
+    for _ in range(3):
+        breaker.allow()
+        breaker.record(False)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    await asyncio.sleep(0.06)
+    # Checking doesn't use up the trial call
+    breaker.check()
+    breaker.allow()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.record(True)
+
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.anyio
+async def test_failed_attempts_are_retried(resilience):
+    attempt = upstream_calls(RuntimeError("503"), RuntimeError("503"), "answer")
+
+    assert await resilience.call("test", attempt) == "answer"
+
+
+@pytest.mark.anyio
+async def test_client_errors_are_not_retried(resilience):
+    error = RuntimeError("Bad request")
+    error.code = 400
+    attempt = upstream_calls(error, "answer")
+
+    with pytest.raises(RuntimeError):
+        await resilience.call("test", attempt)
+
+
+@pytest.mark.anyio
+async def test_hedge_wins_over_a_slow_upstream_call(resilience, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 1)
+    resilience._latencies["test"].add(0.01)
+    latencies = [1.0, 0.0]
+
+    async def attempt(upstream):
+        latency = latencies.pop(0)
+
+        async def call():
+            await asyncio.sleep(latency)
+            return latency
+
+        return await upstream(call)
+
+    wins = metrics.get("test.resilience.hedge_wins")
+
+    assert await resilience.call("test", attempt) == 0.0
+    assert metrics.get("test.resilience.hedge_wins") == wins + 1
+
+
+@pytest.mark.anyio
+async def test_hedge_delay_counts_from_the_upstream_call(resilience, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 1)
+    resilience._latencies["test"].add(0.02)
+    attempts = 0
+
+    async def attempt(upstream):
+        nonlocal attempts
+        attempts += 1
+        # Queued locally for far longer than the p95 latency
+        await asyncio.sleep(0.1)
+        return await upstream(lambda: asyncio.sleep(0, "answer"))
+
+    assert await resilience.call("test", attempt) == "answer"
+    assert attempts == 1
+
+
+@pytest.mark.anyio
+async def test_local_wait_is_not_an_upstream_failure(resilience, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_TIMEOUT_SECONDS", 0.02)
+    slot = asyncio.Semaphore(1)
+
+    async def attempt(upstream):
+        async with slot:
+            return await upstream(lambda: asyncio.sleep(0, "answer"))
+
+    async with slot:
+        calls = [asyncio.ensure_future(resilience.call("test", attempt))]
+        await asyncio.sleep(0.1)
+
+    assert await calls[0] == "answer"
+    assert resilience.breaker.stats() == {"state": CLOSED, "calls": 1, "failures": 0}
+
+
+@pytest.mark.anyio
+async def test_queued_gemini_calls_do_not_trip_the_breaker(client, stub, monkeypatch):
+    # One slot, and calls that take longer than the upstream timeout to get it
+    monkeypatch.setattr(gemini, "_upstream_semaphore", asyncio.Semaphore(1))
+    monkeypatch.setattr(settings, "GEMINI_TIMEOUT_SECONDS", 0.15)
+    monkeypatch.setattr(settings, "LLM_RETRY_ATTEMPTS", 1)
+    stub.models.latency = 0.1
+    timeouts = metrics.get("llm.resilience.timeouts")
+
+    results = await asyncio.gather(
+        *(
+            gemini.generate_recipes([f"Item {i}", "Rice"], "Vegetarian", "Indian")
+            for i in range(4)
+        )
+    )
+
+    assert [result.status for result in results] == [200] * 4
+    assert metrics.get("llm.resilience.timeouts") == timeouts
+    assert gemini.resilience.breaker.stats()["failures"] == 0
+
+
+def test_open_circuit_answers_503_with_retry_after(client):
+    headers = register(client)
+    breaker = gemini.resilience.breaker
+    for _ in range(breaker.min_calls):
+        breaker.record(False)
+
+    response = client.post(
+        "/api/recipes/suggest", json={"mode": "gemini"}, headers=headers
+    )
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) == int(breaker.open_seconds)
+    assert not is_retryable(CircuitOpen(1.0))
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas.inventory import ExtractedItems
+from app.schemas.recipe import GeneratedRecipe, RecipeGenerationResult
+from app.utils import gemini
+from app.utils.cache import MemoryBackend, RecipeCache
+from app.utils.metrics import metrics
+from app.utils.prompts import IMAGE_PROMPT, RECIPE_PROMPT
+from app.utils.streaming import RecipeStreamParser
+
+RECIPE = {
+    "status": 200,
+    "recipe_name": "Egg Fried Rice",
+    "description": "Quick fried rice",
+    "ingredients": ["Rice", "Egg"],
+    "approx_time": "20 minutes",
+    "steps": ["Fry the egg", "Add the rice"],
+}
+
+
+def test_generation_result_validation():
+    result = RecipeGenerationResult.model_validate_json(
+        json.dumps({"status": 200, "recipes": [RECIPE]})
+    )
+
+    assert isinstance(result.recipes[0], GeneratedRecipe)
+    assert result.recipes[0].ingredients == ["Rice", "Egg"]
+
+    incomplete = {key: value for key, value in RECIPE.items() if key != "steps"}
+    with pytest.raises(ValidationError):
+        RecipeGenerationResult.model_validate_json(
+            json.dumps({"status": 200, "recipes": [incomplete]})
+        )
+
+
+def test_prompts_request_the_response_schemas():
+    for prompt, schema in (
+        (RECIPE_PROMPT, RecipeGenerationResult),
+        (IMAGE_PROMPT, ExtractedItems),
+    ):
+        for config in (prompt.config, prompt.compact_config):
+            assert config.response_mime_type == "application/json"
+            assert config.response_schema is schema
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "text", ["not json", '{"status": 200, "recipes": [{"status": 200}]}']
+)
+async def test_invalid_recipe_responses_are_counted(client, stub, monkeypatch, text):
+    monkeypatch.setattr(stub.models, "_recipes", lambda payload: text)
+    failures = metrics.get("llm.generate_recipes.parse_failures")
+
+    result = await gemini.generate_recipes(["Rice"], "Vegetarian", "Indian")
+
+    assert result == RecipeGenerationResult(status=400, recipes=[])
+    assert metrics.get("llm.generate_recipes.parse_failures") == failures + 1
+
+
+@pytest.mark.anyio
+async def test_invalid_item_responses_are_counted(client, stub, monkeypatch):
+    monkeypatch.setattr(stub.models, "_answer", lambda contents: '{"items": 3}')
+    failures = metrics.get("llm.extract_items.parse_failures")
+
+    result = await gemini.extract_items_from_image(b"image")
+
+    assert result == ExtractedItems(status="404", items=[])
+    assert metrics.get("llm.extract_items.parse_failures") == failures + 1
+
+
+def test_stream_parser_validates_each_recipe():
+    broken = {**RECIPE, "ingredients": "Rice and egg"}
+    text = json.dumps({"status": 200, "recipes": [RECIPE, broken, RECIPE]})
+    parser = RecipeStreamParser(GeneratedRecipe)
+
+    recipes = [
+        recipe
+        for start in range(0, len(text), 7)
+        for recipe in parser.feed(text[start : start + 7])
+    ]
+
+    assert len(recipes) == 2
+    assert all(isinstance(recipe, GeneratedRecipe) for recipe in recipes)
+    assert parser.failures == 1
+
+
+@pytest.mark.anyio
+async def test_stream_counts_invalid_recipes(client, stub, monkeypatch):
+    broken = {**RECIPE, "steps": None}
+    text = json.dumps({"status": 200, "recipes": [RECIPE, broken]})
+    monkeypatch.setattr(stub.models, "_recipes", lambda payload: text)
+    failures = metrics.get("llm.stream_recipes.parse_failures")
+
+    recipes = [
+        recipe
+        async for recipe in gemini.stream_recipes(["Rice"], "Vegetarian", "Indian")
+    ]
+
+    assert [recipe.recipe_name for recipe in recipes] == ["Egg Fried Rice"]
+    assert metrics.get("llm.stream_recipes.parse_failures") == failures + 1
+
+
+@pytest.mark.anyio
+async def test_cache_returns_typed_results():
+    cache = RecipeCache(MemoryBackend(max_entries=10, ttl=60))
+    result = RecipeGenerationResult(status=200, recipes=[GeneratedRecipe(**RECIPE)])
+
+    await cache.set("key", result)
+    cached = await cache.get("key")
+
+    assert isinstance(cached, RecipeGenerationResult)
+    assert cached == result
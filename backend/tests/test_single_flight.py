@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from app.utils import gemini
+from app.utils.single_flight import SingleFlight
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight("test")
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert calls == 1
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.anyio
+async def test_different_keys_and_later_calls_run_separately():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    assert await asyncio.gather(
+        flights.do("a", lambda: work("a")), flights.do("b", lambda: work("b"))
+    ) == ["a", "b"]
+    assert await flights.do("a", lambda: work("a")) == "a"
+    assert calls == ["a", "b", "a"]
+
+
+@pytest.mark.anyio
+async def test_every_caller_gets_the_exception():
+    flights = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream broke")
+
+    results = await asyncio.gather(
+        flights.do("key", fail), flights.do("key", fail), return_exceptions=True
+    )
+
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.anyio
+async def test_a_cancelled_caller_does_not_cancel_the_others():
+    flights = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.create_task(flights.do("key", work))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(flights.do("key", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.anyio
+async def test_identical_recipe_requests_make_one_upstream_call(client, stub):
+    stub.models.latency = 0.1
+
+    results = await asyncio.gather(
+        *(
+            gemini.generate_recipes(["Rice", "Egg"], "Vegetarian", "Indian")
+            for _ in range(3)
+        )
+    )
+
+    assert [len(result.recipes) for result in results] == [3] * 3
+    assert stub.models.calls == 1
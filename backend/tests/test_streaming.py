@@ -0,0 +1,62 @@
+import json
+
+from app.utils.streaming import RecipeStreamParser
+
+RESPONSE = json.dumps(
+    {
+        "status": 200,
+        "recipes": [
+            {"recipe_name": "Curly {braces} and [brackets]", "steps": ['Say "hi"']},
+            {"recipe_name": "Second", "steps": ["Nested", {"not": "a recipe"}]},
+        ],
+    }
+)
+
+
+def test_recipes_are_returned_as_soon_as_they_close():
+    parser = RecipeStreamParser()
+    first_end = RESPONSE.index("}, {") + 1
+
+    assert parser.feed(RESPONSE[: first_end - 1]) == []
+    assert parser.feed(RESPONSE[first_end - 1 : first_end]) == [
+        {"recipe_name": "Curly {braces} and [brackets]", "steps": ['Say "hi"']}
+    ]
+    assert parser.feed(RESPONSE[first_end:]) == [
+        {"recipe_name": "Second", "steps": ["Nested", {"not": "a recipe"}]}
+    ]
+    assert parser.text == RESPONSE
+
+
+def test_any_chunking_gives_the_same_recipes():
+    expected = json.loads(RESPONSE)["recipes"]
+    for size in (1, 3, 7, len(RESPONSE)):
+        parser = RecipeStreamParser()
+        recipes = []
+        for start in range(0, len(RESPONSE), size):
+            recipes += parser.feed(RESPONSE[start : start + size])
+        assert recipes == expected
+
+
+def _events(body: str):
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        yield event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def test_suggestions_stream_as_server_sent_events(client, headers):
+    client.post(
+        "/api/inventory/update-multiple",
+        json={"items": ["Rice", "Egg", "Peas"]},
+        headers=headers,
+    )
+
+    response = client.post(
+        "/api/recipes/suggest/stream", json={"mode": "gemini"}, headers=headers
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = list(_events(response.text))
+    assert [name for name, _ in events] == ["recipe"] * 3 + ["done"]
+    assert events[0][1]["recipe_name"].startswith("Indian")
+    assert events[-1][1] == {"count": 3}
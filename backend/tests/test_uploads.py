@@ -0,0 +1,204 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from app.config import settings
+from app.utils.storage import collect_uploads, content_path, thumbnail_path
+from tests.conftest import make_image, upload_image, wait_for_job
+
+BOUNDARY = "test-boundary"
+
+
+def multipart_body(data: bytes, content_type: str = "image/jpeg") -> bytes:
+    return (
+        (
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="file"; filename="fridge.jpg"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        + data
+        + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+def stored_files() -> list:
+    """Every file under UPLOAD_DIR, relative to it"""
+    files = []
+    for root, _, names in os.walk(settings.UPLOAD_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append(os.path.relpath(path, settings.UPLOAD_DIR))
+    return sorted(files)
+
+
+def test_upload_is_stored_under_its_content_hash(client, headers):
+    data = make_image()
+
+    response = upload_image(client, headers, data)
+
+    assert response.status_code == 202
+    with open(content_path(hashlib.sha256(data).hexdigest(), "image/jpeg"), "rb") as f:
+        assert f.read() == data
+
+
+def test_identical_uploads_are_stored_once(client, headers):
+    data = make_image()
+
+    for _ in range(2):
+        response = upload_image(client, headers, data)
+        assert response.status_code == 202
+        wait_for_job(client, headers, response.headers["Location"])
+
+    assert len([f for f in stored_files() if not f.startswith("thumbs")]) == 1
+
+
+def test_declared_oversize_upload_is_rejected_before_reading(
+    client, headers, monkeypatch
+):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 1024)
+
+    response = client.post(
+        "/api/inventory/upload-image",
+        content=multipart_body(b"x" * (100 * 1024)),
+        headers={
+            **headers,
+            "Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+        },
+    )
+
+    assert response.status_code == 400
+    assert "exceeds" in response.json()["detail"]
+    assert stored_files() == []
+
+
+def test_chunked_oversize_upload_is_rejected_while_streaming(
+    client, headers, monkeypatch
+):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 1024)
+    body = multipart_body(b"x" * 8192)
+
+    def chunks():
+        # A generator body is sent without a Content-Length
+        for start in range(0, len(body), 512):
+            yield body[start : start + 512]
+
+    response = client.post(
+        "/api/inventory/upload-image",
+        content=chunks(),
+        headers={
+            **headers,
+            "Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+        },
+    )
+
+    assert response.status_code == 400
+    assert "exceeds" in response.json()["detail"]
+    # The partial file is discarded
+    assert stored_files() == []
+
+
+def test_non_image_upload_is_rejected(client, headers):
+    response = upload_image(
+        client, headers, b"%PDF-1.4", content_type="application/pdf"
+    )
+
+    assert response.status_code == 400
+    assert stored_files() == []
+
+
+def test_upload_without_a_file_is_rejected(client, headers):
+    response = client.post(
+        "/api/inventory/upload-image", data={"note": "no file"}, headers=headers
+    )
+
+    assert response.status_code == 400
+
+
+def test_uploads_are_served_as_immutable(client, headers):
+    response = upload_image(client, headers, make_image())
+    job = wait_for_job(client, headers, response.headers["Location"])
+
+    thumbnail = client.get(job["result"]["thumbnail_url"])
+
+    assert thumbnail.status_code == 200
+    assert "immutable" in thumbnail.headers["cache-control"]
+
+    original = client.get(f"/uploads/{stored_files()[0]}")
+    assert original.status_code == 200
+    assert "immutable" in original.headers["cache-control"]
+
+
+def test_only_content_addressed_uploads_are_immutable(client):
+    for name in ("fridge.jpg", os.path.join(".incoming", "tmp1234")):
+        path = os.path.join(settings.UPLOAD_DIR, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x")
+
+    # Saved before uploads were content-addressed
+    legacy = client.get("/uploads/fridge.jpg")
+    assert legacy.status_code == 200
+    assert "immutable" not in legacy.headers.get("cache-control", "")
+
+    assert client.get("/uploads/.incoming/tmp1234").status_code == 404
+
+
+def store(digest: str, size: int = 100, age_days: float = 0) -> str:
+    """Write an original and its thumbnail, both last used age_days ago"""
+    path = content_path(digest, "image/jpeg")
+    mtime = time.time() - age_days * 24 * 60 * 60
+    for file_path in (path, thumbnail_path(path)):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(b"x" * size)
+        os.utime(file_path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "UPLOAD_RETENTION_DAYS", 30)
+    return tmp_path
+
+
+def test_gc_deletes_old_originals_with_their_thumbnails(upload_dir):
+    old = store("aa" * 32, age_days=31)
+    recent = store("bb" * 32, age_days=1)
+    running = store("cc" * 32, age_days=31)
+
+    deleted = collect_uploads([], in_use={running})
+
+    assert deleted == {"files": 2, "bytes": 200}
+    assert not os.path.exists(old)
+    assert not os.path.exists(thumbnail_path(old))
+    for kept in (recent, running):
+        assert os.path.exists(kept)
+        assert os.path.exists(thumbnail_path(kept))
+
+
+def test_gc_applies_each_users_quota(upload_dir, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_USER_QUOTA_BYTES", 250)
+    newest, middle, oldest = (store(c * 64) for c in "abc")
+
+    collect_uploads([("u1", newest), ("u1", middle), ("u1", oldest)], in_use=set())
+
+    assert os.path.exists(newest) and os.path.exists(middle)
+    assert not os.path.exists(oldest)
+    assert not os.path.exists(thumbnail_path(oldest))
+
+
+def test_gc_sweeps_old_orphan_thumbnails(upload_dir):
+    orphan = store("aa" * 32, age_days=2)
+    fresh = store("bb" * 32)
+    for path in (orphan, fresh):
+        os.unlink(path)
+
+    deleted = collect_uploads([], in_use=set())
+
+    assert deleted["files"] == 1
+    assert not os.path.exists(thumbnail_path(orphan))
+    # Its original may have been stored while the collector ran
+    assert os.path.exists(thumbnail_path(fresh))
@@ -0,0 +1,153 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.db import database
+from app.db.models import Cuisine
+from app.main import app
+from app.utils import reference_data as reference_data_module
+from app.utils.metrics import metrics
+from app.utils.reference_data import reference_data
+from tests.conftest import PASSWORD
+
+
+def test_profile_is_cached_between_requests(client, headers):
+    hits = metrics.get("user_cache.hits")
+    misses = metrics.get("user_cache.misses")
+
+    for _ in range(3):
+        assert client.get("/api/users/me", headers=headers).status_code == 200
+
+    # Registration doesn't warm the cache, so only the first request loads
+    assert metrics.get("user_cache.misses") == misses + 1
+    assert metrics.get("user_cache.hits") == hits + 2
+
+
+def test_updating_preferences_invalidates_the_cached_profile(client, headers):
+    client.get("/api/users/me", headers=headers)
+
+    response = client.put(
+        "/api/users/preferences",
+        json={"dietary_preference_id": 2, "cuisine_preference_id": 2},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    profile = client.get("/api/users/me", headers=headers).json()
+    assert [p["name"] for p in profile["dietary_preferences"]] == ["Non-vegetarian"]
+    assert [c["name"] for c in profile["preferred_cuisines"]] == ["Italian"]
+
+
+def test_invalid_token_is_rejected(client):
+    response = client.get(
+        "/api/users/me", headers={"Authorization": "Bearer not-a-token"}
+    )
+
+    assert response.status_code == 401
+
+
+def test_preferences_are_served_with_an_etag(client):
+    response = client.get("/api/users/preferences")
+
+    assert response.status_code == 200
+    assert [p["name"] for p in response.json()["dietary_preferences"]] == [
+        "Vegetarian",
+        "Non-vegetarian",
+    ]
+    assert response.headers["etag"]
+    assert "max-age" in response.headers["cache-control"]
+
+
+def test_preferences_not_modified(client):
+    etag = client.get("/api/users/preferences").headers["etag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get(
+            "/api/users/preferences", headers={"If-None-Match": if_none_match}
+        )
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    response = client.get("/api/users/preferences", headers={"If-None-Match": '"x"'})
+    assert response.status_code == 200
+
+
+def test_preferences_are_read_from_the_database_once(client):
+    loads = metrics.get("reference_data.loads")
+
+    for _ in range(3):
+        client.get("/api/users/preferences")
+
+    assert metrics.get("reference_data.loads") == loads + 1
+
+
+def test_etag_changes_when_the_data_is_reloaded(client, run):
+    etag = client.get("/api/users/preferences").headers["etag"]
+
+    async def add_cuisine(db):
+        db.add(Cuisine(cuisine_id=3, name="Thai"))
+
+    run(add_cuisine)
+    assert client.get("/api/users/preferences").headers["etag"] == etag
+
+    reference_data.invalidate()
+    response = client.get("/api/users/preferences", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert "Thai" in [c["name"] for c in response.json()["cuisines"]]
+
+
+@pytest.mark.anyio
+async def test_cold_reference_data_loads_on_the_requests_connection(
+    client, monkeypatch
+):
+    # As many concurrent registers as the pool has connections
+    engine = create_async_engine(
+        database.database_url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=2,
+    )
+    sessions = async_sessionmaker(
+        bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+    monkeypatch.setattr(database, "SessionLocal", sessions)
+    monkeypatch.setattr(reference_data_module, "SessionLocal", sessions)
+    reference_data.invalidate()
+    loads = metrics.get("reference_data.loads")
+
+    async def register(number: int) -> int:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as http:
+            response = await http.post(
+                "/api/auth/register",
+                json={
+                    "email": f"cook{number}@example.com",
+                    "password": PASSWORD,
+                    "first_name": "Test",
+                    "last_name": "Cook",
+                    "dietary_preference_id": 1,
+                    "cuisine_preference_id": 1,
+                },
+            )
+            return response.status_code
+
+    try:
+        statuses = await asyncio.gather(
+            *(register(number) for number in range(2)), return_exceptions=True
+        )
+    finally:
+        await engine.dispose()
+
+    assert statuses == [200] * 2
+    assert metrics.get("reference_data.loads") == loads + 1
@@ -127,7 +127,35 @@ export const uploadInventoryImage = async (imageFile) => {
     throw new Error(errorData.detail || "Failed to process image");
   }
 
-  return response.json();
+  // The image is processed in the background; poll the job for the result
+  const job = await response.json();
+  return waitForImageJob(job.job_id);
+};
+
+const IMAGE_JOB_POLL_INTERVAL_MS = 1000;
+const IMAGE_JOB_TIMEOUT_MS = 3 * 60 * 1000;
+
+export const getImageJob = async (jobId) => {
+  return authFetch(`/inventory/jobs/${jobId}`);
+};
+
+const waitForImageJob = async (jobId) => {
+  const deadline = Date.now() + IMAGE_JOB_TIMEOUT_MS;
+
+  while (Date.now() < deadline) {
+    const job = await getImageJob(jobId);
+    if (job.status === "done") {
+      return job.result;
+    }
+    if (job.status === "failed") {
+      throw new Error(job.error || "Failed to process image");
+    }
+    await new Promise((resolve) =>
+      setTimeout(resolve, IMAGE_JOB_POLL_INTERVAL_MS)
+    );
+  }
+
+  throw new Error("Timed out waiting for the image to be processed");
 };
 
 export const updateMultipleItems = async (items) => {